@@ -1,57 +1,142 @@
-﻿import cv2
-import socket
+﻿import argparse
+import time
+import itertools
+import cv2
 import numpy as np
 from pupil_apriltags import Detector
+from pipeline import TrackingPipeline
+from calibration_bundle import load_calibration
+from publisher import Publisher, default_endpoints, parse_endpoint
+from frame_sources import open_source
+from visualization import Visualizer
+from metrics import Metrics, MetricsServer
+from session_recorder import SessionRecorder, tag_poses
+from adaptive_detector import AdaptiveDetectorTuner, TUNABLE, check_detector_settings, tune_detector
+from tiled_detection import TiledDetector, parse_tiles
+from track_plane import TrackPlane
 
 class AprilTagTracker:
-    def __init__(self):
-        # Initialize video capture
-        self.cap = cv2.VideoCapture(1, cv2.CAP_DSHOW)
-        self.cap.set(3, 640)  
-        self.cap.set(4, 480)  
+    def __init__(self, source=None, undistort_mode='frame', endpoints=None, binary_telemetry=True, metrics=None,
+                 adaptive_fps=None, tiles=None, tile_overlap=128, tile_workers=None, calibration=None, metric=False):
+        # Initialize video capture (or any frame source with read()/release(), see frame_sources)
+        if source is None:
+            source = cv2.VideoCapture(1, cv2.CAP_DSHOW)
+            source.set(3, 640)
+            source.set(4, 480)
+        self.cap = source
+        self.visualizer = None
+
+        # Per-stage latency histograms (see metrics.py)
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.metrics_server = None
+        self.recorder = None
         
-        # IP Address and Port Number UNITY
-        self.sock1 = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.server_address1 = ("127.0.0.1", 5053)
-         
-        # IP Address and Port Number ESP32
-        self.sock2 = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.server_address2 = ("192.168.1.1", 5054)
+        # Telemetry endpoints (Unity at full rate, ESP32 at 30 Hz by default)
+        self.publisher = Publisher(endpoints if endpoints is not None else default_endpoints(binary_telemetry), metric=metric)
         
-        # Camera matrix and distortion coefficients
-        self.camera_matrix = np.array([[644.76561694, 0, 331.26266442],
-                                       [0, 645.89528116, 215.92835909],
-                                       [0, 0, 1]])
-        self.dist_coeffs = np.array([0.06830215, -0.14315368, -0.01151178, 0.00780322, 0.03096726])
+        # Camera calibration bundle (--calibration, or ./calibration when it exists), else the
+        # built-in calibration of the original webcam, see calibration_bundle.py
+        self.calibration = load_calibration(calibration)
+        self.camera_matrix = self.calibration.camera_matrix
+        self.dist_coeffs = self.calibration.dist_coeffs
+        self.frame_size = None  # checked against the calibrated resolution on the first frame
+
+        # Precomputed undistortion maps (from the bundle, or built once per resolution)
+        # 'frame': remap the gray frame before detection
+        # 'points': detect on the raw frame, undistort only tag centers and corners
+        # 'none': no correction
+        self.undistorter = self.calibration.undistorter()
+        self.undistort_mode = undistort_mode
+
+        # Optional track-plane output (metres, radians) through the bundle's homography
+        self.plane = TrackPlane.from_bundle(self.calibration, self.undistorter) if metric else None
 
         # Create AprilTag detector
-        self.detector = Detector(
+        self.detector_config = dict(
             families='tag36h11',
             nthreads=5,
-            quad_decimate=0.6,
+            quad_decimate=1.0,
             quad_sigma=0.5,
             refine_edges=1,
             decode_sharpening=0.0,
             debug=0
         )
+        self.detector = Detector(**self.detector_config)
+
+        # Optional tiled detection of high-resolution frames on a process pool
+        self.tiled_detector = TiledDetector(self.detector_config, tiles, tile_overlap, tile_workers) if tiles else None
+
+        # Optional frame budget controller for the detector settings
+        self.tuner = AdaptiveDetectorTuner(self, adaptive_fps) if adaptive_fps else None
 
     def normalize_angle(self, angle):
         return angle % 360
 
-    def process_frame(self):
-        success, img = self.cap.read()
-        if not success:
-            return False
+    def configure_detector(self, **changes):
+        """
+        Change detector settings: in place when possible, otherwise rebuild the detector.
+        Settings are checked first and only kept once the detector accepted them.
+        """
+        changes = check_detector_settings(changes)
+        config = dict(self.detector_config, **changes)
+        if all(key in TUNABLE for key in changes):
+            tune_detector(self.detector, **changes)
+        else:
+            self.detector = Detector(**config)
+        self.detector_config = config
+        if self.tiled_detector is not None:
+            self.tiled_detector.configure(self.detector_config)
 
-        # Undistort the image
-        img = cv2.undistort(img, self.camera_matrix, self.dist_coeffs)
+    def read_frame(self):
+        with self.metrics.time('capture'):
+            success, img = self.cap.read()
+        if success and self.frame_size is None:
+            self.frame_size = self.undistorter.check_size(img.shape[1::-1])
+        return img if success else None
 
-        img_height, img_width = img.shape[:2]
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    def detect(self, img):
+        if self.undistort_mode == 'frame':
+            # Undistort only the gray channel the detector uses
+            with self.metrics.time('undistort'):
+                gray = self.undistorter.undistort_gray(img)
+            with self.metrics.time('detect'):
+                results = self.detect_tags(gray)
+        else:
+            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+            with self.metrics.time('detect'):
+                results = self.detect_tags(gray)
+            if self.undistort_mode == 'points':
+                with self.metrics.time('undistort'):
+                    self.undistorter.undistort_detections(results)
 
-        results = self.detector.detect(gray)
+        if self.tuner is not None:
+            self.tuner.update()
+        return img, results
 
-        for r in results:
+    def detect_tags(self, gray):
+        if self.tiled_detector is not None:
+            return self.tiled_detector.detect(gray)
+        return self.detector.detect(gray)
+
+    def publish(self, img_shape, results, timestamp=None):
+        with self.metrics.time('publish'):
+            self._publish(img_shape, results, timestamp)
+
+    def _publish(self, img_shape, results, timestamp):
+        img_height, img_width = img_shape[:2]
+
+        if self.plane is not None:
+            # Every tag of the frame to the track plane at once, heading along the top edge
+            centers = np.array([r.center for r in results]).reshape(-1, 2)
+            edges = np.array([r.corners[1] - r.corners[0] for r in results]).reshape(-1, 2)
+            poses = self.plane.poses(centers, np.degrees(np.arctan2(edges[:, 1], edges[:, 0])),
+                                     raw=self.undistort_mode == 'none')
+            self.publisher.publish([r.tag_id for r in results], poses, timestamp)
+            return
+
+        tag_ids = []
+        poses = np.empty((len(results), 3))
+        for i, r in enumerate(results):
             tag_id = r.tag_id
             center = r.center
             corners = r.corners.astype(int)
@@ -65,38 +150,177 @@ class AprilTagTracker:
 
             cX, cY = int(center[0]), int(center[1])
 
-            # Data sent to UNITY
-            data = f"{tag_id},{cX},{img_height-cY},{int(angle_degrees)}"
-            self.sock1.sendto(data.encode(), self.server_address1)
-            
-            # Data sent to ESP32
-            self.sock2.sendto(data.encode(), self.server_address2)
+            tag_ids.append(tag_id)
+            poses[i] = (cX, img_height - cY, int(angle_degrees))
+
+        self.publisher.publish(tag_ids, poses, timestamp)
             
+    def draw(self, img, results):
+        # Detections are in undistorted coordinates, so undistort the colour frame for display
+        if self.undistort_mode != 'none':
+            img = self.undistorter.undistort(img)
+        else:
+            img = img.copy()  # the frame may be a read-only view (shared memory source)
+
+        for r in results:
+            corners = r.corners.astype(int)
+            cX, cY = int(r.center[0]), int(r.center[1])
+
             # Draw tag outline
             cv2.polylines(img, [corners.reshape((-1, 1, 2))], True, (255, 0, 0), 2)
 
             # Display tag ID
-            cv2.putText(img, f"{tag_id}", (cX - 15, cY - 15), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
-        
-        cv2.imshow("AprilTag Detection", img)
+            cv2.putText(img, f"{r.tag_id}", (cX - 15, cY - 15), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
+
+        return img
+
+    def process_frame(self):
+        img = self.read_frame()
+        if img is None:
+            return False
+        timestamp = time.time()
+
+        img, results = self.detect(img)
+        self.publish(img.shape, results, timestamp)
+        if self.recorder is not None:
+            self.recorder.record(img, timestamp, (*tag_poses(results), None))
+
+        # Drawing and display happen on the display thread
+        if self.visualizer is not None:
+            self.visualizer.submit(img, results)
+        self.metrics.tick()
         return True
 
-    def run(self):
-        while True:
-            if not self.process_frame():
-                break
-                
-            if cv2.waitKey(1) & 0xFF == ord('q'):
-                break
+    def start_display(self, headless=False, display_fps=15):
+        # Headless: no drawing at all. Otherwise draw on a separate thread at a reduced rate
+        self.visualizer = None if headless else Visualizer(self.draw, "AprilTag Detection", display_fps,
+                                                           self.metrics).start()
+
+    def start_metrics(self, port=0, log_interval=0):
+        # JSON log line every log_interval seconds and/or a local HTTP endpoint
+        self.metrics.log_interval = log_interval
+        if port:
+            self.metrics_server = MetricsServer(self.metrics, port).start()
+
+    def start_recording(self, path, compress=False):
+        # Frames and tracker output go to a session folder from a background thread
+        self.recorder = SessionRecorder(path, compress=compress)
+
+    def quit_requested(self):
+        return self.visualizer is not None and self.visualizer.quit_requested
+
+    def run(self, headless=False, display_fps=15):
+        self.start_display(headless, display_fps)
+        try:
+            while not self.quit_requested():
+                if not self.process_frame():
+                    break
+        except KeyboardInterrupt:
+            pass
         
         self.cleanup()
+
+    # Pipeline stages: each one runs on its own thread
+    def _detect_stage(self, packet):
+        packet.img, packet.data['results'] = self.detect(packet.img)
+        return packet
+
+    def _publish_stage(self, packet):
+        self.publish(packet.img.shape, packet.data['results'], packet.timestamp)
+        if self.recorder is not None:
+            self.recorder.record(packet.img, packet.timestamp, (*tag_poses(packet.data['results']), None))
+        return packet
+
+    def run_pipelined(self, headless=False, display_fps=15, report_interval=2.0):
+        """Capture, detection and publishing on separate threads, optional display on its own thread."""
+        # Read the first frame here so a resolution mismatch fails before any thread starts
+        first = self.read_frame()
+        if first is None:
+            print("Frame source returned no frames")
+            self.cleanup()
+            return
+        frames = itertools.chain([first], (self.read_frame() for _ in itertools.count()))
+        pipeline = TrackingPipeline(lambda: next(frames, None), [
+            ('detect', self._detect_stage),
+            ('publish', self._publish_stage),
+        ], profile_point=self.metrics.profile_point)
+        self.start_display(headless, display_fps)
+        pipeline.start()
+        last_report = cv2.getTickCount()
+        try:
+            while pipeline.is_running() and not self.quit_requested():
+                packet = pipeline.output.get(timeout=0.1)
+                if packet is not None:
+                    if self.visualizer is not None:
+                        self.visualizer.submit(packet.img, packet.data['results'])
+                    self.metrics.tick()
+
+                if (cv2.getTickCount() - last_report) / cv2.getTickFrequency() > report_interval:
+                    print(pipeline.format_report())
+                    print(self.publisher.format_stats())
+                    last_report = cv2.getTickCount()
+        except KeyboardInterrupt:
+            pass
+
+        pipeline.stop()
+        print(pipeline.format_report())
+        print(self.publisher.format_stats())
+        self.cleanup()
+
      # Release resources and close sockets
     def cleanup(self):
         self.cap.release()
-        cv2.destroyAllWindows()
-        self.sock1.close()
-        self.sock2.close()
+        if self.visualizer is not None:
+            self.visualizer.stop()
+        if self.metrics_server is not None:
+            self.metrics_server.stop()
+        if self.recorder is not None:
+            self.recorder.close()
+            print(f"Session {self.recorder.path}: {self.recorder.format_stats()}")
+        if self.tiled_detector is not None:
+            print(self.tiled_detector.format_stats())
+            self.tiled_detector.close()
+        self.publisher.close()
 
 if __name__ == "__main__":
-    tracker = AprilTagTracker()
-    tracker.run()
+    parser = argparse.ArgumentParser(description="AprilTag detection")
+    parser.add_argument('--serial', action='store_true', help='Run capture, detection and publishing on one thread')
+    parser.add_argument('--undistort', choices=['frame', 'points', 'none'], default='frame',
+                        help='Undistort the whole frame, only the detected tag points, or nothing')
+    parser.add_argument('--csv', action='store_true', help='Send the legacy per-tag CSV datagrams instead of binary frames')
+    parser.add_argument('--endpoint', action='append', type=parse_endpoint,
+                        help='Telemetry endpoint name=host:port[@rate][/csv], repeat for several (default: Unity and ESP32)')
+    parser.add_argument('--source', help='Replay instead of the webcam: a video file, an image folder, synthetic[:n_tags] or camera[:index[:WxH]]')
+    parser.add_argument('--realtime', action='store_true', help='Replay --source at its native frame rate')
+    parser.add_argument('--calibration', metavar='DIR',
+                        help='Calibration bundle of the camera (default: ./calibration if present, else built-in)')
+    parser.add_argument('--metric', action='store_true',
+                        help='Publish track-plane metres and radians through the homography of the calibration bundle')
+    parser.add_argument('--headless', action='store_true', help='No display and no drawing at all')
+    parser.add_argument('--display-fps', type=float, default=15, help='Maximum refresh rate of the display window')
+    parser.add_argument('--adaptive', type=float, metavar='FPS',
+                        help='Tune the detector (threads, quad_decimate) to keep up with FPS')
+    parser.add_argument('--tiles', type=parse_tiles, metavar='CxR',
+                        help='Detect high-resolution frames as CxR overlapping tiles on a process pool, e.g. 2x2')
+    parser.add_argument('--tile-overlap', type=int, default=128,
+                        help='Pixels shared by neighbouring tiles, more than the largest tag')
+    parser.add_argument('--tile-workers', type=int, help='Detection processes (default: one per tile, up to the core count)')
+    parser.add_argument('--record', metavar='DIR', help='Record frames and tracker output of the session to DIR')
+    parser.add_argument('--record-compress', action='store_true', help='Store recorded frames as lossless PNG instead of raw')
+    parser.add_argument('--metrics-port', type=int, default=0,
+                        help='Serve /metrics and /profile on http://127.0.0.1:PORT (0 = off)')
+    parser.add_argument('--metrics-log', type=float, default=0,
+                        help='Print a JSON metrics line every N seconds (0 = off)')
+    args = parser.parse_args()
+    source = open_source(args.source, realtime=args.realtime) if args.source else None
+
+    tracker = AprilTagTracker(source=source, undistort_mode=args.undistort, endpoints=args.endpoint, binary_telemetry=not args.csv,
+                              adaptive_fps=args.adaptive, tiles=args.tiles, tile_overlap=args.tile_overlap,
+                              tile_workers=args.tile_workers, calibration=args.calibration, metric=args.metric)
+    tracker.start_metrics(args.metrics_port, args.metrics_log)
+    if args.record:
+        tracker.start_recording(args.record, args.record_compress)
+    if args.serial:
+        tracker.run(args.headless, args.display_fps)
+    else:
+        tracker.run_pipelined(args.headless, args.display_fps)
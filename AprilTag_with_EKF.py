@@ -1,67 +1,165 @@
-﻿import cv2
-import socket
+﻿import argparse
+import time
+import itertools
+import cv2
 import numpy as np
 from pupil_apriltags import Detector
-from EKF import ExtendedKalmanFilter
+from EKF import BatchExtendedKalmanFilter
+from pipeline import TrackingPipeline
+from calibration_bundle import load_calibration
+from publisher import Publisher, default_endpoints, parse_endpoint
+from frame_sources import open_source
+from visualization import Visualizer
+from roi_detection import RoiDetector
+from track_manager import TrackManager
+from metrics import Metrics, MetricsServer
+from session_recorder import SessionRecorder, tag_poses
+from adaptive_detector import AdaptiveDetectorTuner, TUNABLE, check_detector_settings, tune_detector
+from tiled_detection import TiledDetector, parse_tiles
+from track_plane import TrackPlane
 
 class AprilTagTracker:
-    def __init__(self):
-        # Initialize video capture
-        self.cap = cv2.VideoCapture(1, cv2.CAP_DSHOW)
-        self.cap.set(3, 640)  # Set frame width
-        self.cap.set(4, 480)  # Set frame height
+    def __init__(self, source=None, undistort_mode='points', endpoints=None, binary_telemetry=True, roi_tracking=False,
+                 full_frame_interval=10, motion_model='static', latency=0.0,
+                 max_coast_frames=5, metrics=None, adaptive_fps=None, tiles=None, tile_overlap=128, tile_workers=None,
+                 calibration=None, metric=False):
+        # Initialize video capture (or any frame source with read()/release(), see frame_sources)
+        if source is None:
+            source = cv2.VideoCapture(1, cv2.CAP_DSHOW)
+            source.set(3, 640)  # Set frame width
+            source.set(4, 480)  # Set frame height
+        self.cap = source
+        self.visualizer = None
+
+        # Per-stage latency histograms (see metrics.py)
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.metrics_server = None
+        self.recorder = None
         
-        # IP Address and Port Number UNITY
-        self.sock1 = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.server_address1 = ("127.0.0.1", 5053)
-         
-        # IP Address and Port Number ESP32
-        self.sock2 = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.server_address2 = ("192.168.1.1", 5054)
+        # Telemetry endpoints (Unity at full rate, ESP32 at 30 Hz by default)
+        self.publisher = Publisher(endpoints if endpoints is not None else default_endpoints(binary_telemetry), metric=metric)
         
-        # Camera matrix and distortion coefficients
-        self.camera_matrix = np.array([[644.76561694, 0, 331.26266442],
-                                       [0, 645.89528116, 215.92835909],
-                                       [0, 0, 1]])
-        self.dist_coeffs = np.array([0.06830215, -0.14315368, -0.01151178, 0.00780322, 0.03096726])
+        # Camera calibration bundle (--calibration, or ./calibration when it exists), else the
+        # built-in calibration of the original webcam, see calibration_bundle.py
+        self.calibration = load_calibration(calibration)
+        self.camera_matrix = self.calibration.camera_matrix
+        self.dist_coeffs = self.calibration.dist_coeffs
+        self.frame_size = None  # checked against the calibrated resolution on the first frame
+
+        # Undistortion: 'points' corrects only tag centers and corners (per-tag cost),
+        # 'frame' remaps the gray frame before detection (per-pixel cost), 'none' skips it
+        self.undistorter = self.calibration.undistorter()
+        self.undistort_mode = undistort_mode
+
+        # Optional track-plane output (metres, radians) through the bundle's homography
+        self.plane = TrackPlane.from_bundle(self.calibration, self.undistorter) if metric else None
         
-        # Initialize Kalman filter
-        self.kalman = ExtendedKalmanFilter(dt=1/70)
+        # Initialize Kalman filter (all tags filtered together each frame).
+        # 'cv' / 'bicycle' track velocities so poses can be extrapolated past the pipeline latency
+        self.kalman = BatchExtendedKalmanFilter(dt=1/70, model=None if motion_model == 'static' else motion_model)
+        self.latency = latency  # extra seconds to predict ahead after sending (radio, Unity, ESP32)
+        self.motion = None  # kalman.snapshot() of the last filtered frame, extrapolated at publish time
+
+        # Missed tags coast on the prediction for a few frames before their track is dropped
+        self.tracks = TrackManager(self.kalman, max_coast_frames)
         
         # Store previous tag positions and angles
         self.prev_positions = {}
         self.prev_angles = {}
 
         # Create AprilTag detector
-        self.detector = Detector(
+        self.detector_config = dict(
             families='tag36h11',
             nthreads=5,
-            quad_decimate=0.6,
+            quad_decimate=1.0,
             quad_sigma=0.5,
             refine_edges=1,
             decode_sharpening=0.0,
             debug=0
         )
+        self.detector = Detector(**self.detector_config)
+
+        # Optional tiled detection of high-resolution frames on a process pool
+        self.tiled_detector = TiledDetector(self.detector_config, tiles, tile_overlap, tile_workers) if tiles else None
+
+        # Optional ROI tracking: detect only around the EKF states of the tags seen last frame
+        self.roi_detector = RoiDetector(self.detector, full_frame_interval) if roi_tracking else None
+        self.predicted_centers = {}
+
+        # Optional frame budget controller for the detector settings
+        self.tuner = AdaptiveDetectorTuner(self, adaptive_fps) if adaptive_fps else None
 
     def normalize_angle(self, angle):
         return angle % 360
 
-    def process_frame(self):
-        success, img = self.cap.read()
-        if not success:
-            return False
+    def configure_detector(self, **changes):
+        """
+        Change detector settings: in place when possible, otherwise rebuild the detector.
+        Settings are checked first and only kept once the detector accepted them.
+        """
+        changes = check_detector_settings(changes)
+        config = dict(self.detector_config, **changes)
+        if all(key in TUNABLE for key in changes):
+            tune_detector(self.detector, **changes)
+        else:
+            self.detector = Detector(**config)
+        self.detector_config = config
+        if self.roi_detector is not None:
+            self.roi_detector.detector = self.detector
+        if self.tiled_detector is not None:
+            self.tiled_detector.configure(self.detector_config)
 
-        # Convert frame to grayscale
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    def reset_tracks(self, tag_ids=None):
+        """Forget the EKF state of the given tags (all when None), they restart from their next detection."""
+        for tag_id in list(self.tracks.tracks if tag_ids is None else tag_ids):
+            if tag_id in self.tracks.misses:
+                self.tracks.evict(tag_id)
+        self.predicted_centers = {}
+
+    def read_frame(self):
+        with self.metrics.time('capture'):
+            success, img = self.cap.read()
+        if success and self.frame_size is None:
+            self.frame_size = self.undistorter.check_size(img.shape[1::-1])
+        return img if success else None
+
+    def detect(self, img):
+        if self.undistort_mode == 'frame':
+            # Undistorted grayscale frame
+            with self.metrics.time('undistort'):
+                gray = self.undistorter.undistort_gray(img)
+        else:
+            # Convert frame to grayscale
+            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
         
         # Detect AprilTags
-        results = self.detector.detect(gray)
-        
+        with self.metrics.time('detect'):
+            if self.roi_detector is not None:
+                results = self.roi_detector.detect(gray, self.roi_predictions())
+            elif self.tiled_detector is not None:
+                results = self.tiled_detector.detect(gray)
+            else:
+                results = self.detector.detect(gray)
+        if self.undistort_mode == 'points':
+            with self.metrics.time('undistort'):
+                self.undistorter.undistort_detections(results)
+        if self.tuner is not None:
+            self.tuner.update()
+        return img, results
+
+    def filter(self, results, timestamp=None):
+        with self.metrics.time('filter'):
+            return self._filter(results, timestamp)
+
+    def _filter(self, results, timestamp):
         # Track detected tags
         current_tags = set([r.tag_id for r in results])
+        detected = len(results)
 
-        for r in results:
-            tag_id = r.tag_id
+        tag_ids = []
+        measurements = np.empty((len(results), 3))
+        for i, r in enumerate(results):
+            tag_ids.append(r.tag_id)
             center = r.center
             corners = r.corners.astype(int)
 
@@ -72,49 +170,244 @@ class AprilTagTracker:
             angle_degrees = self.normalize_angle(np.degrees(angle))
 
             cX, cY = int(center[0]), int(center[1])
+            measurements[i] = (cX, cY, angle_degrees)
 
-            # Apply Kalman filter to smooth position and orientation
-            measurement = np.array([cX, cY, angle_degrees])
-            filtered_state = self.kalman.predict_and_update(tag_id, np.array(measurement))
+        # Apply Kalman filter to smooth position and orientation of all tags at once,
+        # undetected tags coast on the prediction (flagged) until they are evicted
+        tag_ids, filtered_states, flags = self.tracks.update(tag_ids, measurements, timestamp)
+        # Copy of the full states: the publish stage extrapolates it while this thread moves on
+        self.motion = self.kalman.snapshot(tag_ids) if self.kalman.model is not None else None
+
+        self.prev_positions = {}
+        self.prev_angles = {}
+        for tag_id, filtered_state in zip(tag_ids, filtered_states):
             self.prev_positions[tag_id] = (filtered_state[0], filtered_state[1])
             self.prev_angles[tag_id] = filtered_state[2]
 
-            # Prepare and send data to UNITY and ESP32
-            img_height, img_width = img.shape[:2]
-            data = f"{tag_id},{img_width - int(filtered_state[0])},{img_height - int(filtered_state[1])},{int(filtered_state[2])}"
-            self.sock1.sendto(data.encode(), self.server_address1)
-            self.sock2.sendto(data.encode(), self.server_address2)
-            
+        # Filtered states of the detected tags, used to place the ROIs of the next frame
+        self.predicted_centers = {tag_id: tuple(filtered_states[i, :2]) for i, tag_id in enumerate(tag_ids[:detected])}
+
+        return tag_ids, filtered_states, flags
+
+    def roi_predictions(self):
+        """Predicted tag centers in the coordinates of the image the detector sees."""
+        predictions = self.predicted_centers
+        if self.undistort_mode != 'points' or not predictions:
+            return predictions
+        # The filter works in undistorted coordinates but detection runs on the raw frame
+        raw = self.undistorter.distort_points(list(predictions.values()))
+        return dict(zip(predictions.keys(), map(tuple, raw)))
+
+    def publish(self, img_shape, tag_ids, filtered_states, timestamp=None, flags=None, motion=None):
+        """motion: snapshot of the frame's filter states, default the last filtered frame (same thread)."""
+        with self.metrics.time('publish'):
+            self._publish(img_shape, tag_ids, filtered_states, timestamp, flags, self.motion if motion is None else motion)
+
+    def _publish(self, img_shape, tag_ids, filtered_states, timestamp, flags, motion):
+        img_height, img_width = img_shape[:2]
+
+        # Latency compensation: send where the cars are now, not where they were at capture
+        # (the frame keeps its capture timestamp). Works on the frame's own snapshot, never
+        # on the live filter, which the filter stage is updating at the same time
+        if motion is not None and tag_ids:
+            filtered_states = self.kalman.extrapolate(motion, tag_ids, time.time() + self.latency)
+
+        if self.plane is not None:
+            # The filter runs in pixels (raw ones with --undistort none), converted once per frame
+            poses = self.plane.poses(filtered_states[:, :2], filtered_states[:, 2], raw=self.undistort_mode == 'none')
+            self.publisher.publish(tag_ids, poses, timestamp, flags)
+            return
+
+        # Prepare and send data to UNITY and ESP32, image axes mirrored like before:
+        # x from the right, y from the bottom
+        self.publisher.publish(tag_ids, filtered_states, timestamp, flags, mirror=(img_width, img_height))
+
+    def draw(self, img, results):
+        # Detections are in undistorted coordinates, so undistort the colour frame for display
+        if self.undistort_mode != 'none':
+            img = self.undistorter.undistort(img)
+        else:
+            img = img.copy()  # the frame may be a read-only view (shared memory source)
+
+        for r in results:
             # Draw bounding box around detected tag
+            corners = r.corners.astype(int)
             cv2.polylines(img, [corners.reshape((-1, 1, 2))], True, (0, 255, 0), 2)
-        
-        # Remove undetected tags from tracking
-        for tag_id in list(self.prev_positions.keys()):
-            if tag_id not in current_tags:
-                del self.prev_positions[tag_id]
-                del self.prev_angles[tag_id]
-
-        # Display frame
-        cv2.imshow("AprilTag Detection", img)
+
+        return img
+
+    def process_frame(self):
+        img = self.read_frame()
+        if img is None:
+            return False
+        timestamp = time.time()
+
+        img, results = self.detect(img)
+        tag_ids, filtered_states, flags = self.filter(results, timestamp)
+        self.publish(img.shape, tag_ids, filtered_states, timestamp, flags)
+        if self.recorder is not None:
+            self.recorder.record(img, timestamp, (*tag_poses(results), None), (tag_ids, filtered_states, flags))
+
+        # Display frame (drawn on the display thread)
+        if self.visualizer is not None:
+            self.visualizer.submit(img, results)
+        self.metrics.tick()
         return True
 
-    def run(self):
-        while True:
-            if not self.process_frame():
-                break
-            
-            if cv2.waitKey(1) & 0xFF == ord('q'):
-                break
+    def start_display(self, headless=False, display_fps=15):
+        # Headless: no drawing at all. Otherwise draw on a separate thread at a reduced rate
+        self.visualizer = None if headless else Visualizer(self.draw, "AprilTag Detection", display_fps,
+                                                           self.metrics).start()
+
+    def start_metrics(self, port=0, log_interval=0):
+        # JSON log line every log_interval seconds and/or a local HTTP endpoint
+        self.metrics.log_interval = log_interval
+        if port:
+            self.metrics_server = MetricsServer(self.metrics, port).start()
+
+    def start_recording(self, path, compress=False):
+        # Frames and tracker output go to a session folder from a background thread
+        self.recorder = SessionRecorder(path, compress=compress)
+
+    def quit_requested(self):
+        return self.visualizer is not None and self.visualizer.quit_requested
+
+    def run(self, headless=False, display_fps=15):
+        self.start_display(headless, display_fps)
+        try:
+            while not self.quit_requested():
+                if not self.process_frame():
+                    break
+        except KeyboardInterrupt:
+            pass
         
         self.cleanup()
+    # Pipeline stages: each one runs on its own thread
+    def _detect_stage(self, packet):
+        packet.img, packet.data['results'] = self.detect(packet.img)
+        return packet
+
+    def _filter_stage(self, packet):
+        packet.data['tag_ids'], packet.data['states'], packet.data['flags'] = self.filter(packet.data['results'], packet.timestamp)
+        packet.data['motion'] = self.motion
+        return packet
+
+    def _publish_stage(self, packet):
+        self.publish(packet.img.shape, packet.data['tag_ids'], packet.data['states'], packet.timestamp,
+                     packet.data['flags'], packet.data['motion'])
+        if self.recorder is not None:
+            self.recorder.record(packet.img, packet.timestamp, (*tag_poses(packet.data['results']), None),
+                                 (packet.data['tag_ids'], packet.data['states'], packet.data['flags']))
+        return packet
+
+    def run_pipelined(self, headless=False, display_fps=15, report_interval=2.0):
+        """Capture, detection, filtering and publishing on separate threads, optional display on its own thread."""
+        # Read the first frame here so a resolution mismatch fails before any thread starts
+        first = self.read_frame()
+        if first is None:
+            print("Frame source returned no frames")
+            self.cleanup()
+            return
+        frames = itertools.chain([first], (self.read_frame() for _ in itertools.count()))
+        pipeline = TrackingPipeline(lambda: next(frames, None), [
+            ('detect', self._detect_stage),
+            ('filter', self._filter_stage),
+            ('publish', self._publish_stage),
+        ], profile_point=self.metrics.profile_point)
+        self.start_display(headless, display_fps)
+        pipeline.start()
+        last_report = cv2.getTickCount()
+        try:
+            while pipeline.is_running() and not self.quit_requested():
+                packet = pipeline.output.get(timeout=0.1)
+                if packet is not None:
+                    if self.visualizer is not None:
+                        self.visualizer.submit(packet.img, packet.data['results'])
+                    self.metrics.tick()
+
+                if (cv2.getTickCount() - last_report) / cv2.getTickFrequency() > report_interval:
+                    print(pipeline.format_report())
+                    print(self.publisher.format_stats())
+                    print(self.tracks.format_stats())
+                    last_report = cv2.getTickCount()
+        except KeyboardInterrupt:
+            pass
+
+        pipeline.stop()
+        print(pipeline.format_report())
+        print(self.publisher.format_stats())
+        print(self.tracks.format_stats())
+        self.cleanup()
+
         # Release resources and close sockets
     def cleanup(self):
 
         self.cap.release()
-        cv2.destroyAllWindows()
-        self.sock1.close()
-        self.sock2.close()
+        if self.visualizer is not None:
+            self.visualizer.stop()
+        if self.metrics_server is not None:
+            self.metrics_server.stop()
+        if self.recorder is not None:
+            self.recorder.close()
+            print(f"Session {self.recorder.path}: {self.recorder.format_stats()}")
+        if self.tiled_detector is not None:
+            print(self.tiled_detector.format_stats())
+            self.tiled_detector.close()
+        self.publisher.close()
 
 if __name__ == "__main__":
-    tracker = AprilTagTracker()
-    tracker.run()
+    parser = argparse.ArgumentParser(description="AprilTag detection with EKF")
+    parser.add_argument('--serial', action='store_true', help='Run capture, detection, filtering and publishing on one thread')
+    parser.add_argument('--undistort', choices=['frame', 'points', 'none'], default='points',
+                        help='Undistort the whole frame, only the detected tag points, or nothing')
+    parser.add_argument('--csv', action='store_true', help='Send the legacy per-tag CSV datagrams instead of binary frames')
+    parser.add_argument('--endpoint', action='append', type=parse_endpoint,
+                        help='Telemetry endpoint name=host:port[@rate][/csv], repeat for several (default: Unity and ESP32)')
+    parser.add_argument('--roi', action='store_true', help='Detect only around the predicted tag positions')
+    parser.add_argument('--full-frame-interval', type=int, default=10,
+                        help='With --roi, run a full-frame detection every K frames to find new cars')
+    parser.add_argument('--motion-model', choices=['static', 'cv', 'bicycle'], default='static',
+                        help='EKF motion model: static (original), constant velocity or kinematic bicycle')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='With a motion model, seconds to predict ahead of the send time (downstream latency)')
+    parser.add_argument('--max-coast-frames', type=int, default=5,
+                        help='Frames a missed tag keeps being published from the prediction before its track is dropped')
+    parser.add_argument('--source', help='Replay instead of the webcam: a video file, an image folder, synthetic[:n_tags] or camera[:index[:WxH]]')
+    parser.add_argument('--realtime', action='store_true', help='Replay --source at its native frame rate')
+    parser.add_argument('--calibration', metavar='DIR',
+                        help='Calibration bundle of the camera (default: ./calibration if present, else built-in)')
+    parser.add_argument('--metric', action='store_true',
+                        help='Publish track-plane metres and radians through the homography of the calibration bundle')
+    parser.add_argument('--headless', action='store_true', help='No display and no drawing at all')
+    parser.add_argument('--display-fps', type=float, default=15, help='Maximum refresh rate of the display window')
+    parser.add_argument('--adaptive', type=float, metavar='FPS',
+                        help='Tune the detector (threads, quad_decimate, ROI cadence with --roi) to keep up with FPS')
+    parser.add_argument('--tiles', type=parse_tiles, metavar='CxR',
+                        help='Detect high-resolution frames as CxR overlapping tiles on a process pool, e.g. 2x2')
+    parser.add_argument('--tile-overlap', type=int, default=128,
+                        help='Pixels shared by neighbouring tiles, more than the largest tag')
+    parser.add_argument('--tile-workers', type=int, help='Detection processes (default: one per tile, up to the core count)')
+    parser.add_argument('--record', metavar='DIR', help='Record frames and tracker output of the session to DIR')
+    parser.add_argument('--record-compress', action='store_true', help='Store recorded frames as lossless PNG instead of raw')
+    parser.add_argument('--metrics-port', type=int, default=0,
+                        help='Serve /metrics and /profile on http://127.0.0.1:PORT (0 = off)')
+    parser.add_argument('--metrics-log', type=float, default=0,
+                        help='Print a JSON metrics line every N seconds (0 = off)')
+    args = parser.parse_args()
+    if args.roi and args.tiles:
+        parser.error("--roi and --tiles cannot be combined")
+    source = open_source(args.source, realtime=args.realtime) if args.source else None
+
+    tracker = AprilTagTracker(source=source, undistort_mode=args.undistort, endpoints=args.endpoint, binary_telemetry=not args.csv,
+                              roi_tracking=args.roi, full_frame_interval=args.full_frame_interval,
+                              motion_model=args.motion_model, latency=args.latency,
+                              max_coast_frames=args.max_coast_frames, adaptive_fps=args.adaptive,
+                              tiles=args.tiles, tile_overlap=args.tile_overlap, tile_workers=args.tile_workers,
+                              calibration=args.calibration, metric=args.metric)
+    tracker.start_metrics(args.metrics_port, args.metrics_log)
+    if args.record:
+        tracker.start_recording(args.record, args.record_compress)
+    if args.serial:
+        tracker.run(args.headless, args.display_fps)
+    else:
+        tracker.run_pipelined(args.headless, args.display_fps)
@@ -1,6 +1,7 @@
 ﻿using System;
 using System.Collections.Generic;
 using System.Diagnostics;
+using System.Globalization;
 using UnityEngine;
 
 public class carMovement1 : MonoBehaviour
@@ -23,6 +24,10 @@ public class carMovement1 : MonoBehaviour
     // Maximum allowed position change per update
     public float maxPositionDelta = 0.7f;
 
+    // Track-plane input (udpReceive.metric): Unity units per metre and where the track origin is
+    public float worldScale = 1f;
+    public Vector2 worldOffset = Vector2.zero;
+
     // Dictionaries to store previous positions, rotations, and buffered car data
     private Dictionary<int, Vector3> previousPositions;
     private Dictionary<int, Quaternion> previousRotations;
@@ -94,10 +99,21 @@ public class carMovement1 : MonoBehaviour
                 if (info.Length >= 4)
                 {
                     int id = int.Parse(info[0].Trim()); // Car ID
-                    float x = 8 + float.Parse(info[1].Trim()) / 75; // Convert X position
-                    float z = float.Parse(info[2].Trim()) / 75; // Convert Z position
-                    float rotationY = float.Parse(info[3].Trim()); // Yaw rotation
-                    rotationY += 360; // Normalize rotation
+                    float x, z, rotationY;
+                    if (udpReceive.metric)
+                    {
+                        // Metres and radians on the track plane, already corrected by the tracker
+                        x = worldOffset.x + float.Parse(info[1].Trim(), CultureInfo.InvariantCulture) * worldScale;
+                        z = worldOffset.y + float.Parse(info[2].Trim(), CultureInfo.InvariantCulture) * worldScale;
+                        rotationY = 90 - float.Parse(info[3].Trim(), CultureInfo.InvariantCulture) * Mathf.Rad2Deg;
+                    }
+                    else
+                    {
+                        x = 8 + float.Parse(info[1].Trim(), CultureInfo.InvariantCulture) / 75; // Convert X position
+                        z = float.Parse(info[2].Trim(), CultureInfo.InvariantCulture) / 75; // Convert Z position
+                        rotationY = float.Parse(info[3].Trim(), CultureInfo.InvariantCulture); // Yaw rotation
+                        rotationY += 360; // Normalize rotation
+                    }
 
                     // Validate car ID and update buffer
                     if (IsValidCarId(id))
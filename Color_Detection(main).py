@@ -1,35 +1,18 @@
-import cvzone
-from cvzone.ColorModule import ColorFinder
+import argparse
 import cv2
-import socket
+import time
 import numpy as np
+from calibration_bundle import load_calibration
+from color_segmentation import MultiColorSegmenter
+from contour_analysis import ContourAnalyzer
+from publisher import Publisher, default_endpoints, parse_endpoint
+from frame_sources import open_source
+from visualization import Visualizer
+from metrics import Metrics, MetricsServer
+from session_recorder import SessionRecorder
+from track_plane import TrackPlane
+from blob_tracker import BlobTracker
 
-# Initialize video capture from the usb webcam
-cap = cv2.VideoCapture(1, cv2.CAP_DSHOW)
-cap.set(3, 640)  # Set width
-cap.set(4, 480)  # Set height
-success, img = cap.read()
-
-# Store image dimensions
-img_height, img_width, _ = img.shape  
-
-# Initialize socket communication for Unity
-sock1 = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-server_address1 = ("127.0.0.1", 5053)
-
-# Initialize socket communication for ESP32
-sock2 = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-server_address2 = ("192.168.1.1", 5054)
-
-# Define camera matrix and distortion coefficients
-camera_matrix = np.array([[644.76561694, 0, 331.26266442],
-                           [0, 645.89528116, 215.92835909],
-                           [0, 0, 1]])
-dist_coeffs = np.array([0.06830215, -0.14315368, -0.01151178, 0.00780322, 0.03096726])
-
-
-# Initialize color finder object
-myColorFinder = ColorFinder(False)
 
 # Define HSV color ranges for different objects
 hsvVals1 = {'hmin': 15, 'smin': 37, 'vmin': 165, 'hmax': 72, 'smax': 114, 'vmax': 215}
@@ -37,75 +20,214 @@ hsvVals2 = {'hmin': 108, 'smin': 17, 'vmin': 101, 'hmax': 123, 'smax': 116, 'vma
 hsvVals3 = {'hmin': 82, 'smin': 173, 'vmin': 131, 'hmax': 105, 'smax': 255, 'vmax': 187}
 hsvVals4 = {'hmin': 0, 'smin': 18, 'vmin': 148, 'hmax': 15, 'smax': 177, 'vmax': 174}
 
-   # Detect shape based on contour approximation
-def detect_shape(c):
-
-    peri = cv2.arcLength(c, True)
-    approx = cv2.approxPolyDP(c, 0.02 * peri, True)
-    sides = len(approx)
-
-    if sides == 3:
-        return "1"  # Triangle
-    elif sides == 4:
-        return "2"  # Quadrilateral
-    elif sides == 5:
-        return "3"  # Pentagon
-    elif sides == 6:
-        return "4"  # Hexagon
-    return "Not Defined"
-
-# Main loop for real-time processing
-while True:
-    success, img = cap.read()
-    if not success:
-        break
-    # Undistort image using the camera matrix and distortion coefficients 
-    img = cv2.undistort(img, camera_matrix, dist_coeffs)
-    imgContour = img.copy()  # Copy image for contour processing
-    
-    # Process each color-defined group
-    grouped_cars = [
-        (myColorFinder.update(img, hsvVals1)[1], "1"),
-        (myColorFinder.update(img, hsvVals2)[1], "2"),
-        (myColorFinder.update(img, hsvVals3)[1], "3"),
-        (myColorFinder.update(img, hsvVals4)[1], "4")
-    ]
-
-    for mask, shapeType in grouped_cars:
-        imgContour, contours = cvzone.findContours(imgContour, mask)
-
-        # Process each detected contour
-        for contour in contours:
-            detected_shape = detect_shape(contour['cnt'])
-            
-            # Display detected shape only if it matches the expected type
-            if detected_shape == shapeType:
-                x, y = contour['center']
-                cv2.putText(imgContour, shapeType, (x - 50, y - 10),
-                            cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
-                print(f"Detected: {shapeType}")
-                
-                # Calculate object orientation using fitEllipse
-                ellipse = cv2.fitEllipse(contour['cnt'])
-                angle = ellipse[2]
-                if angle < 0:
-                    angle += 360  # Normalize angle to range [0, 360]
-                
-                # Format data for Unity communication
-                data = f"{shapeType},{img_width - contour['center'][0]},{img_height - contour['center'][1]},{int(angle)}"
-
-                sock1.sendto(data.encode(),server_address1)
-                # Data sent to ESP32
-                sock2.sendto(data.encode(),server_address2)
-
-
-    # Display processed contours
-    cv2.imshow("Color and Shape Detection", imgContour)
-    
-    # Exit condition
-    if cv2.waitKey(1) & 0xFF == ord('q'):
-        break
-
-# Cleanup resources
-cap.release()
-cv2.destroyAllWindows()
+class ColorShapeTracker:
+    def __init__(self, source=None, endpoints=None, binary_telemetry=True, metrics=None, calibration=None, metric=False,
+                 gate=13.8, min_hits=3, max_coast_frames=5):
+        # Initialize video capture from the usb webcam (or any object with read()/release())
+        if source is None:
+            source = cv2.VideoCapture(1, cv2.CAP_DSHOW)
+            source.set(3, 640)  # Set width
+            source.set(4, 480)  # Set height
+        self.cap = source
+        self.visualizer = None
+
+        # Per-stage latency histograms and detection counters (see metrics.py)
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.metrics_server = None
+        self.recorder = None
+
+        # Telemetry to Unity (full rate) and ESP32 (30 Hz), one binary datagram per frame
+        self.publisher = Publisher(endpoints if endpoints is not None else default_endpoints(binary_telemetry), metric=metric)
+
+        # Camera calibration bundle (--calibration, or ./calibration when it exists), else the
+        # built-in calibration of the original webcam, see calibration_bundle.py
+        self.calibration = load_calibration(calibration)
+        self.camera_matrix = self.calibration.camera_matrix
+        self.dist_coeffs = self.calibration.dist_coeffs
+        self.frame_size = None  # checked against the calibrated resolution on the first frame
+
+        # Undistortion maps come from the bundle (or are built once) and are reused for every frame
+        self.undistorter = self.calibration.undistorter()
+
+        # Optional track-plane output (metres, radians) through the bundle's homography
+        self.plane = TrackPlane.from_bundle(self.calibration, self.undistorter) if metric else None
+
+        # One segmenter for all colours: class k (shape type k + 1) is hsvVals{k + 1}
+        self.hsv_vals = [hsvVals1, hsvVals2, hsvVals3, hsvVals4]
+        self.segmenter = MultiColorSegmenter(self.hsv_vals)
+        # Shape type (class k is a polygon with k + 3 sides), centroid and heading of
+        # every blob at once, see contour_analysis.py
+        self.analyzer = ContourAnalyzer(len(self.hsv_vals), min_area=1000)
+
+        # Identity over time: only confirmed tracks are published, one per colour (see blob_tracker.py)
+        self.tracker = BlobTracker(gate=gate, min_hits=min_hits, max_coast_frames=max_coast_frames)
+
+    def read_frame(self):
+        with self.metrics.time('capture'):
+            success, img = self.cap.read()
+        if success and self.frame_size is None:
+            self.frame_size = self.undistorter.check_size(img.shape[1::-1])
+        return img if success else None
+
+    def detect(self, img):
+        # Undistort image using the camera matrix and distortion coefficients
+        with self.metrics.time('undistort'):
+            img = self.undistorter.undistort(img)
+
+        with self.metrics.time('detect'):
+            return self._detect(img)
+
+    def _detect(self, img):
+        # Segment all color-defined groups at once
+        labels = self.segmenter.segment(img)
+        blobs = self.analyzer.analyze(labels)
+
+        # Keep blobs whose shape matches the expected type of their colour
+        match = blobs['sides'] == blobs['cls'] + 3
+        objects = {key: value[match] for key, value in blobs.items()}
+
+        # Counted instead of printed: printing every contour slowed the loop down
+        self.metrics.count('blobs', self.analyzer.candidates)
+        counts = np.bincount(objects['cls'], minlength=len(self.hsv_vals))
+        for k in np.flatnonzero(counts):
+            self.metrics.count(f"detected_{k + 1}", int(counts[k]))
+
+        return img, blobs, objects
+
+    def filter(self, objects, timestamp=None):
+        with self.metrics.time('filter'):
+            return self.tracker.update(objects, timestamp)
+
+    def publish(self, img_shape, shape_ids, states, timestamp=None, flags=None):
+        with self.metrics.time('publish'):
+            self._publish(img_shape, shape_ids, states, timestamp, flags)
+
+    def _publish(self, img_shape, shape_ids, states, timestamp, flags):
+        img_height, img_width = img_shape[:2]
+
+        # Format data for Unity communication, all tracks of this frame at once
+        # (heading is the direction of a vertex, unwrapped by the tracker)
+        if self.plane is not None:
+            self.publisher.publish(shape_ids, self.plane.poses(states[:, :2], states[:, 2]), timestamp, flags)
+        else:
+            # Mirrored from the right / bottom edges like before
+            self.publisher.publish(shape_ids, states, timestamp, flags, mirror=(img_width, img_height))
+
+    def draw(self, img, blobs, objects, tracks):
+        imgContour = img.copy()  # Copy image for contour processing
+        for x, y, w, h in blobs['bbox']:
+            cv2.rectangle(imgContour, (int(x), int(y)), (int(x + w), int(y + h)), (255, 0, 0), 3)
+
+        # Display detected shape only if it matches the expected type, with its heading
+        for k, (x, y), heading in zip(objects['cls'], objects['center'].astype(int), objects['heading']):
+            tip = (int(x + 30 * np.cos(np.radians(heading))), int(y + 30 * np.sin(np.radians(heading))))
+            cv2.arrowedLine(imgContour, (int(x), int(y)), tip, (0, 0, 255), 2)
+            cv2.putText(imgContour, str(k + 1), (int(x) - 50, int(y) - 10),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
+
+        # Published tracks, yellow while coasting on the prediction
+        shape_ids, states, flags = tracks
+        for shape_id, (x, y, _), flag in zip(shape_ids, states, flags):
+            color = (0, 255, 255) if flag else (255, 0, 255)
+            cv2.circle(imgContour, (int(x), int(y)), 8, color, 2)
+            cv2.putText(imgContour, f"#{shape_id}", (int(x) + 10, int(y) + 25),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
+        return imgContour
+
+    def process_frame(self):
+        raw = self.read_frame()
+        if raw is None:
+            return False
+        timestamp = time.time()
+
+        img, blobs, objects = self.detect(raw)
+        shape_ids, states, flags = self.filter(objects, timestamp)
+        self.publish(img.shape, shape_ids, states, timestamp, flags)
+        if self.recorder is not None:
+            # Shape type as ID, centroid in undistorted pixels and heading: blobs and published tracks
+            poses = np.column_stack((objects['center'], objects['heading']))
+            self.recorder.record(raw, timestamp, ((objects['cls'] + 1).tolist(), poses, None), (shape_ids, states, flags))
+
+        # Display processed blobs and tracks (drawn on the display thread)
+        if self.visualizer is not None:
+            self.visualizer.submit(img, blobs, objects, (shape_ids, states, flags))
+        self.metrics.tick()
+        return True
+
+    def start_metrics(self, port=0, log_interval=0):
+        # JSON log line every log_interval seconds and/or a local HTTP endpoint
+        self.metrics.log_interval = log_interval
+        if port:
+            self.metrics_server = MetricsServer(self.metrics, port).start()
+
+    def start_recording(self, path, compress=False):
+        # Frames and tracker output go to a session folder from a background thread
+        self.recorder = SessionRecorder(path, compress=compress)
+
+    def run(self, headless=False, display_fps=15):
+        # Headless: no drawing at all. Otherwise draw on a separate thread at a reduced rate
+        if not headless:
+            self.visualizer = Visualizer(self.draw, "Color and Shape Detection", display_fps, self.metrics).start()
+
+        # Main loop for real-time processing
+        try:
+            while True:
+                if not self.process_frame():
+                    break
+
+                # Exit condition ('q' in the display window)
+                if self.visualizer is not None and self.visualizer.quit_requested:
+                    break
+        except KeyboardInterrupt:
+            pass
+
+        self.cleanup()
+
+    # Cleanup resources
+    def cleanup(self):
+        self.cap.release()
+        if self.visualizer is not None:
+            self.visualizer.stop()
+        if self.metrics_server is not None:
+            self.metrics_server.stop()
+        if self.recorder is not None:
+            self.recorder.close()
+            print(f"Session {self.recorder.path}: {self.recorder.format_stats()}")
+        print(self.tracker.format_stats())
+        self.publisher.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Color and shape detection")
+    parser.add_argument('--csv', action='store_true', help='Send the legacy per-object CSV datagrams instead of binary frames')
+    parser.add_argument('--endpoint', action='append', type=parse_endpoint,
+                        help='Telemetry endpoint name=host:port[@rate][/csv], repeat for several (default: Unity and ESP32)')
+    parser.add_argument('--source', help='Replay instead of the webcam: a video file, an image folder, synthetic[:n_tags] or camera[:index]')
+    parser.add_argument('--realtime', action='store_true', help='Replay --source at its native frame rate')
+    parser.add_argument('--calibration', metavar='DIR',
+                        help='Calibration bundle of the camera (default: ./calibration if present, else built-in)')
+    parser.add_argument('--metric', action='store_true',
+                        help='Publish track-plane metres and radians through the homography of the calibration bundle')
+    parser.add_argument('--gate', type=float, default=13.8,
+                        help='Association gate on the squared Mahalanobis distance to a predicted blob (13.8: 99.9 %%)')
+    parser.add_argument('--min-hits', type=int, default=3,
+                        help='Detections before a new blob track is confirmed and published')
+    parser.add_argument('--max-coast-frames', type=int, default=5,
+                        help='Frames a missed car keeps being published from the prediction before its track is lost')
+    parser.add_argument('--headless', action='store_true', help='No display and no drawing at all')
+    parser.add_argument('--display-fps', type=float, default=15, help='Maximum refresh rate of the display window')
+    parser.add_argument('--record', metavar='DIR', help='Record frames and tracker output of the session to DIR')
+    parser.add_argument('--record-compress', action='store_true', help='Store recorded frames as lossless PNG instead of raw')
+    parser.add_argument('--metrics-port', type=int, default=0,
+                        help='Serve /metrics and /profile on http://127.0.0.1:PORT (0 = off)')
+    parser.add_argument('--metrics-log', type=float, default=0,
+                        help='Print a JSON metrics line every N seconds (0 = off)')
+    args = parser.parse_args()
+    source = open_source(args.source, realtime=args.realtime) if args.source else None
+
+    tracker = ColorShapeTracker(source=source, endpoints=args.endpoint, binary_telemetry=not args.csv,
+                                calibration=args.calibration, metric=args.metric, gate=args.gate,
+                                min_hits=args.min_hits, max_coast_frames=args.max_coast_frames)
+    tracker.start_metrics(args.metrics_port, args.metrics_log)
+    if args.record:
+        tracker.start_recording(args.record, args.record_compress)
+    tracker.run(args.headless, args.display_fps)
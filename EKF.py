@@ -1,7 +1,7 @@
 ﻿import numpy as np 
 
 class ExtendedKalmanFilter:
-    def __init__(self, dt=1/70):
+    def __init__(self, dt=1/70, fast=True):
         # Define the state space dimensions
         self.state_dim = 3  # State vector: [x, y, θ] (position and orientation)
         self.measurement_dim = 3  # Measurement vector: [x, y, θ]
@@ -17,6 +17,26 @@ class ExtendedKalmanFilter:
         # Measurement noise covariance matrix (R) - represents sensor uncertainty
         self.R = np.diag([0.01, 0.01, 0.005])  # Small values indicate high confidence in measurements
 
+        # Fast path: no per-call F/H/eye/pinv, preallocated buffers, states updated in place
+        self.fast = fast
+        self.refresh_model()
+
+    def refresh_model(self):
+        """Re-detect the model structure, call after changing Q or R."""
+        self.F = self.jacobian_F(None)
+        self.H = self.jacobian_H(None)
+        identity = np.array_equal(self.F, np.eye(self.state_dim)) and np.array_equal(self.H, np.eye(self.state_dim))
+        is_diagonal = lambda M: np.count_nonzero(M - np.diag(np.diag(M))) == 0
+        # With F = H = I and diagonal Q, R, P0 the covariance stays diagonal forever,
+        # so the whole update reduces to three independent scalar filters
+        self.diagonal = identity and is_diagonal(self.Q) and is_diagonal(self.R)
+        self.identity = identity
+        self.q = np.diag(self.Q).astype(float)
+        self.r = np.diag(self.R).astype(float)
+        self._gain = np.empty(self.state_dim)
+        self._tmp = np.empty(self.state_dim)
+        self._residual = np.empty(self.state_dim)
+
     def f(self, x):
         """
         State transition function: Defines how the state evolves over time.
@@ -51,11 +71,17 @@ class ExtendedKalmanFilter:
 
     def initialize_state(self, tag_id, measurement):
         """Initialize state and covariance for a newly detected AprilTag."""
-        self.states[tag_id] = np.asarray(measurement)  # Store initial measurement as state
+        self.states[tag_id] = np.array(measurement, dtype=float)  # Store a copy of the initial measurement as state
         self.P[tag_id] = np.diag([1.0, 1.0, 0.1])  # Initial covariance matrix with some uncertainty
 
     def predict_and_update(self, tag_id, measurement):
         """Performs both the prediction and update steps of the Kalman filter."""
+        if self.fast and tag_id in self.states:
+            if self.diagonal:
+                return self._update_diagonal(tag_id, measurement)
+            if self.identity:
+                return self._update_identity(tag_id, measurement)
+
         measurement = np.asarray(measurement)  # Convert input to NumPy array
 
         # If tag is seen for the first time, initialize it
@@ -93,3 +119,392 @@ class ExtendedKalmanFilter:
         self.P[tag_id] = updated_P
 
         return updated_state  # Return filtered state
+
+    def _update_diagonal(self, tag_id, measurement):
+        """Closed-form update for F = H = I with diagonal Q, R (and P), without temporaries."""
+        x = self.states[tag_id]
+        p = self.P[tag_id].reshape(-1)[::self.state_dim + 1]  # view on the diagonal of P
+        gain, tmp, residual = self._gain, self._tmp, self._residual
+
+        p += self.q  # P_pred = P + Q
+        np.add(p, self.r, out=tmp)  # S = P_pred + R
+        np.divide(p, tmp, out=gain)  # K = P_pred / S
+
+        np.subtract(measurement, x, out=residual)
+        residual[2] %= 360  # same angle error as the general path
+        residual *= gain
+        x += residual
+        x[2] %= 360
+
+        np.subtract(1.0, gain, out=tmp)
+        p *= tmp  # P = (1 - K) P_pred
+        return x.copy()
+
+    def _update_identity(self, tag_id, measurement):
+        """F = H = I with full Q or R: one linear solve instead of the SVD pseudo-inverse."""
+        x = self.states[tag_id]
+        P_pred = self.P[tag_id] + self.Q
+        K = np.linalg.solve(P_pred + self.R, P_pred).T  # P_pred S^-1 (both symmetric)
+
+        residual = np.subtract(measurement, x, out=self._residual)
+        residual[2] %= 360
+        updated_state = x + K @ residual
+        updated_state[2] %= 360
+
+        self.states[tag_id] = updated_state
+        self.P[tag_id] = P_pred - K @ P_pred
+        return updated_state
+
+
+def wrap_angle(angle):
+    """Angle difference in degrees wrapped to [-180, 180)."""
+    return (angle + 180) % 360 - 180
+
+
+def _cv_block(dt, q):
+    """Discrete white-noise-acceleration covariance of one (position, rate) pair, per row of dt."""
+    return q * np.stack((np.stack((dt ** 3 / 3, dt ** 2 / 2), -1),
+                         np.stack((dt ** 2 / 2, dt), -1)), -2)
+
+
+class ConstantVelocityModel:
+    """
+    State [x, y, θ, vx, vy, ω]: position and heading change at constant rates
+    (pixels/s, degrees/s). Process noise is white acceleration with spectral
+    densities accel_noise (px²/s³) and yaw_accel_noise (deg²/s³).
+    """
+    name = 'cv'
+    state_dim = 6
+
+    def __init__(self, accel_noise=2000.0, yaw_accel_noise=5000.0):
+        self.accel_noise = accel_noise
+        self.yaw_accel_noise = yaw_accel_noise
+        # Unknown rates at birth: large variance on vx, vy, ω
+        self.P0 = np.diag([1.0, 1.0, 0.1, 1e4, 1e4, 1e4])
+
+    def initial_state(self, z):
+        return np.column_stack((z, np.zeros((len(z), 3))))
+
+    def f(self, x, dt):
+        x_pred = x.copy()
+        x_pred[:, :3] += x[:, 3:] * dt[:, None]
+        return x_pred
+
+    def jacobian(self, x, dt):
+        F = np.broadcast_to(np.eye(6), (len(x), 6, 6)).copy()
+        F[:, 0, 3] = F[:, 1, 4] = F[:, 2, 5] = dt
+        return F
+
+    def Q(self, x, dt):
+        Q = np.zeros((len(dt), 6, 6))
+        for i, q in ((0, self.accel_noise), (1, self.accel_noise), (2, self.yaw_accel_noise)):
+            Q[:, [[i], [i + 3]], [i, i + 3]] = _cv_block(dt, q)
+        return Q
+
+
+class BicycleModel:
+    """
+    Kinematic bicycle, state [x, y, θ, v, ω]: the car drives at speed v (pixels/s)
+    along its heading θ + heading_offset and turns at yaw rate ω (degrees/s).
+    heading_offset is the angle between the tag's top edge and the driving direction.
+    """
+    name = 'bicycle'
+    state_dim = 5
+
+    def __init__(self, accel_noise=2000.0, yaw_accel_noise=5000.0, heading_offset=0.0):
+        self.accel_noise = accel_noise
+        self.yaw_accel_noise = yaw_accel_noise
+        self.heading_offset = heading_offset
+        self.P0 = np.diag([1.0, 1.0, 0.1, 1e4, 1e4])
+
+    def initial_state(self, z):
+        return np.column_stack((z, np.zeros((len(z), 2))))
+
+    def f(self, x, dt):
+        theta = np.radians(x[:, 2] + self.heading_offset)
+        x_pred = x.copy()
+        x_pred[:, 0] += x[:, 3] * np.cos(theta) * dt
+        x_pred[:, 1] += x[:, 3] * np.sin(theta) * dt
+        x_pred[:, 2] += x[:, 4] * dt
+        return x_pred
+
+    def jacobian(self, x, dt):
+        theta = np.radians(x[:, 2] + self.heading_offset)
+        F = np.broadcast_to(np.eye(5), (len(x), 5, 5)).copy()
+        F[:, 0, 2] = -x[:, 3] * np.sin(theta) * dt * np.pi / 180
+        F[:, 0, 3] = np.cos(theta) * dt
+        F[:, 1, 2] = x[:, 3] * np.cos(theta) * dt * np.pi / 180
+        F[:, 1, 3] = np.sin(theta) * dt
+        F[:, 2, 4] = dt
+        return F
+
+    def Q(self, x, dt):
+        # Acceleration noise enters along the heading, yaw acceleration on (θ, ω)
+        theta = np.radians(x[:, 2] + self.heading_offset)
+        direction = np.stack((np.cos(theta), np.sin(theta)), -1)
+        block = _cv_block(dt, self.accel_noise)
+        Q = np.zeros((len(dt), 5, 5))
+        Q[:, :2, :2] = block[:, 0, 0, None, None] * direction[:, :, None] * direction[:, None, :]
+        Q[:, :2, 3] = block[:, 0, 1, None] * direction
+        Q[:, 3, :2] = Q[:, :2, 3]
+        Q[:, 3, 3] = block[:, 1, 1]
+        Q[:, [[2], [4]], [2, 4]] = _cv_block(dt, self.yaw_accel_noise)
+        # Keep a little isotropic position noise so lateral slip is not impossible
+        Q[:, 0, 0] += 0.1 * self.accel_noise * dt ** 3
+        Q[:, 1, 1] += 0.1 * self.accel_noise * dt ** 3
+        return Q
+
+
+MOTION_MODELS = {'cv': ConstantVelocityModel, 'bicycle': BicycleModel}
+
+
+class BatchExtendedKalmanFilter:
+    """
+    Same filter as ExtendedKalmanFilter, but every tag's state and covariance
+    live in contiguous (N, n) and (N, n, n) arrays indexed by a tag slot, so a
+    whole frame of detections is predicted and updated in one NumPy pass.
+
+    model: None keeps the static [x, y, θ] model of ExtendedKalmanFilter. A motion
+    model (ConstantVelocityModel, BicycleModel or its name in MOTION_MODELS) extends
+    the state with rates; measurements stay [x, y, θ]. When predict_and_update gets
+    capture timestamps, each tag is propagated by its real time since its last update.
+    """
+
+    def __init__(self, dt=1/70, capacity=32, Q=None, R=None, P0=None, model=None):
+        if isinstance(model, str):
+            model = MOTION_MODELS[model]()
+        self.model = model
+        self.state_dim = 3 if model is None else model.state_dim  # State vector: [x, y, θ, rates...]
+        self.measurement_dim = 3  # Measurement vector: [x, y, θ]
+        self.dt = dt  # Time step duration when no timestamps are given
+
+        # Contiguous storage for all tags, one row per slot
+        self.x = np.zeros((capacity, self.state_dim))
+        self.P = np.zeros((capacity, self.state_dim, self.state_dim))
+        self.t = np.zeros(capacity)  # time of the last update per slot
+        self.active = np.zeros(capacity, dtype=bool)
+
+        # Tag ID -> slot index, and slots released by remove()
+        self.slots = {}
+        self.free_slots = list(range(capacity - 1, -1, -1))
+
+        # Same noise model as the per-tag filter unless given (e.g. for metric units).
+        # Motion models get their process noise from the model and a pixel-level R
+        if model is None:
+            self.Q = np.diag([0.55, 0.05, 0.552]) if Q is None else np.asarray(Q, dtype=float)
+            self.R = np.diag([0.01, 0.01, 0.005]) if R is None else np.asarray(R, dtype=float)
+            self.P0 = np.diag([1.0, 1.0, 0.1]) if P0 is None else np.asarray(P0, dtype=float)
+        else:
+            self.Q = None if Q is None else np.asarray(Q, dtype=float)
+            self.R = np.diag([1.0, 1.0, 2.0]) if R is None else np.asarray(R, dtype=float)
+            self.P0 = model.P0 if P0 is None else np.asarray(P0, dtype=float)
+
+        # Static model: F and H are identities, built once
+        self.F = np.eye(self.state_dim)
+        self.H = np.eye(self.state_dim)
+
+        # Static model with diagonal Q, R and P0: P stays diagonal, the update is elementwise
+        is_diagonal = lambda M: M is not None and np.count_nonzero(M - np.diag(np.diag(M))) == 0
+        self.diagonal = model is None and all(is_diagonal(M) for M in (self.Q, self.R, self.P0))
+        self._diag = np.arange(self.state_dim)
+
+    @property
+    def capacity(self):
+        return self.x.shape[0]
+
+    @property
+    def states(self):
+        """Tag ID -> state view, mirrors ExtendedKalmanFilter.states."""
+        return {tag_id: self.x[slot] for tag_id, slot in self.slots.items()}
+
+    def normalize_angle(self, angle):
+        """Ensures angles remain within [0, 360) degrees."""
+        return angle % 360
+
+    def _grow(self, min_capacity):
+        """Double the storage until it holds at least min_capacity slots."""
+        old = self.capacity
+        new = max(min_capacity, 2 * old)
+        x = np.zeros((new, self.state_dim))
+        P = np.zeros((new, self.state_dim, self.state_dim))
+        t = np.zeros(new)
+        active = np.zeros(new, dtype=bool)
+        x[:old], P[:old], t[:old], active[:old] = self.x, self.P, self.t, self.active
+        self.x, self.P, self.t, self.active = x, P, t, active
+        self.free_slots = list(range(new - 1, old - 1, -1)) + self.free_slots
+
+    def slot(self, tag_id):
+        """Return the slot of a tag, allocating one if needed."""
+        slot = self.slots.get(tag_id)
+        if slot is None:
+            if not self.free_slots:
+                self._grow(self.capacity + 1)
+            slot = self.free_slots.pop()
+            self.slots[tag_id] = slot
+        return slot
+
+    def remove(self, tag_id):
+        """Forget a tag and release its slot for reuse."""
+        slot = self.slots.pop(tag_id, None)
+        if slot is not None:
+            self.active[slot] = False
+            self.free_slots.append(slot)
+
+    def get_state(self, tag_id):
+        slot = self.slots.get(tag_id)
+        if slot is None or not self.active[slot]:
+            return None
+        return self.x[slot]
+
+    def _dt(self, idx, timestamp):
+        if timestamp is None:
+            return np.full(len(idx), self.dt)
+        # Real elapsed time per tag, never negative (out-of-order frames)
+        return np.maximum(timestamp - self.t[idx], 0.0)
+
+    def _propagate(self, idx, dt):
+        """Motion model prediction of the given slots: returns (x_pred, P_pred)."""
+        x, P = self.x[idx], self.P[idx]
+        F = self.model.jacobian(x, dt)
+        Q = self.model.Q(x, dt) if self.Q is None else self.Q * dt[:, None, None]
+        x_pred = self.model.f(x, dt)
+        x_pred[:, 2] = self.normalize_angle(x_pred[:, 2])
+        return x_pred, F @ P @ F.transpose(0, 2, 1) + Q
+
+    def predict_states(self, tag_ids, timestamp):
+        """
+        [x, y, θ] of the given tags extrapolated to `timestamp` (e.g. the send time,
+        to cover the pipeline latency) without changing the filter. The static model
+        returns the current states.
+        """
+        idx = np.fromiter((self.slots[t] for t in tag_ids), dtype=np.intp, count=len(tag_ids))
+        if self.model is None or len(idx) == 0:
+            return self.x[idx, :3].copy()
+        x_pred = self.model.f(self.x[idx], self._dt(idx, timestamp))
+        x_pred[:, 2] = self.normalize_angle(x_pred[:, 2])
+        return x_pred[:, :3]
+
+    def snapshot(self, tag_ids):
+        """
+        Copy of the full states and update times of the given tags, for extrapolate()
+        on another thread (the publish stage) while this filter keeps changing.
+        """
+        idx = np.fromiter((self.slots[t] for t in tag_ids), dtype=np.intp, count=len(tag_ids))
+        return list(tag_ids), self.x[idx].copy(), self.t[idx].copy()
+
+    def extrapolate(self, snapshot, tag_ids, timestamp):
+        """
+        Like predict_states, but from a snapshot(): [x, y, θ] of `tag_ids` (a subset of
+        the snapshot's tags) at `timestamp`. Only reads the snapshot and the model.
+        """
+        snapshot_ids, x, t = snapshot
+        rows = {tag_id: i for i, tag_id in enumerate(snapshot_ids)}
+        idx = np.fromiter((rows[tag_id] for tag_id in tag_ids), dtype=np.intp, count=len(tag_ids))
+        if self.model is None or len(idx) == 0:
+            return x[idx, :3].copy()
+        x_pred = self.model.f(x[idx], np.maximum(timestamp - t[idx], 0.0))
+        x_pred[:, 2] = self.normalize_angle(x_pred[:, 2])
+        return x_pred[:, :3]
+
+    def predict_with_covariance(self, tag_ids, timestamp=None):
+        """
+        Predicted [x, y, θ] (M, 3) of the given tags at `timestamp` and their (M, 3, 3)
+        covariance, without changing the filter (e.g. to gate detections before the update).
+        """
+        idx = np.fromiter((self.slots[t] for t in tag_ids), dtype=np.intp, count=len(tag_ids))
+        if self.model is None:
+            return self.x[idx].copy(), self.P[idx] + self.Q
+        x_pred, P_pred = self._propagate(idx, self._dt(idx, timestamp))
+        return x_pred[:, :3], P_pred[:, :3, :3]
+
+    def predict_and_update(self, tag_ids, measurements, timestamp=None):
+        """
+        Predict and update every tag of one frame at once.
+        tag_ids: sequence of M tag IDs, measurements: (M, 3) array of [x, y, θ],
+        timestamp: capture time of the frame (seconds); without it every step is dt.
+        Returns the (M, 3) filtered [x, y, θ] in the same order.
+        If a tag appears twice in one frame, the last row wins.
+        """
+        measurements = np.asarray(measurements, dtype=float).reshape(-1, self.measurement_dim)
+        if len(measurements) == 0:
+            return measurements
+
+        slots = np.fromiter((self.slot(t) for t in tag_ids), dtype=np.intp, count=len(measurements))
+
+        # Tags seen for the first time start from their measurement
+        new = ~self.active[slots]
+        if new.any():
+            new_slots = slots[new]
+            if self.model is None:
+                self.x[new_slots] = measurements[new]
+            else:
+                self.x[new_slots] = self.model.initial_state(measurements[new])
+            self.P[new_slots] = self.P0
+            self.active[new_slots] = True
+            if timestamp is not None:
+                self.t[new_slots] = timestamp
+
+        out = measurements.copy()
+        old = ~new
+        if not old.any():
+            return out
+
+        idx = slots[old]
+        z = measurements[old]
+        if self.model is not None:
+            out[old] = self._update_model(idx, z, timestamp)
+            return out
+
+        # Prediction step (static model: x_pred = x, P_pred = P + Q)
+        x_pred = self.x[idx]
+        residual = z - x_pred
+        residual[:, 2] = self.normalize_angle(z[:, 2] - x_pred[:, 2])
+
+        if self.diagonal:
+            # Closed form on the diagonals: K = p / (p + r), P = (1 - K) p
+            d = self._diag
+            p = self.P[idx[:, None], d, d] + np.diag(self.Q)
+            K = p / (p + np.diag(self.R))
+            updated_state = x_pred + K * residual
+            updated_state[:, 2] = self.normalize_angle(updated_state[:, 2])
+            self.x[idx] = updated_state
+            self.P[idx[:, None], d, d] = (1 - K) * p
+        else:
+            P_pred = self.P[idx] + self.Q
+
+            # Update step (H = I: S = P_pred + R, K = P_pred S^-1)
+            S = P_pred + self.R
+            K = np.linalg.solve(S, P_pred).transpose(0, 2, 1)  # P_pred S^-1 (both symmetric)
+
+            updated_state = x_pred + np.einsum('nij,nj->ni', K, residual)
+            updated_state[:, 2] = self.normalize_angle(updated_state[:, 2])
+            updated_P = P_pred - K @ P_pred  # (I - K) P_pred
+
+            self.x[idx] = updated_state
+            self.P[idx] = updated_P
+        if timestamp is not None:
+            self.t[idx] = timestamp
+        out[old] = updated_state
+        return out
+
+    def _update_model(self, idx, z, timestamp):
+        # Prediction step with the motion model over each tag's own dt
+        x_pred, P_pred = self._propagate(idx, self._dt(idx, timestamp))
+
+        # Update step (H = [I 0]: only x, y, θ are measured)
+        S = P_pred[:, :3, :3] + self.R
+        K = np.linalg.solve(S, P_pred[:, :3, :]).transpose(0, 2, 1)  # P_pred Hᵀ S⁻¹, S symmetric
+
+        # Angle residual on the short way round, otherwise the yaw rate jumps at 0/360
+        residual = z - x_pred[:, :3]
+        residual[:, 2] = wrap_angle(residual[:, 2])
+
+        updated_state = x_pred + np.einsum('nij,nj->ni', K, residual)
+        updated_state[:, 2] = self.normalize_angle(updated_state[:, 2])
+        updated_P = P_pred - K @ P_pred[:, :3, :]  # (I - K H) P_pred
+
+        self.x[idx] = updated_state
+        self.P[idx] = updated_P
+        if timestamp is not None:
+            self.t[idx] = timestamp
+        return updated_state[:, :3]
@@ -1,4 +1,5 @@
 using System.Collections.Concurrent;
+using System.Globalization;
 using System.Net;
 using System.Net.Sockets;
 using System.Text;
@@ -17,6 +18,21 @@ public class UDPReceive : MonoBehaviour
     public int maxQueueSize = 100;
     public bool printToConsole = false;
 
+    // Binary frame message sent by the Python trackers (see telemetry.py):
+    // header: 'M' 'C' | version u8 | flags u8 | frame seq u32 | capture timestamp f64 | tag count u16
+    // tags:   id u16 | x f32 | y f32 | angle f32 | flags u8
+    private const int HeaderSize = 18;
+    private const int TagSize = 15;
+    private const byte FrameVersion = 1;
+    private const byte FrameMetric = 0x01;  // x, y in track metres and angle in radians
+
+    public uint lastFrameSeq;
+    public double lastFrameTimestamp;
+    public long missedFrames;
+
+    // Set from the header of binary frames (trackers run with --metric); tick it by hand for metric CSV
+    public bool metric;
+
     void Start() => StartReceiving();
 
     void OnDisable() => StopReceiving();
@@ -43,12 +59,20 @@ public class UDPReceive : MonoBehaviour
             try
             {
                 IPEndPoint anyIP = new IPEndPoint(IPAddress.Any, 0);
-                string data = Encoding.UTF8.GetString(client.Receive(ref anyIP));
+                byte[] bytes = client.Receive(ref anyIP);
 
-                foreach (var message in data.Split(new[] { "\r\n", "\r", "\n" }, System.StringSplitOptions.RemoveEmptyEntries))
+                if (IsBinaryFrame(bytes))
                 {
-                    if (dataQueue.Count >= maxQueueSize) dataQueue.TryDequeue(out _);
-                    dataQueue.Enqueue(message);
+                    ParseBinaryFrame(bytes);
+                }
+                else
+                {
+                    // Legacy CSV datagrams: "id,x,y,angle"
+                    string data = Encoding.UTF8.GetString(bytes);
+                    foreach (var message in data.Split(new[] { "\r\n", "\r", "\n" }, System.StringSplitOptions.RemoveEmptyEntries))
+                    {
+                        Enqueue(message);
+                    }
                 }
 
                 if (printToConsole) Debug.Log($"Received {dataQueue.Count} messages");
@@ -65,6 +89,63 @@ public class UDPReceive : MonoBehaviour
         }
     }
 
+    private void Enqueue(string message)
+    {
+        if (dataQueue.Count >= maxQueueSize) dataQueue.TryDequeue(out _);
+        dataQueue.Enqueue(message);
+    }
+
+    private static bool IsBinaryFrame(byte[] bytes) =>
+        bytes.Length >= HeaderSize && bytes[0] == (byte)'M' && bytes[1] == (byte)'C';
+
+    // Unpacks one frame message into "id,x,y,angle" lines so consumers keep working unchanged
+    private void ParseBinaryFrame(byte[] bytes)
+    {
+        if (bytes[2] != FrameVersion)
+        {
+            Debug.LogWarning($"Unsupported telemetry version {bytes[2]}");
+            return;
+        }
+
+        uint seq = ReadUInt32(bytes, 4);
+        double timestamp = ReadDouble(bytes, 8);
+        int count = ReadUInt16(bytes, 16);
+        if (bytes.Length < HeaderSize + count * TagSize)
+        {
+            Debug.LogWarning($"Truncated telemetry frame {seq}");
+            return;
+        }
+
+        if (lastFrameSeq != 0 && seq > lastFrameSeq + 1) missedFrames += seq - lastFrameSeq - 1;
+        lastFrameSeq = seq;
+        lastFrameTimestamp = timestamp;
+        metric = (bytes[3] & FrameMetric) != 0;
+
+        for (int i = 0; i < count; i++)
+        {
+            int offset = HeaderSize + i * TagSize;
+            int id = ReadUInt16(bytes, offset);
+            float x = ReadSingle(bytes, offset + 2);
+            float y = ReadSingle(bytes, offset + 6);
+            float angle = ReadSingle(bytes, offset + 10);
+            Enqueue(string.Format(CultureInfo.InvariantCulture, "{0},{1},{2},{3}", id, x, y, angle));
+        }
+    }
+
+    // The message is little-endian, swap on big-endian platforms
+    private static byte[] LittleEndian(byte[] bytes, int offset, int size)
+    {
+        byte[] value = new byte[size];
+        Array.Copy(bytes, offset, value, 0, size);
+        if (!BitConverter.IsLittleEndian) Array.Reverse(value);
+        return value;
+    }
+
+    private static ushort ReadUInt16(byte[] bytes, int offset) => BitConverter.ToUInt16(LittleEndian(bytes, offset, 2), 0);
+    private static uint ReadUInt32(byte[] bytes, int offset) => BitConverter.ToUInt32(LittleEndian(bytes, offset, 4), 0);
+    private static float ReadSingle(byte[] bytes, int offset) => BitConverter.ToSingle(LittleEndian(bytes, offset, 4), 0);
+    private static double ReadDouble(byte[] bytes, int offset) => BitConverter.ToDouble(LittleEndian(bytes, offset, 8), 0);
+
     public string[] GetLatestData() => dataQueue.ToArray();
 
     void OnApplicationQuit() => StopReceiving();
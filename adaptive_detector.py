@@ -0,0 +1,202 @@
+import numbers
+import os
+import numpy as np
+
+# Detector settings that can be changed on a live pupil_apriltags Detector
+TUNABLE = ('nthreads', 'quad_decimate', 'quad_sigma', 'refine_edges', 'decode_sharpening')
+
+# Tag families the pupil_apriltags Detector knows
+FAMILIES = ('tag16h5', 'tag25h9', 'tag36h11', 'tagCircle21h7', 'tagCircle49h12',
+            'tagStandard41h12', 'tagStandard52h13', 'tagCustom48h12')
+
+# quad_decimate values that mean what they say: the detector has a dedicated 1.5x
+# decimation, truncates any other factor to an integer and treats anything <= 1 as 1
+DECIMATE_LADDER = (1.0, 1.5, 2.0, 3.0, 4.0)
+
+
+def check_detector_settings(changes):
+    """
+    Validated copy of detector settings (e.g. from a control message), raises ValueError
+    on an unknown setting or a value of the wrong type or range.
+    """
+    def number(key, value, minimum, integer=False):
+        if isinstance(value, bool) or not isinstance(value, numbers.Real) or (integer and value != int(value)):
+            raise ValueError(f"{key} must be {'an integer' if integer else 'a number'}, got {value!r}")
+        if not value >= minimum:
+            raise ValueError(f"{key} must be >= {minimum}, got {value!r}")
+        return int(value) if integer else float(value)
+
+    checked = {}
+    for key, value in changes.items():
+        if key == 'families':
+            names = value.split() if isinstance(value, str) else []
+            if not names or any(name not in FAMILIES for name in names):
+                raise ValueError(f"families must be names from {', '.join(FAMILIES)}, got {value!r}")
+            checked[key] = ' '.join(names)
+        elif key == 'nthreads':
+            checked[key] = number(key, value, 1, integer=True)
+        elif key == 'quad_decimate':
+            checked[key] = number(key, value, DECIMATE_LADDER[0])
+            if checked[key] not in DECIMATE_LADDER:
+                raise ValueError(f"{key} must be one of {', '.join(f'{d:g}' for d in DECIMATE_LADDER)}, got {value!r}")
+        elif key in ('quad_sigma', 'decode_sharpening'):
+            checked[key] = number(key, value, 0.0)
+        elif key in ('refine_edges', 'debug'):
+            if value not in (0, 1):
+                raise ValueError(f"{key} must be 0 or 1, got {value!r}")
+            checked[key] = int(value)
+        else:
+            raise ValueError(f"Unknown detector setting: {key}")
+    return checked
+
+
+def tune_detector(detector, **changes):
+    """
+    Change settings of a pupil_apriltags Detector in place. Rebuilding the detector
+    takes tens of ms (a visible hitch); the C detector reads these fields on every
+    detect() and recreates its worker pool when nthreads changes.
+    """
+    for key, value in changes.items():
+        if key not in TUNABLE:
+            raise ValueError(f"{key} cannot be changed on a live detector")
+        setattr(detector.tag_detector_ptr.contents, key, value)
+        detector.params[key] = value
+
+
+def cpu_headroom():
+    """Idle cores according to the 1 minute load average (assume all idle where unavailable)."""
+    cores = os.cpu_count() or 1
+    try:
+        return cores - os.getloadavg()[0]
+    except (AttributeError, OSError):
+        return cores
+
+
+class AdaptiveDetectorTuner:
+    """
+    Keeps AprilTag detection inside the frame budget.
+
+    Every `window` frames the 90th percentile of the detect stage (from the tracker's
+    metrics) is compared with budget / target_fps. Over budget it degrades one step,
+    cheapest loss first: more detector threads if cores are idle, then the next
+    coarser quad_decimate on DECIMATE_LADDER (within decimate_range), then (with ROI tracking) fewer full-frame detections. Well under
+    budget it restores accuracy in the opposite order. A degrade step that did not
+    make detection at least `min_gain` faster is reverted and that knob is left
+    alone until the load changes, so accuracy is never given away for nothing.
+    Every change is logged.
+    """
+
+    def __init__(self, tracker, target_fps=30, budget=0.8, headroom=0.5, window=30,
+                 decimate_range=(1.0, 2.0), threads_range=(1, os.cpu_count() or 1),
+                 full_frame_range=None, min_gain=0.1):
+        self.tracker = tracker
+        self.target_fps = target_fps
+        self.budget = budget  # share of the frame period detection may use
+        self.headroom = headroom  # improve only when p90 is below headroom * budget
+        self.window = window
+        self.decimate_ladder = [d for d in DECIMATE_LADDER if decimate_range[0] <= d <= decimate_range[1]]
+        self.threads_range = threads_range
+
+        roi = getattr(tracker, 'roi_detector', None)
+        base = roi.full_frame_interval if roi is not None else None
+        self.full_frame_range = full_frame_range or ((base, 4 * base) if base else None)
+
+        self.min_gain = min_gain
+        self.frames = 0
+        self.changes = []  # (frame, setting, old, new, p90 seconds)
+        self.last_step = None  # (setting, old value, p90 before) of the last degrade step
+        self.no_gain = set()  # settings whose last degrade step did not help
+
+    @property
+    def frame_budget(self):
+        return self.budget / self.target_fps
+
+    def update(self):
+        """Call once per frame after detection."""
+        self.frames += 1
+        if self.frames % self.window:
+            return
+        stats = self.tracker.metrics.stats.get('detect')
+        if stats is None:
+            return
+        with self.tracker.metrics.lock:
+            samples = list(stats.samples)[-self.window:]
+        p90 = np.percentile(samples, 90)
+
+        last_step, self.last_step = self.last_step, None
+        if last_step is not None:
+            key, old, before = last_step
+            if p90 > (1 - self.min_gain) * before:
+                # The last step did not pay off: undo it and try the next knob
+                self.no_gain.add(key)
+                self.apply(key, old, p90)
+                return
+
+        if p90 > self.frame_budget:
+            self.degrade(p90)
+        elif p90 < self.headroom * self.frame_budget:
+            self.no_gain.clear()
+            self.improve(p90)
+
+    def degrade(self, p90):
+        config = self.tracker.detector_config
+        roi = getattr(self.tracker, 'roi_detector', None)
+        if ('nthreads' not in self.no_gain and config['nthreads'] < self.threads_range[1]
+                and cpu_headroom() >= 1):
+            self.step('nthreads', config['nthreads'] + 1, p90)
+        elif 'quad_decimate' not in self.no_gain and self.coarser(config['quad_decimate']) is not None:
+            self.step('quad_decimate', self.coarser(config['quad_decimate']), p90)
+        elif ('full_frame_interval' not in self.no_gain and self.full_frame_range
+              and roi.full_frame_interval < self.full_frame_range[1]):
+            self.step('full_frame_interval', min(self.full_frame_range[1], roi.full_frame_interval * 2), p90)
+
+    def coarser(self, decimate):
+        """Next rung of the decimate ladder above `decimate`, None at the top."""
+        return next((d for d in self.decimate_ladder if d > decimate), None)
+
+    def finer(self, decimate):
+        """Next rung of the decimate ladder below `decimate`, None at the bottom."""
+        return next((d for d in reversed(self.decimate_ladder) if d < decimate), None)
+
+    def step(self, key, value, p90):
+        self.last_step = (key, self.current(key), p90)
+        self.apply(key, value, p90)
+
+    def current(self, key):
+        if key == 'full_frame_interval':
+            return self.tracker.roi_detector.full_frame_interval
+        return self.tracker.detector_config[key]
+
+    def apply(self, key, value, p90):
+        if key == 'full_frame_interval':
+            self.set_full_frame_interval(value, p90)
+        else:
+            self.set(key, value, p90)
+
+    def improve(self, p90):
+        config = self.tracker.detector_config
+        roi = getattr(self.tracker, 'roi_detector', None)
+        if self.full_frame_range and roi.full_frame_interval > self.full_frame_range[0]:
+            self.set_full_frame_interval(max(self.full_frame_range[0], roi.full_frame_interval // 2), p90)
+        elif self.finer(config['quad_decimate']) is not None:
+            self.set('quad_decimate', self.finer(config['quad_decimate']), p90)
+        elif config['nthreads'] > self.threads_range[0] and cpu_headroom() < 1:
+            # Fast enough and the box is busy: give a core back
+            self.set('nthreads', config['nthreads'] - 1, p90)
+
+    def set(self, key, value, p90):
+        old = self.tracker.detector_config[key]
+        value = round(value, 3) if isinstance(value, float) else value
+        self.tracker.configure_detector(**{key: value})
+        self.log(key, old, value, p90)
+
+    def set_full_frame_interval(self, value, p90):
+        roi = self.tracker.roi_detector
+        old, roi.full_frame_interval = roi.full_frame_interval, value
+        self.log('full_frame_interval', old, value, p90)
+
+    def log(self, key, old, new, p90):
+        self.changes.append((self.frames, key, old, new, p90))
+        self.tracker.metrics.count('detector_changes')
+        print(f"Adaptive detector: detect p90 {p90 * 1000:.1f} ms, budget {self.frame_budget * 1000:.1f} ms "
+              f"-> {key} {old} -> {new}")
@@ -0,0 +1,174 @@
+import argparse
+import importlib
+import time
+import numpy as np
+from frame_sources import SyntheticSource, hsv_range_to_bgr, open_source, parse_size
+from pipeline import StageStats
+from publisher import parse_endpoint
+from tiled_detection import parse_tiles
+
+
+def make_source(args, shape_colors=()):
+    if args.source.startswith('synthetic'):
+        _, _, n_tags = args.source.partition(':')
+        # Tags and shapes keep their size relative to the frame at higher resolutions
+        scale = args.size[0] / 640
+        return SyntheticSource(int(n_tags) if n_tags else 4, shape_colors=shape_colors, frames=args.frames,
+                               size=args.size, tag_size=int(48 * scale), shape_size=int(70 * scale),
+                               fps=30 if args.realtime else None, shape_style=args.shapes)
+    return open_source(args.source, realtime=args.realtime)
+
+
+def make_tracker(name, args):
+    """Return (tracker, source, stage functions) for one tracker, running headless."""
+    endpoints = args.endpoint or []
+    if name == 'apriltag':
+        from AprilTag import AprilTagTracker
+        source = make_source(args)
+        tracker = AprilTagTracker(source=source, endpoints=endpoints, adaptive_fps=args.adaptive,
+                                  tiles=args.tiles, tile_overlap=args.tile_overlap)
+
+        def step(img, stats, timestamp):
+            start = time.perf_counter()
+            img, results = tracker.detect(img)
+            mid = time.perf_counter()
+            tracker.publish(img.shape, results, timestamp)
+            stats['detect'].add(mid - start)
+            stats['publish'].add(time.perf_counter() - mid)
+            return [(r.tag_id, r.center) for r in results]
+
+        return tracker, source, ['detect', 'publish'], step
+
+    if name == 'apriltag_ekf':
+        from AprilTag_with_EKF import AprilTagTracker
+        source = make_source(args)
+        tracker = AprilTagTracker(source=source, endpoints=endpoints, roi_tracking=args.roi,
+                                  motion_model=args.motion_model, adaptive_fps=args.adaptive,
+                                  tiles=args.tiles, tile_overlap=args.tile_overlap)
+
+        def step(img, stats, timestamp):
+            start = time.perf_counter()
+            img, results = tracker.detect(img)
+            t1 = time.perf_counter()
+            tag_ids, states, flags = tracker.filter(results, timestamp)
+            t2 = time.perf_counter()
+            tracker.publish(img.shape, tag_ids, states, timestamp, flags)
+            stats['detect'].add(t1 - start)
+            stats['filter'].add(t2 - t1)
+            stats['publish'].add(time.perf_counter() - t2)
+            return [(r.tag_id, r.center) for r in results]
+
+        return tracker, source, ['detect', 'filter', 'publish'], step
+
+    if name == 'color':
+        module = importlib.import_module('Color_Detection(main)')
+        colors = [hsv_range_to_bgr(v) for v in (module.hsvVals1, module.hsvVals2, module.hsvVals3, module.hsvVals4)]
+        source = make_source(args, shape_colors=colors)
+        tracker = module.ColorShapeTracker(source=source, endpoints=endpoints)
+
+        def step(img, stats, timestamp):
+            start = time.perf_counter()
+            img, blobs, objects = tracker.detect(img)
+            t1 = time.perf_counter()
+            shape_ids, states, flags = tracker.filter(objects, timestamp)
+            t2 = time.perf_counter()
+            tracker.publish(img.shape, shape_ids, states, timestamp, flags)
+            stats['detect'].add(t1 - start)
+            stats['filter'].add(t2 - t1)
+            stats['publish'].add(time.perf_counter() - t2)
+            return list(zip((objects['cls'] + 1).tolist(), objects['center']))
+
+        return tracker, source, ['detect', 'filter', 'publish'], step
+
+    raise ValueError(f"Unknown tracker {name}")
+
+
+def run(name, args):
+    tracker, source, stages, step = make_tracker(name, args)
+    stats = {'capture': StageStats(args.frames)}
+    for stage in stages:
+        stats[stage] = StageStats(args.frames)
+    stats['total'] = StageStats(args.frames)
+    kind = 'shape' if name == 'color' else 'tag'
+
+    frames = 0
+    detections = 0
+    truth_count = 0
+    matched = 0
+    start = time.perf_counter()
+    while frames < args.frames:
+        t0 = time.perf_counter()
+        img = tracker.read_frame()
+        if img is None:
+            break
+        t1 = time.perf_counter()
+        stats['capture'].add(t1 - t0)
+        found = step(img, stats, time.time())
+        stats['total'].add(time.perf_counter() - t1)
+        frames += 1
+        detections += len(found)
+
+        # Ground truth of synthetic scenes: a detection matches if it is close enough
+        truth = [(i, x, y) for k, i, x, y, _ in getattr(source, 'truth', []) if k == kind]
+        truth_count += len(truth)
+        for i, x, y in truth:
+            if any(d_id == i and np.hypot(c[0] - x, c[1] - y) < args.match_radius for d_id, c in found):
+                matched += 1
+    elapsed = time.perf_counter() - start
+    tracker.cleanup()
+
+    return {
+        'frames': frames,
+        'fps': frames / elapsed if elapsed else 0.0,
+        'detections_per_frame': detections / frames if frames else 0.0,
+        'recall': matched / truth_count if truth_count else None,
+        'stages': {stage: s.summary() for stage, s in stats.items()},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless throughput benchmark of the trackers.")
+    parser.add_argument('--tracker', nargs='+', default=['apriltag', 'apriltag_ekf', 'color'],
+                        choices=['apriltag', 'apriltag_ekf', 'color'], help='Trackers to run')
+    parser.add_argument('--source', default='synthetic:8',
+                        help='synthetic[:n_tags], camera[:index], a video file or an image folder')
+    parser.add_argument('--frames', type=int, default=300, help='Number of frames per tracker')
+    parser.add_argument('--size', type=parse_size, default=(640, 480), metavar='WxH',
+                        help='Resolution of the synthetic frames')
+    parser.add_argument('--shapes', choices=['regular', 'irregular'], default='regular',
+                        help='Synthetic colour shapes: regular polygons or irregular / stretched ones')
+    parser.add_argument('--realtime', action='store_true', help='Replay at native speed instead of unthrottled')
+    parser.add_argument('--roi', action='store_true', help='Use ROI tracking in apriltag_ekf')
+    parser.add_argument('--adaptive', type=float, metavar='FPS',
+                        help='Adaptive detector tuning of the AprilTag trackers for this target FPS')
+    parser.add_argument('--motion-model', choices=['static', 'cv', 'bicycle'], default='static',
+                        help='EKF motion model of apriltag_ekf')
+    parser.add_argument('--tiles', type=parse_tiles, metavar='CxR',
+                        help='Tiled detection on a process pool in the AprilTag trackers, e.g. 2x2')
+    parser.add_argument('--tile-overlap', type=int, default=128, help='Pixels shared by neighbouring tiles')
+    parser.add_argument('--endpoint', action='append', type=parse_endpoint,
+                        help='Also publish to name=host:port[@rate][/csv] (default: no network output)')
+    parser.add_argument('--match-radius', type=float, default=15.0,
+                        help='Pixel radius for matching detections to synthetic ground truth')
+    args = parser.parse_args()
+    if args.roi and args.tiles:
+        parser.error("--roi and --tiles cannot be combined")
+
+    for name in args.tracker:
+        result = run(name, args)
+        recall = f"{result['recall'] * 100:.1f}%" if result['recall'] is not None else "n/a"
+        print(f"{name}: {result['frames']} frames, {result['fps']:.1f} FPS, "
+              f"{result['detections_per_frame']:.2f} detections/frame, recall {recall}")
+        for stage, s in result['stages'].items():
+            if 'p50_ms' in s:
+                print(f"  {stage:<8} p50 {s['p50_ms']:7.2f} ms  p95 {s['p95_ms']:7.2f} ms  p99 {s['p99_ms']:7.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
+
+
+# Example (no camera needed)
+# python benchmark.py --source synthetic:8 --frames 500
+# python benchmark.py --tracker apriltag_ekf --source D:\Chess_images --roi
+# python benchmark.py --tracker apriltag --size 1920x1080 --tiles 2x2 --tile-overlap 200
@@ -0,0 +1,325 @@
+import numpy as np
+from EKF import BatchExtendedKalmanFilter, ConstantVelocityModel
+from telemetry import TAG_PREDICTED
+
+# Cost of a pair outside the gate in the assignment matrix
+NO_MATCH = 1e9
+
+
+def linear_assignment(cost):
+    """
+    Minimum cost assignment of a (n, m) cost matrix (Hungarian method with potentials,
+    O(n² m)), the same result as scipy.optimize.linear_sum_assignment.
+    Returns (rows, cols) of the matched pairs, sorted by row.
+    """
+    cost = np.asarray(cost, dtype=np.float64)
+    transposed = cost.shape[0] > cost.shape[1]
+    if transposed:
+        cost = cost.T
+    n, m = cost.shape
+    u = np.zeros(n + 1)
+    v = np.zeros(m + 1)
+    p = np.zeros(m + 1, dtype=np.intp)  # row (1-based) matched to each column, 0 = free
+    way = np.zeros(m + 1, dtype=np.intp)
+
+    for i in range(1, n + 1):
+        # Shortest augmenting path from row i, one column per step
+        p[0] = i
+        j0 = 0
+        minv = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+        while p[j0] != 0:
+            used[j0] = True
+            i0 = p[j0]
+            free = ~used[1:]
+            reduced = cost[i0 - 1] - u[i0] - v[1:]
+            better = free & (reduced < minv[1:])
+            minv[1:][better] = reduced[better]
+            way[1:][better] = j0
+            candidates = np.where(free, minv[1:], np.inf)
+            j1 = int(np.argmin(candidates)) + 1
+            delta = candidates[j1 - 1]
+            u[p[used]] += delta
+            v[used] -= delta
+            minv[1:][free] -= delta
+            j0 = j1
+        while j0:
+            j1 = way[j0]
+            p[j0] = p[j1]
+            j0 = j1
+
+    cols = np.flatnonzero(p[1:])
+    rows = p[1:][cols] - 1
+    if transposed:
+        rows, cols = cols, rows
+    order = np.argsort(rows)
+    return rows[order], cols[order]
+
+
+class SpatialGrid:
+    """
+    Uniform grid over the image with the detections of one frame binned by (class,
+    cell), so the candidates of a track are found by looking at the few cells its gate
+    overlaps instead of comparing it with every blob.
+    """
+
+    def __init__(self, cell_size=64):
+        self.cell_size = cell_size
+        self.cells = {}
+        self.points = np.empty((0, 2))
+
+    def build(self, points, classes):
+        self.points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        self.cells = {}
+        keys = np.floor(self.points / self.cell_size).astype(np.int64)
+        for i, (k, (cx, cy)) in enumerate(zip(np.asarray(classes).tolist(), keys.tolist())):
+            self.cells.setdefault((k, cx, cy), []).append(i)
+
+    def query(self, cls, point, radius):
+        """Indices and distances of the detections of class `cls` within `radius` of `point`."""
+        x0, y0 = np.floor((np.asarray(point) - radius) / self.cell_size).astype(int)
+        x1, y1 = np.floor((np.asarray(point) + radius) / self.cell_size).astype(int)
+        found = [i for cx in range(x0, x1 + 1) for cy in range(y0, y1 + 1) for i in self.cells.get((cls, cx, cy), ())]
+        if not found:
+            return np.empty(0, dtype=np.intp), np.empty(0)
+        found = np.array(found, dtype=np.intp)
+        distance = np.hypot(*(self.points[found] - point).T)
+        inside = distance <= radius
+        return found[inside], distance[inside]
+
+
+class BlobTracker:
+    """
+    Identity over time for the colour / shape blobs of ContourAnalyzer.
+
+    Every track has its own slot in a constant velocity BatchExtendedKalmanFilter, and
+    the blobs of a frame are associated to the predicted positions of the tracks of
+    their colour. The gate is on the Mahalanobis distance of the predicted position
+    (chi-square, 2 degrees of freedom: 13.8 keeps 99.9 % of the true blobs), so it is
+    a few pixels wide for a steady track and opens up while one coasts, up to
+    `max_radius` pixels. A SpatialGrid gives the pairs inside the gate, pairs that do
+    not compete with any other are matched directly and the few contested groups are
+    solved with the Hungarian method. A blob heading is only known modulo its
+    symmetry (360 / sides for a regular polygon), so it is unwrapped to the closest
+    equivalent of the predicted heading before the update.
+
+    Unmatched blobs start tentative tracks, confirmed after `min_hits` detections; a
+    tentative track that misses a frame is dropped, so noise never gets published. A
+    confirmed track coasts on its prediction for `max_coast_frames` frames (flagged
+    TAG_PREDICTED), then is kept for `recovery_frames` frames as lost: a new blob of
+    the same colour within `recovery_radius` of where it was resumes the same track.
+    A resumed track is tentative again until it has `min_hits` new detections (a
+    stray blob near a lost car must not take its place), then gets its history back.
+
+    Each colour is one car (shape type = ID), so update() returns one pose per colour:
+    the confirmed track of that colour with the most detections.
+    """
+
+    def __init__(self, gate=13.8, min_hits=3, max_coast_frames=5, recovery_frames=60, recovery_radius=150.0,
+                 max_radius=80.0, accel_noise=2000.0, R=None):
+        self.gate = gate
+        self.max_radius = max_radius
+        self.min_hits = min_hits
+        self.max_coast_frames = max_coast_frames
+        self.recovery_frames = recovery_frames
+        self.recovery_radius = recovery_radius
+        # Blob centroids are noisier than tag centers and the heading of a contour more so
+        self.kalman = BatchExtendedKalmanFilter(model=ConstantVelocityModel(accel_noise),
+                                                R=np.diag([4.0, 4.0, 25.0]) if R is None else R)
+        self.grid = SpatialGrid(cell_size=32)
+
+        # Track ID -> colour class, detections so far, consecutive misses
+        self.cls = {}
+        self.hits = {}
+        self.misses = {}
+        self.lost = {}  # track ID -> (class, last position, hits, frame it was lost)
+        self.resumed = {}  # tentative resumed track ID -> its lost entry
+        self.next_id = 1
+        self.frame = 0
+        self.births = 0
+        self.deaths = 0
+        self.recovered = 0
+        self.contested = 0  # association groups that needed the Hungarian method
+        self.primary = {}  # colour class -> published track ID
+
+    @property
+    def tracks(self):
+        return list(self.cls)
+
+    def confirmed(self):
+        return [t for t in self.cls if self.hits[t] >= self.min_hits]
+
+    def associate(self, track_ids, predicted, covariances, classes, centers):
+        """
+        Matched (track index, detection index) pairs of one frame. predicted: (M, 2)
+        positions of the tracks, covariances: (M, 2, 2) of their innovation.
+        """
+        self.grid.build(centers, classes)
+        if not len(track_ids):
+            return []
+        # Largest axis of each gate ellipse bounds the grid query
+        a, b, c = covariances[:, 0, 0], covariances[:, 0, 1], covariances[:, 1, 1]
+        major = (a + c) / 2 + np.sqrt(((a - c) / 2) ** 2 + b ** 2)
+        radii = np.minimum(np.sqrt(self.gate * major), self.max_radius)
+        inverse = np.linalg.inv(covariances)
+
+        pairs = []
+        for i, track_id in enumerate(track_ids):
+            found, _ = self.grid.query(self.cls[track_id], predicted[i], radii[i])
+            if len(found):
+                residual = centers[found] - predicted[i]
+                distance = np.einsum('ni,ij,nj->n', residual, inverse[i], residual)
+                inside = distance <= self.gate
+                pairs += [(i, j, d) for j, d in zip(found[inside].tolist(), distance[inside].tolist())]
+        if not pairs:
+            return []
+
+        # Connected groups of competing pairs (union-find over tracks and detections)
+        parent = {}
+
+        def root(node):
+            while parent.setdefault(node, node) != node:
+                parent[node] = parent[parent[node]]
+                node = parent[node]
+            return node
+
+        for i, j, _ in pairs:
+            parent[root(('t', i))] = root(('d', j))
+        groups = {}
+        for pair in pairs:
+            groups.setdefault(root(('t', pair[0])), []).append(pair)
+
+        matches = []
+        for group in groups.values():
+            if len(group) == 1:
+                matches.append(group[0][:2])
+                continue
+            self.contested += 1
+            rows = sorted({i for i, _, _ in group})
+            cols = sorted({j for _, j, _ in group})
+            cost = np.full((len(rows), len(cols)), NO_MATCH)
+            for i, j, d in group:
+                cost[rows.index(i), cols.index(j)] = d
+            for r, c in zip(*linear_assignment(cost)):
+                if cost[r, c] < NO_MATCH:
+                    matches.append((rows[r], cols[c]))
+        return matches
+
+    def update(self, objects, timestamp=None):
+        """
+        objects: ContourAnalyzer blobs of one frame (cls, center, heading, symmetry).
+        Returns (ids, states (M, 3) [x, y, heading], flags (M,)) of the published
+        tracks, with the shape type (class + 1) as ID.
+        """
+        self.frame += 1
+        classes = np.asarray(objects['cls'])
+        centers = np.asarray(objects['center'], dtype=np.float64).reshape(-1, 2)
+        headings = np.asarray(objects['heading'], dtype=np.float64)
+        symmetry = np.asarray(objects['symmetry'], dtype=np.float64)
+
+        track_ids = self.tracks
+        if track_ids:
+            predicted, P = self.kalman.predict_with_covariance(track_ids, timestamp)
+            covariances = P[:, :2, :2] + self.kalman.R[:2, :2]
+        else:
+            predicted, covariances = np.empty((0, 3)), np.empty((0, 2, 2))
+        matches = self.associate(track_ids, predicted[:, :2], covariances, classes, centers)
+
+        updated_ids, measurements = [], []
+        matched = set()
+        for i, j in matches:
+            track_id = track_ids[i]
+            heading = headings[j]
+            if symmetry[j] > 0:
+                # Closest heading equivalent under the blob's symmetry
+                period = symmetry[j]
+                heading = predicted[i, 2] + (heading - predicted[i, 2] + period / 2) % period - period / 2
+            else:
+                heading = predicted[i, 2]  # round blob: no heading information
+            updated_ids.append(track_id)
+            measurements.append((centers[j, 0], centers[j, 1], heading % 360))
+            matched.add(j)
+            self.hits[track_id] += 1
+            self.misses[track_id] = 0
+            if track_id in self.resumed and self.hits[track_id] >= self.min_hits:
+                self.hits[track_id] += self.resumed.pop(track_id)[2]
+                self.recovered += 1
+
+        # Unmatched blobs resume a lost track of their colour nearby, or start a new one
+        for j in range(len(centers)):
+            if j in matched:
+                continue
+            track_id = self._recover(classes[j], centers[j])
+            if track_id is None:
+                track_id = self.next_id
+                self.next_id += 1
+                self.births += 1
+            self.hits[track_id] = 1
+            self.cls[track_id] = int(classes[j])
+            self.misses[track_id] = 0
+            updated_ids.append(track_id)
+            measurements.append((centers[j, 0], centers[j, 1], headings[j]))
+
+        states = {}
+        if updated_ids:
+            for track_id, state in zip(updated_ids, self.kalman.predict_and_update(updated_ids, measurements, timestamp)):
+                states[track_id] = state
+
+        # Missed tracks: tentative ones are dropped, confirmed ones coast and then get lost
+        for i, track_id in enumerate(track_ids):
+            if track_id in states or track_id not in self.cls:
+                continue
+            self.misses[track_id] += 1
+            if track_id in self.resumed:
+                # Not the lost car after all, it stays lost
+                self.lost[track_id] = self.resumed.pop(track_id)
+                self._remove(track_id, died=False)
+            elif self.hits[track_id] < self.min_hits:
+                self._remove(track_id)
+            elif self.misses[track_id] > self.max_coast_frames:
+                self.lost[track_id] = (self.cls[track_id], predicted[i, :2], self.hits[track_id], self.frame)
+                self._remove(track_id)
+        for track_id, (_, _, _, frame) in list(self.lost.items()):
+            if self.frame - frame > self.recovery_frames:
+                del self.lost[track_id]
+
+        return self._published(states, timestamp)
+
+    def _recover(self, cls, center):
+        best, best_distance = None, self.recovery_radius
+        for track_id, (lost_cls, position, _, _) in self.lost.items():
+            distance = np.hypot(*(center - position))
+            if lost_cls == cls and distance <= best_distance:
+                best, best_distance = track_id, distance
+        if best is not None:
+            # Same ID, the filter restarts from the new blob
+            self.resumed[best] = self.lost.pop(best)
+        return best
+
+    def _remove(self, track_id, died=True):
+        del self.cls[track_id], self.misses[track_id], self.hits[track_id]
+        self.kalman.remove(track_id)
+        self.deaths += died
+
+    def _published(self, states, timestamp):
+        # Oldest confirmed track of each colour
+        primary = {}
+        for track_id in self.confirmed():
+            cls = self.cls[track_id]
+            if cls not in primary or self.hits[track_id] > self.hits[primary[cls]]:
+                primary[cls] = track_id
+        self.primary = primary
+        if not primary:
+            return [], np.empty((0, 3)), np.zeros(0, dtype=np.uint8)
+
+        classes = sorted(primary)
+        track_ids = [primary[cls] for cls in classes]
+        coasting = [t for t in track_ids if t not in states]
+        predicted = dict(zip(coasting, self.kalman.predict_states(coasting, timestamp))) if coasting else {}
+        poses = np.array([states[t] if t in states else predicted[t] for t in track_ids]).reshape(-1, 3)
+        flags = np.array([TAG_PREDICTED if t in predicted else 0 for t in track_ids], dtype=np.uint8)
+        return [cls + 1 for cls in classes], poses, flags
+
+    def format_stats(self):
+        return (f"tracks {len(self.cls)} (confirmed {len(self.confirmed())}, lost {len(self.lost)})  "
+                f"births {self.births}  deaths {self.deaths}  recovered {self.recovered}  contested {self.contested}")
@@ -0,0 +1,223 @@
+import argparse
+import json
+import os
+import time
+import cv2
+import numpy as np
+from undistortion import Undistorter
+from track_plane import world_lut as build_world_lut
+
+# A calibration bundle is a folder, every array is a .npy file memory-mapped on load:
+#   meta.json               version, resolution, alpha, reprojection error, ...
+#   camera_matrix.npy       intrinsics of the raw frames
+#   dist_coeffs.npy
+#   new_camera_matrix.npy   camera matrix of the undistorted frames
+#   map1.npy, map2.npy      fixed-point remap tables (CV_16SC2) for the resolution
+#   homography.npy          optional, undistorted pixels -> track plane
+#   world_lut.npy           optional, track plane (x, y) of every raw pixel, lens correction included (see track_plane.py)
+BUNDLE_VERSION = 1
+DEFAULT_BUNDLE = 'calibration'
+
+# Calibration of the original 640x480 webcam, used when there is no bundle
+DEFAULT_CAMERA_MATRIX = np.array([[644.76561694, 0, 331.26266442],
+                                  [0, 645.89528116, 215.92835909],
+                                  [0, 0, 1]])
+DEFAULT_DIST_COEFFS = np.array([0.06830215, -0.14315368, -0.01151178, 0.00780322, 0.03096726])
+DEFAULT_RESOLUTION = (640, 480)
+
+
+class CalibrationBundle:
+    """
+    Everything the trackers need to know about one camera: intrinsics, the resolution
+    they are valid for, the undistorted camera matrix, precomputed remap tables and
+    the track-plane homography (and its lookup table). Loading memory-maps the arrays, so startup does no
+    map computation and only touches the pages remap actually reads.
+    """
+
+    def __init__(self, camera_matrix, dist_coeffs, resolution=None, new_camera_matrix=None, maps=None,
+                 homography=None, meta=None, path=None, world_lut=None):
+        self.camera_matrix = np.asarray(camera_matrix, dtype=np.float64)
+        self.dist_coeffs = np.asarray(dist_coeffs, dtype=np.float64).ravel()
+        self.resolution = tuple(int(v) for v in resolution) if resolution is not None else None
+        self.new_camera_matrix = self.camera_matrix if new_camera_matrix is None else np.asarray(new_camera_matrix, dtype=np.float64)
+        self.maps = maps
+        self.homography = None if homography is None else np.asarray(homography, dtype=np.float64)
+        self.world_lut = world_lut
+        self.meta = meta or {}
+        self.path = path
+
+    @classmethod
+    def build(cls, camera_matrix, dist_coeffs, resolution, alpha=None, homography=None, world_lut=False, **meta):
+        """
+        Compute the new camera matrix and remap tables for `resolution` (width, height).
+        alpha=None keeps the camera matrix (same pixels as cv2.undistort); 0..1 uses
+        getOptimalNewCameraMatrix (0: only valid pixels, 1: all source pixels kept).
+        world_lut: also precompute the track-plane lookup table of the homography.
+        """
+        camera_matrix = np.asarray(camera_matrix, dtype=np.float64)
+        dist_coeffs = np.asarray(dist_coeffs, dtype=np.float64).ravel()
+        resolution = (int(resolution[0]), int(resolution[1]))
+        if alpha is None:
+            new_camera_matrix = camera_matrix
+        else:
+            new_camera_matrix, _ = cv2.getOptimalNewCameraMatrix(camera_matrix, dist_coeffs, resolution, alpha, resolution)
+        maps = cv2.initUndistortRectifyMap(camera_matrix, dist_coeffs, None, new_camera_matrix, resolution, cv2.CV_16SC2)
+        meta = dict(meta, alpha=alpha)
+        bundle = cls(camera_matrix, dist_coeffs, resolution, new_camera_matrix, maps, homography, meta)
+        if world_lut and homography is not None:
+            bundle.world_lut = build_world_lut(bundle.homography, resolution, bundle.undistorter())
+        return bundle
+
+    def save(self, path):
+        if self.resolution is None or self.maps is None:
+            raise ValueError("Only a bundle built for a resolution can be saved, use CalibrationBundle.build()")
+        os.makedirs(path, exist_ok=True)
+        self._save_array(path, 'camera_matrix', self.camera_matrix)
+        self._save_array(path, 'dist_coeffs', self.dist_coeffs)
+        self._save_array(path, 'new_camera_matrix', self.new_camera_matrix)
+        self._save_array(path, 'map1', self.maps[0])
+        self._save_array(path, 'map2', self.maps[1])
+        self._save_array(path, 'homography', self.homography)
+        self._save_array(path, 'world_lut', self.world_lut)
+
+        # meta.json last: a bundle without it is incomplete
+        meta = dict(self.meta, version=BUNDLE_VERSION, resolution=list(self.resolution),
+                    homography=self.homography is not None, world_lut=self.world_lut is not None, created=time.strftime('%Y-%m-%d %H:%M:%S'))
+        with open(os.path.join(path, 'meta.json'), 'w') as f:
+            json.dump(meta, f, indent=2)
+        self.meta, self.path = meta, path
+        return self
+
+    @staticmethod
+    def _save_array(path, name, array):
+        file = os.path.join(path, f"{name}.npy")
+        if array is None:
+            if os.path.exists(file):
+                os.remove(file)
+        elif _mapped_file(array) != os.path.abspath(file):
+            # An array memory-mapped from this very file is already saved (rewriting it would truncate the mapping)
+            np.save(file, array)
+
+    @classmethod
+    def load(cls, path):
+        """Memory-map a bundle folder and check that its parts fit together."""
+        meta_file = os.path.join(path, 'meta.json')
+        if not os.path.isfile(meta_file):
+            raise ValueError(f"{path} is not a calibration bundle (no meta.json)")
+        with open(meta_file) as f:
+            meta = json.load(f)
+        if meta.get('version') != BUNDLE_VERSION:
+            raise ValueError(f"{path}: unsupported bundle version {meta.get('version')}")
+
+        def array(name):
+            return np.load(os.path.join(path, f"{name}.npy"), mmap_mode='r')
+
+        width, height = meta['resolution']
+        camera_matrix, new_camera_matrix = array('camera_matrix'), array('new_camera_matrix')
+        dist_coeffs = array('dist_coeffs')
+        maps = (array('map1'), array('map2'))
+        homography = array('homography') if meta.get('homography') else None
+        lut = array('world_lut') if meta.get('world_lut') else None
+
+        if camera_matrix.shape != (3, 3) or new_camera_matrix.shape != (3, 3):
+            raise ValueError(f"{path}: camera matrices must be 3x3")
+        if dist_coeffs.ndim != 1 or len(dist_coeffs) not in (4, 5, 8, 12, 14):
+            raise ValueError(f"{path}: invalid distortion coefficients {dist_coeffs.shape}")
+        if maps[0].shape != (height, width, 2) or maps[0].dtype != np.int16 or maps[1].shape != (height, width):
+            raise ValueError(f"{path}: remap tables do not match the {width}x{height} resolution")
+        if homography is not None and homography.shape != (3, 3):
+            raise ValueError(f"{path}: homography must be 3x3")
+        if lut is not None and (homography is None or lut.shape != (height, width, 2)):
+            raise ValueError(f"{path}: track plane lookup table does not match the {width}x{height} resolution")
+        return cls(camera_matrix, dist_coeffs, (width, height), new_camera_matrix, maps, homography, meta, path, lut)
+
+    def undistorter(self):
+        """Undistorter for this camera, using the precomputed maps when there are any."""
+        undistorter = Undistorter(self.camera_matrix, self.dist_coeffs, new_camera_matrix=self.new_camera_matrix,
+                                  resolution=self.resolution)
+        if self.maps is not None:
+            undistorter.set_maps(self.resolution, self.maps)
+        return undistorter
+
+    def describe(self):
+        size = f"{self.resolution[0]}x{self.resolution[1]}" if self.resolution else "any resolution"
+        source = self.path or "built-in calibration"
+        return f"{source}: {size}, fx {self.camera_matrix[0, 0]:.1f} fy {self.camera_matrix[1, 1]:.1f}, " \
+               f"homography {'no' if self.homography is None else 'with lookup table' if self.world_lut is not None else 'yes'}"
+
+
+def _mapped_file(array):
+    """File an array (or the array it is a view of) is memory-mapped from, else None."""
+    while array is not None:
+        if isinstance(array, np.memmap) and array.filename:
+            return os.path.abspath(array.filename)
+        array = getattr(array, 'base', None)
+    return None
+
+
+def load_calibration(path=None):
+    """
+    The bundle at `path`, else ./calibration when it exists, else the built-in
+    calibration of the original webcam (maps built on first use, no resolution check).
+    """
+    if path is None and os.path.isfile(os.path.join(DEFAULT_BUNDLE, 'meta.json')):
+        path = DEFAULT_BUNDLE
+    if path is not None:
+        return CalibrationBundle.load(path)
+    return CalibrationBundle(DEFAULT_CAMERA_MATRIX, DEFAULT_DIST_COEFFS)
+
+
+def main():
+    # Imported here, only the command line needs them
+    from frame_sources import parse_size
+    from track_plane import load_homography
+
+    parser = argparse.ArgumentParser(description="Build or inspect a camera calibration bundle.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    build = sub.add_parser('build', help='Build a bundle folder')
+    build.add_argument('out', nargs='?', default=DEFAULT_BUNDLE, help='Bundle folder to write')
+    build.add_argument('--calibration', help='.npz from camera_calibration.py (default: built-in 640x480 calibration)')
+    build.add_argument('--resolution', type=parse_size, metavar='WxH',
+                       help='Capture resolution (default: the calibration image size, else 640x480)')
+    build.add_argument('--alpha', type=float, help='Optimal new camera matrix with this alpha (default: keep the camera matrix)')
+    build.add_argument('--homography', help='Image -> track plane homography (.npy or .npz), in undistorted pixels')
+    build.add_argument('--lut', action='store_true', help='Also store the dense pixel -> track plane lookup table')
+    show = sub.add_parser('show', help='Print a bundle')
+    show.add_argument('path', nargs='?', default=DEFAULT_BUNDLE)
+    args = parser.parse_args()
+
+    if args.command == 'show':
+        bundle = CalibrationBundle.load(args.path)
+        print(bundle.describe())
+        print(json.dumps(bundle.meta, indent=2))
+        return
+
+    resolution = args.resolution
+    meta = {}
+    if args.calibration:
+        with np.load(args.calibration) as calibration:
+            camera_matrix, dist_coeffs = calibration['camera_matrix'], calibration['dist_coefficients']
+            # Older files have neither; (0, 0) / NaN when unknown
+            if resolution is None and 'image_size' in calibration and calibration['image_size'].all():
+                resolution = tuple(int(v) for v in calibration['image_size'])
+            if 'reprojection_error' in calibration and np.isfinite(calibration['reprojection_error']):
+                meta['reprojection_error'] = float(calibration['reprojection_error'])
+        meta['calibration'] = os.path.abspath(args.calibration)
+    else:
+        camera_matrix, dist_coeffs = DEFAULT_CAMERA_MATRIX, DEFAULT_DIST_COEFFS
+    homography = load_homography(args.homography) if args.homography else None
+
+    bundle = CalibrationBundle.build(camera_matrix, dist_coeffs, resolution or DEFAULT_RESOLUTION, args.alpha,
+                                     homography, args.lut, **meta).save(args.out)
+    print(f"Wrote {bundle.describe()}")
+
+
+if __name__ == "__main__":
+    main()
+
+
+# Example
+# python camera_calibration.py                                   (writes camera_calibration.npz)
+# python calibration_bundle.py build calibration --calibration camera_calibration.npz --homography track_H.npy --lut
+# python track_plane.py chessboard board_on_track.png --bundle calibration --lut    (or calibrate the homography later)
+# python AprilTag_with_EKF.py --calibration calibration          (./calibration is also picked up by default)
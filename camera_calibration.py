@@ -1,7 +1,53 @@
 import numpy as np
 import cv2
 import glob
+import hashlib
 import os
+from concurrent.futures import ProcessPoolExecutor
+from undistortion import Undistorter
+from calibration_bundle import CalibrationBundle
+
+
+def file_hash(fname):
+    with open(fname, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def find_corners(fname, checkerboard_size):
+    """Chessboard corners of one image, run in the worker processes. Returns (corners or None, image size or None)."""
+    img = cv2.imread(fname, cv2.IMREAD_GRAYSCALE)
+    if img is None:
+        return None, None
+    ret, corners = cv2.findChessboardCorners(img, checkerboard_size, None)
+    return (corners if ret else None), img.shape[::-1]
+
+
+def _find_corners(job):
+    return find_corners(*job)
+
+
+def project_points(objp, rvecs, tvecs, camera_matrix, dist_coeffs):
+    """
+    cv2.projectPoints for all views at once: objp (N, 3), rvecs/tvecs (M, 3).
+    Returns (M, N, 2). Uses the default 5 coefficient model (k1, k2, p1, p2, k3).
+    """
+    R = np.array([cv2.Rodrigues(np.asarray(r, dtype=np.float64))[0] for r in rvecs])
+    X = objp[None] @ R.transpose(0, 2, 1) + np.asarray(tvecs, dtype=np.float64).reshape(-1, 1, 3)
+    x = X[..., 0] / X[..., 2]
+    y = X[..., 1] / X[..., 2]
+
+    k = np.zeros(5)
+    d = np.ravel(dist_coeffs)[:5]
+    k[:len(d)] = d
+    k1, k2, p1, p2, k3 = k
+    r2 = x * x + y * y
+    radial = 1 + r2 * (k1 + r2 * (k2 + r2 * k3))
+    xd = x * radial + 2 * p1 * x * y + p2 * (r2 + 2 * x * x)
+    yd = y * radial + p1 * (r2 + 2 * y * y) + 2 * p2 * x * y
+
+    fx, fy = camera_matrix[0, 0], camera_matrix[1, 1]
+    cx, cy = camera_matrix[0, 2], camera_matrix[1, 2]
+    return np.stack((fx * xd + cx, fy * yd + cy), axis=-1)
 
 class CameraCalibration:
     def __init__(self, checkerboard_size=(8,5), square_size=0.025):
@@ -13,8 +59,67 @@ class CameraCalibration:
         self.camera_matrix = None
         self.dist_coefficients = None
         self.reprojection_error = None
+        self.image_size = None
+        self.undistorter = None
+        self.per_image_errors = {}
+        self.dropped_images = []
+
+    def cache_key(self, digest):
+        return f"{digest}_{self.checkerboard_size[0]}x{self.checkerboard_size[1]}"
+
+    def load_corner_cache(self, cache_file):
+        if not cache_file or not os.path.exists(cache_file):
+            return {}
+        with np.load(cache_file) as data:
+            return {key: data[key] for key in data.files}
+
+    def detect_corners(self, images, workers=None, cache_file=None):
+        """
+        Chessboard corners for every image, detected across a process pool.
+        Results are cached on disk keyed by file hash and checkerboard size, so
+        re-runs only process new or changed images. Returns {fname: (corners, size)}
+        with corners None when no chessboard was found.
+        """
+        cache = self.load_corner_cache(cache_file)
+        keys = {fname: self.cache_key(file_hash(fname)) for fname in images}
+
+        found = {}
+        todo = []
+        for fname in images:
+            key = keys[fname]
+            if key + '_size' in cache:
+                corners = cache[key]
+                found[fname] = (corners if corners.size else None, tuple(int(v) for v in cache[key + '_size']))
+            else:
+                todo.append(fname)
+        print(f"Corners cached for {len(found)} images, detecting {len(todo)}")
 
-    def calibrate(self, images_folder):
+        if todo:
+            jobs = [(fname, self.checkerboard_size) for fname in todo]
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                results = pool.map(_find_corners, jobs, chunksize=max(1, len(jobs) // (4 * (workers or os.cpu_count() or 1))))
+                for fname, (corners, size) in zip(todo, results):
+                    if size is None:
+                        print(f"Error loading image: {fname}")
+                        continue
+                    found[fname] = (corners, size)
+                    key = keys[fname]
+                    cache[key] = corners if corners is not None else np.empty(0, np.float32)
+                    cache[key + '_size'] = np.array(size)
+            if cache_file:
+                np.savez(cache_file, **cache)
+
+        return found
+
+    def calibrate(self, images_folder, workers=None, use_cache=True, show=False,
+                  drop_outliers=True, outlier_factor=2.0, min_images=5):
+        """
+        workers: size of the corner detection process pool (None = one per CPU).
+        use_cache: keep detected corners in <images_folder>/corner_cache.npz.
+        show: draw the detected corners of every image (pauses 500 ms per image).
+        drop_outliers: recalibrate without the images whose reprojection error is
+        above outlier_factor times the median, as long as min_images remain.
+        """
         
         # Prepare object points
         objp = np.zeros((self.checkerboard_size[0] * self.checkerboard_size[1], 3), np.float32)
@@ -36,91 +141,121 @@ class CameraCalibration:
         if not images:
             raise ValueError(f"No calibration images found in {images_folder}")
 
+        images = sorted(images)
+        cache_file = os.path.join(images_folder, 'corner_cache.npz') if use_cache else None
+        detections = self.detect_corners(images, workers, cache_file)
+
+        image_size = None
+        used = []  # image name of every entry in objpoints/imgpoints
         for fname in images:
-            try:
-                # Read image in grayscale
-                img = cv2.imread(fname, cv2.IMREAD_GRAYSCALE)
-                
-                if img is None:
-                    print(f"Error loading image: {fname}")
-                    continue
-
-                # Find chessboard corners
-                ret, corners = cv2.findChessboardCorners(img, self.checkerboard_size, None)
-
-                # If corners found, add object points and image points
-                if ret:
-                    objpoints.append(objp)
-                    imgpoints.append(corners)
-
-                    # Optional: Draw and display corners
-                    img_color = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
-                    cv2.drawChessboardCorners(img_color, self.checkerboard_size, corners, ret)
-                    cv2.imshow('Chessboard Corners', img_color)
-                    cv2.waitKey(500)
-                else:
-                    print(f"No chessboard corners found in {fname}")
-
-            except Exception as e:
-                print(f"Error processing {fname}: {e}")
+            if fname not in detections:
+                continue
+            corners, size = detections[fname]
+            if corners is None:
+                print(f"No chessboard corners found in {fname}")
+                continue
+            if image_size is None:
+                image_size = size
+            elif size != image_size:
+                print(f"Skipping {fname}: size {size} differs from {image_size}")
+                continue
+            objpoints.append(objp)
+            imgpoints.append(corners)
+            used.append(fname)
+
+            # Optional: Draw and display corners
+            if show:
+                img_color = cv2.imread(fname)
+                cv2.drawChessboardCorners(img_color, self.checkerboard_size, corners, True)
+                cv2.imshow('Chessboard Corners', img_color)
+                cv2.waitKey(500)
+        if show:
+            cv2.destroyAllWindows()
 
         # Ensure we have valid points
         if len(objpoints) == 0 or len(imgpoints) == 0:
             raise ValueError("No valid calibration images found. Check your images and checkerboard size.")
 
         # Calibrate camera
-        ret, camera_matrix, dist_coeffs, rvecs, tvecs = cv2.calibrateCamera(
-            objpoints, imgpoints, img.shape[::-1], None, None
-        )
+        camera_matrix, dist_coeffs, errors = self._calibrate(objp, imgpoints, image_size)
 
-        # Calculate reprojection error
-        total_error = 0
-        for i in range(len(objpoints)):
-            imgpoints2, _ = cv2.projectPoints(
-                objpoints[i], rvecs[i], tvecs[i], 
-                camera_matrix, dist_coeffs
-            )
-            error = cv2.norm(imgpoints[i], imgpoints2, cv2.NORM_L2) / len(imgpoints2)
-            total_error += error
+        # Drop images that do not agree with the rest and calibrate again
+        self.dropped_images = []
+        if drop_outliers:
+            keep = errors <= outlier_factor * np.median(errors)
+            if not keep.all() and keep.sum() >= min_images:
+                self.dropped_images = [f for f, k in zip(used, keep) if not k]
+                print(f"Dropping {len(self.dropped_images)} outlier images: {self.dropped_images}")
+                used = [f for f, k in zip(used, keep) if k]
+                imgpoints = [p for p, k in zip(imgpoints, keep) if k]
+                camera_matrix, dist_coeffs, errors = self._calibrate(objp, imgpoints, image_size)
 
         # Store calibration results
         self.camera_matrix = camera_matrix
         self.dist_coefficients = dist_coeffs
-        self.reprojection_error = total_error / len(objpoints)
-
-        # Close windows
-        cv2.destroyAllWindows()
+        self.per_image_errors = dict(zip(used, errors.tolist()))
+        self.reprojection_error = float(errors.mean())
+        self.image_size = image_size
+        self.undistorter = None
 
         return {
             'camera_matrix': self.camera_matrix,
             'dist_coefficients': self.dist_coefficients,
-            'reprojection_error': self.reprojection_error
+            'reprojection_error': self.reprojection_error,
+            'per_image_errors': self.per_image_errors,
+            'dropped_images': self.dropped_images
         }
 
+    def _calibrate(self, objp, imgpoints, image_size):
+        """Calibrate on the given views and return (camera matrix, distortion, per-image errors)."""
+        ret, camera_matrix, dist_coeffs, rvecs, tvecs = cv2.calibrateCamera(
+            [objp] * len(imgpoints), imgpoints, image_size, None, None
+        )
+
+        # Reprojection error of all views at once (same L2 norm / point count as before)
+        projected = project_points(objp, np.reshape(rvecs, (-1, 3)), np.reshape(tvecs, (-1, 3)),
+                                   camera_matrix, dist_coeffs)
+        observed = np.asarray(imgpoints, dtype=np.float64).reshape(projected.shape)
+        errors = np.sqrt(((observed - projected) ** 2).sum(axis=(1, 2))) / objp.shape[0]
+        return camera_matrix, dist_coeffs, errors
+
     def undistort_image(self, image):
         
         if self.camera_matrix is None:
             raise ValueError("Calibration not performed. Run calibrate() first.")
         
-        return cv2.undistort(
-            image, 
-            self.camera_matrix, 
-            self.dist_coefficients
-        )
+        # Remap tables are built on first use and reused for every later image
+        if self.undistorter is None:
+            self.undistorter = Undistorter(self.camera_matrix, self.dist_coefficients)
+        return self.undistorter.undistort(image)
 
-    def save_calibration(self, output_file='camera_calibration.npz'):
+    def save_calibration(self, output_file='camera_calibration.npz', save_maps=False):
         
         np.savez(
             output_file, 
             camera_matrix=self.camera_matrix, 
-            dist_coefficients=self.dist_coefficients
+            dist_coefficients=self.dist_coefficients,
+            image_size=np.array(self.image_size if self.image_size is not None else (0, 0)),
+            reprojection_error=np.nan if self.reprojection_error is None else self.reprojection_error
         )
 
+        # Optionally persist the undistortion maps for the calibration resolution
+        if save_maps and self.image_size is not None:
+            Undistorter(self.camera_matrix, self.dist_coefficients, output_file).save_maps(self.image_size)
+
+    def save_bundle(self, path='calibration', homography=None, alpha=None):
+        """Write a calibration bundle (intrinsics, maps, homography) the trackers load at startup."""
+        if self.camera_matrix is None or self.image_size is None:
+            raise ValueError("Calibration not performed. Run calibrate() first.")
+        return CalibrationBundle.build(self.camera_matrix, self.dist_coefficients, self.image_size, alpha, homography,
+                                       reprojection_error=self.reprojection_error).save(path)
+
     def load_calibration(self, calibration_file='camera_calibration.npz'):
         
         calibration = np.load(calibration_file)
         self.camera_matrix = calibration['camera_matrix']
         self.dist_coefficients = calibration['dist_coefficients']
+        self.undistorter = Undistorter(self.camera_matrix, self.dist_coefficients, calibration_file)
 
 # Example usage
 def main():
@@ -142,9 +277,14 @@ def main():
         print("\nDistortion Coefficients:")
         print(results['dist_coefficients'])
         print(f"\nReprojection Error: {results['reprojection_error']}")
+        worst = sorted(results['per_image_errors'].items(), key=lambda e: e[1], reverse=True)[:5]
+        print("Worst images:")
+        for fname, error in worst:
+            print(f"  {os.path.basename(fname)}: {error:.4f}")
 
-        # Save calibration
-        calibrator.save_calibration()
+        # Save calibration, and the bundle the trackers load at startup
+        calibrator.save_calibration(save_maps=True)
+        calibrator.save_bundle()
 
     except Exception as e:
         print(f"Calibration failed: {e}")
@@ -1,10 +1,18 @@
+import argparse
 import cv2
 import os
+from frame_sources import open_source
 
+parser = argparse.ArgumentParser(description="Save camera frames with 'x', quit with 'q'")
+parser.add_argument('--source', help='Instead of the webcam, e.g. shm:minicars to share the camera with the trackers')
+args = parser.parse_args()
 
-cap = cv2.VideoCapture(1, cv2.CAP_DSHOW)
-cap.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
+if args.source:
+    cap = open_source(args.source)
+else:
+    cap = cv2.VideoCapture(1, cv2.CAP_DSHOW)
+    cap.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
+    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
 
 # Folder to save images
 save_path = 'D:\Chess_images'
@@ -15,6 +23,8 @@ count = 1
 while True:
     # Capture frame-by-frame
     ret, frame = cap.read()
+    if not ret:
+        break
     
     # Display the frame
     cv2.imshow('Camera', frame)
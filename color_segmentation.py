@@ -0,0 +1,38 @@
+import cv2
+import numpy as np
+
+
+class MultiColorSegmenter:
+    """
+    Classifies every pixel against all configured HSV ranges in one pass.
+
+    The HSV ranges are axis-aligned boxes, so membership separates per channel:
+    one lookup table per channel holds a bit per colour class, and
+    H_lut[h] & S_lut[s] & V_lut[v] gives the classes of a pixel exactly.
+    The BGR->HSV conversion and the lookups run once per frame, whatever the
+    number of colours (up to 8 in a uint8 label image, up to 31 in int32).
+
+    hsv_vals: list of cvzone-style dicts {'hmin', 'smin', 'vmin', 'hmax', 'smax', 'vmax'}
+    """
+
+    def __init__(self, hsv_vals):
+        if len(hsv_vals) > 31:
+            raise ValueError("At most 31 colour classes are supported")
+        self.hsv_vals = list(hsv_vals)
+        self.dtype = np.uint8 if len(self.hsv_vals) <= 8 else np.int32
+
+        values = np.arange(256)
+        self.luts = [np.zeros(256, dtype=self.dtype) for _ in range(3)]
+        for k, vals in enumerate(self.hsv_vals):
+            bit = self.dtype(1 << k)
+            for lut, (lo, hi) in zip(self.luts, [('hmin', 'hmax'), ('smin', 'smax'), ('vmin', 'vmax')]):
+                lut[(values >= vals[lo]) & (values <= vals[hi])] |= bit
+
+    def segment(self, img):
+        """Return the label image: bit k is set where the pixel is inside hsv_vals[k]."""
+        hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
+        h, s, v = cv2.split(hsv)
+        labels = cv2.LUT(h, self.luts[0])
+        cv2.bitwise_and(labels, cv2.LUT(s, self.luts[1]), dst=labels)
+        cv2.bitwise_and(labels, cv2.LUT(v, self.luts[2]), dst=labels)
+        return labels
@@ -0,0 +1,213 @@
+import cv2
+import numpy as np
+
+
+class ContourAnalyzer:
+    """
+    Shape class, centroid and orientation of every blob of a label image at once, from
+    image moments instead of per-contour fitEllipse calls.
+
+    One connectedComponents pass over the union of all colours labels the regions (no
+    contour tracing), their areas come from one np.bincount over the foreground pixels
+    and regions too small to hold a car are dropped before any per-blob work. A large
+    region with pixels of more than one class (touching cars of different colours, a
+    blob inside a blob of another colour, speckle) is labelled again per class inside
+    its bounding box. The central moments of the kept blobs are then accumulated with
+    np.bincount over their pixels (as complex sums of z = dx + i*dy), so the cost
+    depends on the number of pixels, not on the number of contours. Only the outline of
+    a kept blob is traced, for its number of sides: the vertices of approxPolyDP at
+    `epsilon` times the perimeter, as in the original detect_shape, so irregular and
+    stretched polygons count like regular ones.
+
+    For an elongated blob the principal axis comes from the second order moment and the
+    sign of the third order moment along it (the side with the longer tail) gives the
+    full 0-360 heading. A compact n-sided blob has no principal axis; if it is close to
+    regular, sum z^k = 0 for every k that is not a multiple of n and arg(sum z^n) / n is
+    the direction of a vertex, known modulo 360 / n.
+
+    analyze() returns a dict of arrays, one entry per kept blob, largest first:
+      'cls'        colour class index
+      'area'       pixels
+      'center'     (N, 2) centroid x, y (sub-pixel)
+      'bbox'       (N, 4) x, y, w, h
+      'sides'      3..6 outline vertices, 0 for anything else
+      'heading'    degrees in image coordinates (atan2(dy, dx)), 0-360
+      'symmetry'   heading is only known modulo this many degrees: 360 (full heading),
+                   360 / sides for a compact polygon (vertex direction), 180 for a
+                   symmetric elongated blob, 0 when the blob has no orientation
+      'elongation' 0 for isotropic blobs, towards 1 for a line
+    """
+
+    def __init__(self, n_classes, min_area=1000, connectivity=8, epsilon=0.02, min_turn=30,
+                 min_elongation=0.15, min_skew=0.002):
+        self.n_classes = n_classes
+        self.min_area = min_area
+        self.connectivity = connectivity
+        self.epsilon = epsilon
+        self.min_turn = np.radians(min_turn)
+        self.min_elongation = min_elongation
+        self.min_skew = min_skew
+        self.candidates = 0  # blobs seen before the area filter in the last frame
+
+    def analyze(self, labels):
+        """labels: label image of MultiColorSegmenter.segment() (bit k = colour class k)."""
+        union = labels if labels.dtype == np.uint8 else (labels != 0).astype(np.uint8)
+        n, cc = cv2.connectedComponents(union, connectivity=self.connectivity, ltype=cv2.CV_32S)
+        self.candidates = n - 1
+        pts = cv2.findNonZero(union)
+        if pts is None:
+            return self._empty()
+        pts = pts.reshape(-1, 2).astype(np.int64)
+        region = cc[pts[:, 1], pts[:, 0]]
+
+        # A region smaller than min_area cannot hold a blob larger than that
+        large = np.bincount(region, minlength=n) > self.min_area
+        inside = large[region]
+        pts, region = pts[inside], region[inside]
+        bits = labels[pts[:, 1], pts[:, 0]].astype(np.int64)
+        present = np.zeros(n, dtype=np.int64)
+        np.bitwise_or.at(present, region, bits)
+
+        # Blob key = blob number * n_classes + class. A single-class region is one blob
+        key = region * self.n_classes + np.log2(present[region] & -present[region]).astype(np.int64)
+        mixed = np.flatnonzero(present & (present - 1))
+        if len(mixed):
+            single = (present[region] & (present[region] - 1)) == 0
+            keys, points = [key[single]], [pts[single]]
+            blob_base = n
+            for r in mixed:
+                keys_r, points_r, blob_base = self._split(labels, pts[region == r], bits[region == r], present[r], blob_base)
+                keys += keys_r
+                points += points_r
+            key = np.concatenate(keys)
+            pts = np.concatenate(points)
+        xs, ys = pts[:, 0], pts[:, 1]
+        area = np.bincount(key)
+
+        keep = np.flatnonzero(area > self.min_area)
+        if len(keep) == 0:
+            return self._empty()
+        lut = np.full(len(area), -1, dtype=np.int64)
+        lut[keep] = np.arange(len(keep))
+
+        # Pixels of the kept blobs only
+        blob = lut[key]
+        inside = blob >= 0
+        blob, xs, ys = blob[inside], xs[inside], ys[inside]
+        m = self._moments(blob, xs, ys, area[keep])
+
+        x0 = np.full(len(keep), labels.shape[1])
+        y0 = np.full(len(keep), labels.shape[0])
+        x1 = np.zeros(len(keep), dtype=np.int64)
+        y1 = np.zeros(len(keep), dtype=np.int64)
+        np.minimum.at(x0, blob, xs)
+        np.minimum.at(y0, blob, ys)
+        np.maximum.at(x1, blob, xs)
+        np.maximum.at(y1, blob, ys)
+
+        bbox = np.column_stack((x0, y0, x1 - x0 + 1, y1 - y0 + 1))
+        blobs = {'cls': keep % self.n_classes, 'area': area[keep], 'center': m['center'], 'bbox': bbox}
+        blobs.update(self._shape(m, self._sides(blob, xs, ys, bbox)))
+        order = np.argsort(-blobs['area'], kind='stable')
+        return {key: value[order] for key, value in blobs.items()}
+
+    def _split(self, labels, pts, bits, present, blob_base):
+        """Per-class blobs of one mixed region; a pixel inside several ranges joins a blob of each."""
+        x0, y0 = pts.min(axis=0)
+        x1, y1 = pts.max(axis=0)
+        crop = labels[y0:y1 + 1, x0:x1 + 1]
+        keys, points = [], []
+        for k in range(self.n_classes):
+            bit = 1 << k
+            if not present & bit:
+                continue
+            n, cc = cv2.connectedComponents(cv2.compare(crop & labels.dtype.type(bit), 0, cv2.CMP_GT),
+                                            connectivity=self.connectivity, ltype=cv2.CV_32S)
+            p = pts[(bits & bit) != 0]
+            keys.append((blob_base + cc[p[:, 1] - y0, p[:, 0] - x0]) * self.n_classes + k)
+            points.append(p)
+            blob_base += n
+        return keys, points, blob_base
+
+    def _sides(self, blob, xs, ys, bbox):
+        """Vertex count of the outline of every blob, 0 outside 3..6."""
+        order = np.argsort(blob, kind='stable')
+        bounds = np.searchsorted(blob[order], np.arange(len(bbox) + 1))
+        sides = np.zeros(len(bbox), dtype=int)
+        for i, (x, y, w, h) in enumerate(bbox):
+            p = order[bounds[i]:bounds[i + 1]]
+            mask = np.zeros((h + 2, w + 2), np.uint8)
+            mask[ys[p] - y + 1, xs[p] - x + 1] = 255
+            contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+            hull = cv2.convexHull(max(contours, key=cv2.contourArea))
+            vertices = self._vertices(cv2.approxPolyDP(hull, self.epsilon * cv2.arcLength(hull, True), True))
+            if 3 <= vertices <= 6:
+                sides[i] = vertices
+        return sides
+
+    def _vertices(self, poly):
+        """Vertex count of a convex polygon, without vertices where it turns by less than min_turn."""
+        # Douglas-Peucker can split one pixelated corner into two vertices
+        poly = poly.reshape(-1, 2).astype(float)
+        while len(poly) > 3:
+            edges = np.roll(poly, -1, axis=0) - poly
+            angles = np.arctan2(edges[:, 1], edges[:, 0])
+            turn = np.abs(np.angle(np.exp(1j * (angles - np.roll(angles, 1)))))
+            flat = np.argmin(turn)
+            if turn[flat] >= self.min_turn:
+                break
+            poly = np.delete(poly, flat, axis=0)
+        return len(poly)
+
+    def _moments(self, blob, xs, ys, area):
+        n = len(area)
+        area = area.astype(float)
+        cx = np.bincount(blob, xs, n) / area
+        cy = np.bincount(blob, ys, n) / area
+        z = (xs - cx[blob]) + 1j * (ys - cy[blob])
+
+        def csum(w):
+            return np.bincount(blob, w.real, n) + 1j * np.bincount(blob, w.imag, n)
+
+        z2 = z * z
+        z3 = z2 * z
+        moments = {'center': np.column_stack((cx, cy)), 'm00': area,
+                   'c11': np.bincount(blob, z.real ** 2 + z.imag ** 2, n),  # sum |z|^2
+                   'c21': csum(z2 * z.conj()), 'c2': csum(z2), 'c3': csum(z3)}
+        moments['c4'] = csum(z3 * z)
+        moments['c5'] = csum(z3 * z2)
+        moments['c6'] = csum(z3 * z3)
+        return moments
+
+    def _shape(self, m, sides):
+        m00 = m['m00']
+        elongation = np.abs(m['c2']) / np.maximum(m['c11'], 1e-9)
+
+        heading = np.zeros(len(m00))
+        symmetry = np.zeros(len(m00))
+
+        # Compact polygons: direction of a vertex, modulo 360 / sides
+        for order in (3, 4, 5, 6):
+            sel = (sides == order) & (elongation < self.min_elongation)
+            heading[sel] = np.angle(m[f'c{order}'][sel]) / order
+            symmetry[sel] = 360.0 / order
+
+        # Elongated blobs: principal axis, oriented towards the longer tail
+        sel = elongation >= self.min_elongation
+        theta = np.angle(m['c2'][sel]) / 2
+        # sum over pixels of (projection on the axis)^3, from the complex moments
+        skew = (np.real(m['c3'][sel] * np.exp(-3j * theta)) + 3 * np.real(m['c21'][sel] * np.exp(-1j * theta))) / 4
+        oriented = np.abs(skew) / m00[sel] ** 2.5 > self.min_skew
+        heading[sel] = theta + np.where(skew < 0, np.pi, 0.0)
+        symmetry[sel] = np.where(oriented, 360.0, 180.0)
+
+        period = np.where(symmetry > 0, symmetry, 360.0)
+        heading = np.degrees(heading) % period
+        heading[heading >= period] = 0.0  # -1e-15 % 360 == 360.0
+        heading[symmetry == 0] = 0.0
+        return {'sides': sides, 'heading': heading, 'symmetry': symmetry, 'elongation': elongation}
+
+    def _empty(self):
+        return {'cls': np.zeros(0, int), 'area': np.zeros(0, int), 'center': np.zeros((0, 2)),
+                'bbox': np.zeros((0, 4), int), 'sides': np.zeros(0, int), 'heading': np.zeros(0),
+                'symmetry': np.zeros(0), 'elongation': np.zeros(0)}
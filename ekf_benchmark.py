@@ -0,0 +1,125 @@
+import argparse
+import time
+import tracemalloc
+import numpy as np
+from EKF import ExtendedKalmanFilter, BatchExtendedKalmanFilter
+
+
+def make_frames(n_tags, n_frames, seed=0):
+    # Random walk of n_tags tags in a 640x480 image
+    rng = np.random.default_rng(seed)
+    start = rng.uniform([0, 0, 0], [640, 480, 360], size=(n_tags, 3))
+    steps = rng.normal(0, [2.0, 2.0, 1.0], size=(n_frames, n_tags, 3))
+    frames = start + np.cumsum(steps, axis=0)
+    frames[..., 2] %= 360
+    return frames
+
+
+def time_per_tag(frames, tag_ids):
+    kalman = ExtendedKalmanFilter(dt=1/70)
+    start = time.perf_counter()
+    for measurements in frames:
+        for tag_id, measurement in zip(tag_ids, measurements):
+            kalman.predict_and_update(tag_id, measurement)
+    return (time.perf_counter() - start) / len(frames)
+
+
+def time_batched(frames, tag_ids):
+    kalman = BatchExtendedKalmanFilter(dt=1/70)
+    start = time.perf_counter()
+    for measurements in frames:
+        kalman.predict_and_update(tag_ids, measurements)
+    return (time.perf_counter() - start) / len(frames)
+
+
+def time_update(kalman, measurements, repeat):
+    """Mean time of one predict_and_update of a single tracked tag."""
+    kalman.predict_and_update(0, measurements[0])
+    start = time.perf_counter()
+    for i in range(repeat):
+        kalman.predict_and_update(0, measurements[i % len(measurements)])
+    return (time.perf_counter() - start) / repeat
+
+
+def memory_per_update(kalman, measurements, repeat=200):
+    """Peak temporary memory (bytes) of one update, averaged over `repeat` updates."""
+    kalman.predict_and_update(0, measurements[0])
+    total = 0
+    tracemalloc.start()
+    for i in range(repeat):
+        tracemalloc.reset_peak()
+        current = tracemalloc.get_traced_memory()[0]
+        kalman.predict_and_update(0, measurements[i % len(measurements)])
+        total += tracemalloc.get_traced_memory()[1] - current
+    tracemalloc.stop()
+    return total / repeat
+
+
+def micro_benchmark(repeat):
+    """Single-tag update cost of ExtendedKalmanFilter: original path vs the fast paths."""
+    measurements = list(make_frames(1, 1000)[:, 0])
+    full = ExtendedKalmanFilter(dt=1/70)
+    full.Q = full.Q + 0.01  # non-diagonal Q: exercises the linear solve path
+    full.refresh_model()
+    variants = [
+        ('original (pinv)', ExtendedKalmanFilter(dt=1/70, fast=False)),
+        ('diagonal closed form', ExtendedKalmanFilter(dt=1/70)),
+        ('identity + solve', full),
+    ]
+
+    print(f"{'path':<22} {'update [us]':>12} {'temp memory [B]':>16} {'max diff':>10}")
+    for name, kalman in variants:
+        per_update = time_update(kalman, measurements, repeat)
+        memory = memory_per_update(kalman, measurements)
+
+        # Same noise model, original path, same inputs
+        ref = ExtendedKalmanFilter(dt=1/70, fast=False)
+        ref.Q = kalman.Q
+        fresh = ExtendedKalmanFilter(dt=1/70, fast=kalman.fast)
+        fresh.Q = kalman.Q
+        fresh.refresh_model()
+        diff = max(np.abs(ref.predict_and_update(0, m) - fresh.predict_and_update(0, m)).max()
+                   for m in measurements[:200])
+        print(f"{name:<22} {per_update * 1e6:>12.2f} {memory:>16.0f} {diff:>10.2e}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare per-tag and batched EKF cost per frame.")
+    parser.add_argument('--tags', type=int, nargs='+', default=[1, 2, 5, 10, 20, 50, 100, 200, 500],
+                        help='Numbers of tags to benchmark')
+    parser.add_argument('--frames', type=int, default=200, help='Frames per run')
+    parser.add_argument('--micro', action='store_true',
+                        help='Per-update time and temporary memory of the single-tag filter paths instead')
+    parser.add_argument('--repeat', type=int, default=20000, help='Updates per path with --micro')
+    args = parser.parse_args()
+
+    if args.micro:
+        micro_benchmark(args.repeat)
+        return
+
+    print(f"{'tags':>6} {'per-tag [us]':>14} {'batched [us]':>14} {'speedup':>9} {'max diff':>10}")
+    for n_tags in args.tags:
+        frames = make_frames(n_tags, args.frames)
+        tag_ids = list(range(n_tags))
+
+        per_tag = time_per_tag(frames, tag_ids)
+        batched = time_batched(frames, tag_ids)
+
+        # Both filters must agree on the final states
+        ref = ExtendedKalmanFilter(dt=1/70)
+        batch = BatchExtendedKalmanFilter(dt=1/70)
+        for measurements in frames[:20]:
+            expected = np.array([ref.predict_and_update(t, m) for t, m in zip(tag_ids, measurements)])
+            got = batch.predict_and_update(tag_ids, measurements)
+        diff = np.abs(expected - got).max()
+
+        print(f"{n_tags:>6} {per_tag * 1e6:>14.1f} {batched * 1e6:>14.1f} {per_tag / batched:>8.1f}x {diff:>10.2e}")
+
+
+if __name__ == "__main__":
+    main()
+
+
+# Example
+# python ekf_benchmark.py --tags 1 10 100 500 --frames 200
+# python ekf_benchmark.py --micro
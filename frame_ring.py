@@ -0,0 +1,180 @@
+import argparse
+import time
+import numpy as np
+from multiprocessing import resource_tracker, shared_memory
+
+# Shared memory layout of a frame ring:
+#   header   int64[8]  magic | version | slots | height | width | channels | latest seq | closed
+#   seqs     int64[slots]    sequence number of the frame in each slot (-1 while it is written)
+#   stamps   float64[slots]  capture timestamp (time.time()) of each slot
+#   frames   uint8[slots, height, width, channels]
+MAGIC = 0x4D43464D  # 'MCFM'
+VERSION = 1
+HEADER_LEN = 8
+SLOTS, HEIGHT, WIDTH, CHANNELS, LATEST, CLOSED = 2, 3, 4, 5, 6, 7
+
+# Rings created by a writer of this process (their resource tracker entry is the writer's)
+_owned = set()
+
+
+def _layout(buf, slots=None, shape=None):
+    header = np.ndarray((HEADER_LEN,), np.int64, buf)
+    if slots is None:
+        slots, shape = int(header[SLOTS]), (int(header[HEIGHT]), int(header[WIDTH]), int(header[CHANNELS]))
+    offset = header.nbytes
+    seqs = np.ndarray((slots,), np.int64, buf, offset)
+    offset += seqs.nbytes
+    stamps = np.ndarray((slots,), np.float64, buf, offset)
+    offset += stamps.nbytes
+    frames = np.ndarray((slots,) + tuple(shape), np.uint8, buf, offset)
+    return header, seqs, stamps, frames
+
+
+def ring_size(slots, shape):
+    return 8 * HEADER_LEN + 16 * slots + slots * int(np.prod(shape))
+
+
+class FrameRingWriter:
+    """
+    Single producer side of the ring: owns the shared memory block `name`.
+    Frames are copied in once; every reader then works on views of the same memory.
+    """
+
+    def __init__(self, name, shape, slots=8):
+        shape = tuple(shape) if len(shape) == 3 else tuple(shape) + (1,)
+        self.shm = shared_memory.SharedMemory(name=name, create=True, size=ring_size(slots, shape))
+        self.header, self.seqs, self.stamps, self.frames = _layout(self.shm.buf, slots, shape)
+        self.header[:] = (MAGIC, VERSION, slots, shape[0], shape[1], shape[2], 0, 0)
+        self.seqs[:] = 0
+        self.seq = 0
+        _owned.add(self.shm.name)
+
+    def write(self, frame, timestamp=None):
+        self.seq += 1
+        slot = self.seq % len(self.seqs)
+        # Seqlock: readers ignore a slot whose seq does not match the one they expect
+        self.seqs[slot] = -1
+        self.frames[slot] = frame.reshape(self.frames.shape[1:])
+        self.stamps[slot] = time.time() if timestamp is None else timestamp
+        self.seqs[slot] = self.seq
+        self.header[LATEST] = self.seq
+        return self.seq
+
+    def close(self):
+        self.header[CLOSED] = 1
+        _owned.discard(self.shm.name)
+        del self.header, self.seqs, self.stamps, self.frames
+        self.shm.close()
+        self.shm.unlink()
+
+
+class FrameRingReader:
+    """
+    Zero-copy reader of a ring created by FrameRingWriter (usually in another process).
+
+    read() returns a read-only view of the newest frame, so there is no pickling and
+    no copy. The writer reuses a slot after `slots` frames, so a consumer that needs
+    a frame for longer than that should copy it (copy=True: the copy is checked
+    against the slot sequence, so it is never torn). With views, call intact() once
+    done with the frame and discard the results when it returns False.
+    """
+
+    def __init__(self, name, copy=False, poll_interval=0.0005):
+        self.shm = shared_memory.SharedMemory(name=name)
+        # Readers must not unlink the block when they exit, only the writer owns it
+        if self.shm.name not in _owned:
+            resource_tracker.unregister(self.shm._name, 'shared_memory')
+        self.header, self.seqs, self.stamps, self.frames = _layout(self.shm.buf)
+        if self.header[0] != MAGIC or self.header[1] != VERSION:
+            raise ValueError(f"{name} is not a frame ring")
+        self.frames.flags.writeable = False
+        self.copy = copy
+        self.poll_interval = poll_interval
+        self.last_seq = 0
+        self.skipped = 0  # frames the writer produced that this reader never saw
+        self.seq = 0
+        self.timestamp = None
+
+    @property
+    def shape(self):
+        return self.frames.shape[1:]
+
+    def read(self, timeout=1.0):
+        """Newest frame not read yet: (success, frame). success is False when the writer closed or timed out."""
+        deadline = time.perf_counter() + timeout
+        while True:
+            latest = int(self.header[LATEST])
+            if latest > self.last_seq:
+                slot = latest % len(self.seqs)
+                frame = self.frames[slot]
+                timestamp = float(self.stamps[slot])
+                if self.copy:
+                    frame = frame.copy()
+                if self.seqs[slot] == latest:
+                    break
+                # Overwritten while we looked at it (we are more than a full ring behind): retry
+            elif self.header[CLOSED] or time.perf_counter() > deadline:
+                return False, None
+            else:
+                time.sleep(self.poll_interval)
+
+        if self.last_seq:
+            self.skipped += latest - self.last_seq - 1
+        self.last_seq = self.seq = latest
+        self.timestamp = timestamp
+        if frame.shape[2] == 1:
+            frame = frame[:, :, 0]
+        return True, frame
+
+    def intact(self):
+        """True while the slot of the last read() frame still holds that frame (not reused by the writer)."""
+        return self.seq > 0 and int(self.seqs[self.seq % len(self.seqs)]) == self.seq
+
+    def set(self, prop, value):
+        return False
+
+    def release(self):
+        del self.header, self.seqs, self.stamps, self.frames
+        self.shm.close()
+
+
+def main():
+    # Imported here so readers do not pull in the capture code
+    from frame_sources import open_source
+
+    parser = argparse.ArgumentParser(description="Capture daemon: owns the camera and shares its frames through shared memory.")
+    parser.add_argument('--source', default='camera:1', help='camera[:index[:WxH]], a video file, an image folder or synthetic[:n_tags]')
+    parser.add_argument('--name', default='minicars', help='Shared memory name, readers use --source shm:NAME')
+    parser.add_argument('--slots', type=int, default=8, help='Frames kept in the ring')
+    parser.add_argument('--realtime', action='store_true', help='Replay --source at its native frame rate')
+    args = parser.parse_args()
+
+    source = open_source(args.source, realtime=args.realtime, loop=True)
+    success, frame = source.read()
+    if not success:
+        raise SystemExit(f"Cannot read from {args.source}")
+
+    writer = FrameRingWriter(args.name, frame.shape, args.slots)
+    print(f"Sharing {frame.shape[1]}x{frame.shape[0]} frames as shm:{args.name} ({args.slots} slots)")
+    start = time.perf_counter()
+    try:
+        while success:
+            writer.write(frame)
+            success, frame = source.read()
+    except KeyboardInterrupt:
+        pass
+    elapsed = time.perf_counter() - start
+    print(f"{writer.seq} frames, {writer.seq / elapsed:.1f} FPS")
+    writer.close()
+    source.release()
+
+
+if __name__ == "__main__":
+    main()
+
+
+# Example: one camera, several consumers
+# python frame_ring.py --source camera:1
+# python AprilTag_with_EKF.py --source shm:minicars
+# python "Color_Detection(main).py" --source shm:minicars
+# python capturing_imgs.py --source shm:minicars
@@ -0,0 +1,284 @@
+import glob
+import os
+import sys
+import time
+import cv2
+import numpy as np
+
+# All sources mimic cv2.VideoCapture: read() -> (success, frame), set(), release(),
+# so the trackers can use them in place of the camera.
+
+
+class _Throttle:
+    """Sleeps so that frames are delivered at most at `fps` (None = unthrottled)."""
+
+    def __init__(self, fps=None):
+        self.period = 1.0 / fps if fps else 0.0
+        self.next_time = None
+
+    def wait(self):
+        if not self.period:
+            return
+        now = time.perf_counter()
+        if self.next_time is None:
+            self.next_time = now
+        elif now < self.next_time:
+            time.sleep(self.next_time - now)
+        self.next_time = max(self.next_time + self.period, time.perf_counter() - self.period)
+
+
+class CameraSource:
+    """USB webcam. DirectShow is only used on Windows so the same code runs on Linux."""
+
+    def __init__(self, index=1, width=640, height=480):
+        backend = cv2.CAP_DSHOW if sys.platform == 'win32' else cv2.CAP_ANY
+        self.cap = cv2.VideoCapture(index, backend)
+        self.cap.set(3, width)
+        self.cap.set(4, height)
+
+    def read(self):
+        return self.cap.read()
+
+    def set(self, prop, value):
+        return self.cap.set(prop, value)
+
+    def release(self):
+        self.cap.release()
+
+
+class VideoFileSource:
+    """Replays a video file, at its native frame rate (realtime=True) or as fast as possible."""
+
+    def __init__(self, path, realtime=False, loop=False):
+        self.path = path
+        self.loop = loop
+        self.cap = cv2.VideoCapture(path)
+        if not self.cap.isOpened():
+            raise ValueError(f"Cannot open video {path}")
+        fps = self.cap.get(cv2.CAP_PROP_FPS) or 30
+        self.throttle = _Throttle(fps if realtime else None)
+
+    def read(self):
+        self.throttle.wait()
+        success, img = self.cap.read()
+        if not success and self.loop:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            success, img = self.cap.read()
+        return success, img
+
+    def set(self, prop, value):
+        return False
+
+    def release(self):
+        self.cap.release()
+
+
+class ImageFolderSource:
+    """Replays a folder of images (e.g. the output of capturing_imgs.py) in file name order."""
+
+    def __init__(self, folder, fps=None, loop=False, preload=False):
+        files = []
+        for ext in ['*.jpg', '*.png', '*.jpeg', '*.tif']:
+            files.extend(glob.glob(os.path.join(folder, ext)))
+        if not files:
+            raise ValueError(f"No images found in {folder}")
+        self.files = sorted(files)
+        self.loop = loop
+        self.index = 0
+        self.throttle = _Throttle(fps)
+        # Preloading keeps JPEG decoding out of benchmarks
+        self.frames = [cv2.imread(f) for f in self.files] if preload else None
+
+    def read(self):
+        if self.index >= len(self.files):
+            if not self.loop:
+                return False, None
+            self.index = 0
+        self.throttle.wait()
+        i = self.index
+        self.index += 1
+        img = self.frames[i] if self.frames is not None else cv2.imread(self.files[i])
+        return img is not None, img
+
+    def set(self, prop, value):
+        return False
+
+    def release(self):
+        pass
+
+
+def _paste_rotated(img, patch, center, angle, mask=None):
+    """Draw `patch` rotated by `angle` degrees (counter-clockwise) centred on `center`."""
+    h, w = patch.shape[:2]
+    M = cv2.getRotationMatrix2D((w / 2, h / 2), angle, 1.0)
+    M[:, 2] += (center[0] - w / 2, center[1] - h / 2)
+    height, width = img.shape[:2]
+
+    # Only warp the bounding box of the rotated patch
+    r = int(np.ceil(np.hypot(w, h) / 2)) + 1
+    x0, y0 = max(0, int(center[0]) - r), max(0, int(center[1]) - r)
+    x1, y1 = min(width, int(center[0]) + r + 1), min(height, int(center[1]) + r + 1)
+    if x1 <= x0 or y1 <= y0:
+        return
+    M[:, 2] -= (x0, y0)
+    size = (x1 - x0, y1 - y0)
+    warped = cv2.warpAffine(patch, M, size, flags=cv2.INTER_LINEAR)
+    if mask is None:
+        mask = np.full((h, w), 255, np.uint8)
+    warped_mask = cv2.warpAffine(mask, M, size, flags=cv2.INTER_NEAREST)
+    roi = img[y0:y1, x0:x1]
+    roi[warped_mask > 0] = warped[warped_mask > 0]
+
+
+# Non-regular polygons of each side count, vertices in units of the radius
+IRREGULAR_POLYGONS = {
+    3: [(1.0, 0.0), (-0.9, 0.7), (-0.9, -0.7)],  # isosceles triangle
+    4: [(1.0, 0.1), (0.1, 0.8), (-0.9, 0.5), (-0.6, -0.8)],  # irregular quadrilateral
+    5: [(1.0, 0.0), (0.4, 0.6), (-0.9, 0.6), (-0.9, -0.6), (0.4, -0.6)],  # "house" pentagon
+    6: [(np.cos(a), 0.6 * np.sin(a)) for a in np.arange(6) * np.pi / 3],  # stretched hexagon
+}
+
+
+def _regular_polygon(sides, radius):
+    angles = np.arange(sides) * 2 * np.pi / sides - np.pi / 2
+    return np.column_stack((radius * np.cos(angles), radius * np.sin(angles)))
+
+
+def _irregular_polygon(sides, radius):
+    return radius * np.array(IRREGULAR_POLYGONS[sides])
+
+
+def hsv_range_to_bgr(hsv_vals):
+    """BGR colour in the middle of a cvzone-style HSV range."""
+    hsv = np.uint8([[[(hsv_vals['hmin'] + hsv_vals['hmax']) // 2,
+                      (hsv_vals['smin'] + hsv_vals['smax']) // 2,
+                      (hsv_vals['vmin'] + hsv_vals['vmax']) // 2]]])
+    return tuple(int(c) for c in cv2.cvtColor(hsv, cv2.COLOR_HSV2BGR)[0, 0])
+
+
+class SyntheticSource:
+    """
+    Renders tag36h11 AprilTags and coloured shapes driving around the track image.
+    Useful to benchmark and regression-test the trackers without a camera.
+
+    shape_colors: BGR colour per shape class; shape class k is drawn as a polygon
+    with k + 3 sides (the convention of Color_Detection(main)), regular or, with
+    shape_style='irregular', one of IRREGULAR_POLYGONS.
+    After each read(), `truth` holds the ground truth of the frame as a list of
+    (kind, id, x, y, heading_degrees) with kind 'tag' or 'shape'.
+    """
+
+    def __init__(self, n_tags=4, shape_colors=(), frames=None, size=(640, 480), tag_size=48,
+                 shape_size=70, background='road track drawing.png', fps=None, seed=0, shape_style='regular'):
+        self.n_tags = n_tags
+        self.shape_colors = list(shape_colors)
+        self.frames = frames
+        self.size = size
+        self.index = 0
+        self.throttle = _Throttle(fps)
+        self.fps = fps or 30
+        self.truth = []
+
+        width, height = size
+        bg = cv2.imread(background) if background and os.path.exists(background) else None
+        if bg is None:
+            bg = np.full((height, width, 3), 90, np.uint8)
+        self.background = cv2.resize(bg, size)
+
+        # Tag patches with the white quiet zone the detector needs
+        dictionary = cv2.aruco.getPredefinedDictionary(cv2.aruco.DICT_APRILTAG_36h11)
+        self.tags = []
+        for tag_id in range(n_tags):
+            marker = cv2.aruco.generateImageMarker(dictionary, tag_id, tag_size)
+            border = tag_size // 4
+            marker = cv2.copyMakeBorder(marker, border, border, border, border, cv2.BORDER_CONSTANT, value=255)
+            self.tags.append(cv2.cvtColor(marker, cv2.COLOR_GRAY2BGR))
+
+        self.shapes = []
+        for k, color in enumerate(self.shape_colors):
+            patch = np.zeros((shape_size, shape_size, 3), np.uint8)
+            mask = np.zeros((shape_size, shape_size), np.uint8)
+            polygon = _irregular_polygon if shape_style == 'irregular' else _regular_polygon
+            poly = (polygon(k + 3, shape_size * 0.45) + shape_size / 2).astype(np.int32)
+            cv2.fillPoly(patch, [poly], color)
+            cv2.fillPoly(mask, [poly], 255)
+            self.shapes.append((patch, mask))
+
+        # Every object drives on its own ellipse around the image centre
+        rng = np.random.default_rng(seed)
+        n = n_tags + len(self.shapes)
+        self.phase = rng.uniform(0, 2 * np.pi, n)
+        self.speed = rng.uniform(0.3, 0.8, n) * rng.choice([-1, 1], n)  # rad/s
+        self.radius = np.column_stack((rng.uniform(0.2, 0.42, n) * width, rng.uniform(0.2, 0.38, n) * height))
+
+    def pose(self, i, t):
+        cx, cy = self.size[0] / 2, self.size[1] / 2
+        a = self.phase[i] + self.speed[i] * t
+        x = cx + self.radius[i, 0] * np.cos(a)
+        y = cy + self.radius[i, 1] * np.sin(a)
+        # Heading along the direction of motion (image y points down)
+        dx = -self.radius[i, 0] * np.sin(a) * self.speed[i]
+        dy = self.radius[i, 1] * np.cos(a) * self.speed[i]
+        return x, y, np.degrees(np.arctan2(dy, dx)) % 360
+
+    def read(self):
+        if self.frames is not None and self.index >= self.frames:
+            return False, None
+        self.throttle.wait()
+        t = self.index / self.fps
+        self.index += 1
+
+        img = self.background.copy()
+        self.truth = []
+        for tag_id, patch in enumerate(self.tags):
+            x, y, heading = self.pose(tag_id, t)
+            _paste_rotated(img, patch, (x, y), -heading)
+            self.truth.append(('tag', tag_id, x, y, heading))
+        for k, (patch, mask) in enumerate(self.shapes):
+            x, y, heading = self.pose(self.n_tags + k, t)
+            _paste_rotated(img, patch, (x, y), -heading, mask)
+            self.truth.append(('shape', k + 1, x, y, heading))
+        return True, img
+
+    def set(self, prop, value):
+        return False
+
+    def release(self):
+        pass
+
+
+def parse_size(text):
+    """"WxH" (e.g. "1920x1080") -> (width, height)."""
+    width, sep, height = text.lower().partition('x')
+    if not sep or not width.isdigit() or not height.isdigit():
+        raise ValueError(f"Invalid size '{text}', expected WxH, e.g. 1920x1080")
+    return int(width), int(height)
+
+
+def open_source(spec, realtime=False, loop=False, frames=None):
+    """
+    Build a frame source from a command line string:
+    "camera[:index[:WxH]]", "synthetic[:n_tags]", "shm:name[:view]" (frame_ring.py capture daemon,
+    frames are copied out of the ring unless :view asks for zero-copy views),
+    a recorded session folder (session_recorder.py), a video file or an image folder.
+    """
+    if spec.startswith('shm:'):
+        from frame_ring import FrameRingReader
+        # The pipelined trackers and the display keep a frame for longer than the ring
+        # holds it under load, so they get copies; views are for consumers that check intact()
+        name, _, mode = spec[4:].partition(':')
+        return FrameRingReader(name, copy=mode != 'view')
+    if os.path.isfile(os.path.join(spec, 'meta.json')):
+        from session_recorder import RecordingSource
+        return RecordingSource(spec, realtime=realtime, loop=loop)
+    if spec.startswith('camera'):
+        _, _, rest = spec.partition(':')
+        index, _, size = rest.partition(':')
+        width, height = parse_size(size) if size else (640, 480)
+        return CameraSource(int(index) if index else 1, width, height)
+    if spec.startswith('synthetic'):
+        _, _, n_tags = spec.partition(':')
+        return SyntheticSource(int(n_tags) if n_tags else 4, frames=frames, fps=30 if realtime else None)
+    if os.path.isdir(spec):
+        return ImageFolderSource(spec, fps=30 if realtime else None, loop=loop)
+    return VideoFileSource(spec, realtime=realtime, loop=loop)
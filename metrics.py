@@ -0,0 +1,269 @@
+import cProfile
+import io
+import json
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from pipeline import StageStats
+
+
+class _StageTimer:
+    """Context manager returned by Metrics.time(), a plain class is cheaper than a generator."""
+    __slots__ = ('metrics', 'stage', 'start')
+
+    def __init__(self, metrics, stage):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.add(self.stage, time.perf_counter() - self.start)
+        return False
+
+
+class SamplingProfiler:
+    """
+    Samples the Python stacks of all threads (sys._current_frames) from a background
+    thread, so capture, pipeline and display threads are all covered and nothing
+    has to be enabled on the tracking thread itself.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.leaf = Counter()  # samples where the function was running
+        self.total = Counter()  # samples where the function was on the stack
+        self.samples = 0
+
+    def run(self, seconds):
+        me = threading.get_ident()
+        end = time.perf_counter() + seconds
+        while time.perf_counter() < end:
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == me:
+                    continue
+                thread = names.get(thread_id, str(thread_id))
+                seen = set()
+                leaf = True
+                while frame is not None:
+                    code = frame.f_code
+                    key = f"[{thread}] {code.co_filename}:{code.co_firstlineno}({code.co_name})"
+                    if leaf:
+                        self.leaf[key] += 1
+                        leaf = False
+                    if key not in seen:
+                        self.total[key] += 1
+                        seen.add(key)
+                    frame = frame.f_back
+            self.samples += 1
+            time.sleep(self.interval)
+        return self
+
+    def format(self, top=25):
+        # Percentages are of the samples of the function's own thread
+        lines = [f"{self.samples} samples every {self.interval * 1000:.1f} ms", "",
+                 f"{'self %':>7} {'total %':>8}  [thread] function"]
+        n = max(self.samples, 1)
+        for key, count in self.leaf.most_common(top):
+            lines.append(f"{100 * count / n:>7.1f} {100 * self.total[key] / n:>8.1f}  {key}")
+        return "\n".join(lines)
+
+
+class Metrics:
+    """
+    Low-overhead instrumentation of a tracking loop.
+
+    Stage latencies go into StageStats ring buffers (`with metrics.time('detect'):`),
+    counters into a dict. tick() is called once per frame: it prints a JSON log line
+    every `log_interval` seconds.
+
+    cProfile only sees the thread that enabled it, so an on-demand profile is run by
+    every thread that calls profile_point() once per iteration: tick() does for the
+    frame loop, TrackingPipeline does for its capture and stage threads. Each one
+    profiles itself for the requested time and the parts are merged into one report.
+    """
+
+    def __init__(self, window=500, log_interval=0):
+        self.window = window
+        self.stats = {}
+        self.counters = Counter()
+        self.lock = threading.Lock()
+        self.start_time = time.perf_counter()
+        self.frames = 0
+        self.log_interval = log_interval
+        self.last_log = self.start_time
+
+        # On-demand profiling
+        self.profile_session = None  # (request number, end time) while a profile runs
+        self.profile_requests = 0
+        self.profile_running = set()  # threads with an enabled profiler
+        self.profile_parts = []  # (thread name, profiler) of the threads that are done
+        self.local = threading.local()
+        self.profile_done = threading.Event()
+        self.last_profile = None  # text report of the last profile
+        self.last_profile_file = None
+
+    def time(self, stage):
+        return _StageTimer(self, stage)
+
+    def add(self, stage, seconds):
+        with self.lock:
+            stats = self.stats.get(stage)
+            if stats is None:
+                stats = self.stats[stage] = StageStats(self.window)
+            stats.add(seconds)
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counters[name] += n
+
+    def tick(self):
+        """End of one frame."""
+        self.frames += 1
+        self.profile_point()
+
+        now = time.perf_counter()
+        if self.log_interval and now - self.last_log >= self.log_interval:
+            print(self.to_json())
+            self.last_log = now
+
+    def snapshot(self):
+        with self.lock:
+            stages = {name: s.summary() for name, s in self.stats.items()}
+            counters = dict(self.counters)
+        elapsed = time.perf_counter() - self.start_time
+        return {
+            'time': time.time(),
+            'uptime_s': elapsed,
+            'frames': self.frames,
+            'fps': self.frames / elapsed if elapsed else 0.0,
+            'stages': stages,
+            'counters': counters,
+        }
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), separators=(',', ':'), default=float)
+
+    def request_profile(self, seconds=5.0):
+        """Profile the profile_point() threads for `seconds`; profile_done is set when the report is ready."""
+        now = time.perf_counter()
+        with self.lock:
+            if self.profile_session is not None and now < self.profile_session[1] + 1.0:
+                return  # one at a time, the running one answers
+            # (else a thread that exited while profiling left the last one unfinished)
+            self.profile_done.clear()
+            self.profile_requests += 1
+            self.profile_parts = []
+            self.profile_running = set()
+            self.profile_session = (self.profile_requests, now + seconds)
+
+    def profile_point(self):
+        """Starts / stops the calling thread's part of a requested profile, call it once per iteration."""
+        session, local = self.profile_session, self.local
+        profiler = getattr(local, 'profiler', None)
+        if profiler is not None:
+            if session is None or session[0] != local.session or time.perf_counter() >= session[1]:
+                profiler.disable()
+                local.profiler = None
+                with self.lock:
+                    current = session is not None and session[0] == local.session
+                    if current:
+                        self.profile_parts.append((threading.current_thread().name, profiler))
+                        self.profile_running.discard(threading.get_ident())
+                    done = current and not self.profile_running
+                if done:
+                    self._finish_profile()
+        elif session is not None and getattr(local, 'session', None) != session[0] and time.perf_counter() < session[1]:
+            local.session = session[0]
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                return  # Python 3.12+: the profiler of another thread already sees every thread
+            local.profiler = profiler
+            with self.lock:
+                self.profile_running.add(threading.get_ident())
+
+    def _finish_profile(self):
+        names = [name for name, _ in self.profile_parts]
+        stats = pstats.Stats(self.profile_parts[0][1])
+        for _, profiler in self.profile_parts[1:]:
+            stats.add(profiler)
+        self.last_profile_file = time.strftime('profile_%Y%m%d_%H%M%S.prof')
+        stats.dump_stats(self.last_profile_file)
+        out = io.StringIO()
+        out.write(f"Threads: {', '.join(names)}\n")
+        stats.stream = out
+        stats.sort_stats('cumulative').print_stats(30)
+        self.last_profile = out.getvalue()
+        self.profile_parts = []
+        self.profile_session = None
+        print(f"Profile written to {self.last_profile_file}")
+        self.profile_done.set()
+
+    def sample_profile(self, seconds=5.0, interval=0.005):
+        """Sampling profile of every thread, returned as text. Blocks for `seconds`."""
+        return SamplingProfiler(interval).run(seconds).format()
+
+
+class MetricsServer:
+    """
+    Local HTTP endpoint for a Metrics object, served from a daemon thread:
+      GET /metrics                         JSON snapshot
+      GET /profile?seconds=5               cProfile of the tracking threads, merged (text)
+      GET /profile?seconds=5&mode=sample   sampling profile of all threads (text)
+    """
+
+    def __init__(self, metrics, port=8765, host='127.0.0.1'):
+        self.metrics = metrics
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                query = parse_qs(url.query)
+                if url.path == '/metrics':
+                    self.reply(server.metrics.to_json(), 'application/json')
+                elif url.path == '/profile':
+                    seconds = float(query.get('seconds', ['5'])[0])
+                    if query.get('mode', ['cprofile'])[0] == 'sample':
+                        self.reply(server.metrics.sample_profile(seconds))
+                        return
+                    server.metrics.request_profile(seconds)
+                    if server.metrics.profile_done.wait(seconds + 5):
+                        self.reply(server.metrics.last_profile)
+                    else:
+                        self.send_error(503, 'Tracking loop is not running')
+                else:
+                    self.send_error(404)
+
+            def reply(self, text, content_type='text/plain'):
+                body = text.encode()
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass  # keep the tracker output clean
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name='metrics', daemon=True)
+
+    def start(self):
+        self.thread.start()
+        print(f"Metrics on http://{self.httpd.server_address[0]}:{self.httpd.server_address[1]}/metrics")
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
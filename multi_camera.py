@@ -0,0 +1,251 @@
+import argparse
+import json
+import multiprocessing as mp
+import os
+import queue
+import time
+import cv2
+import numpy as np
+from EKF import BatchExtendedKalmanFilter, ConstantVelocityModel
+from publisher import Publisher, default_endpoints, parse_endpoint
+from track_plane import TrackPlane, load_homography
+
+# Constant velocity filter noise for world-frame states [x, y, θ, vx, vy, ω] (metres, degrees):
+# white acceleration of about 1 m/s² and the pixel model's yaw acceleration
+WORLD_ACCEL_NOISE = 1.0
+WORLD_YAW_ACCEL_NOISE = 5000.0
+WORLD_R = np.diag([4e-4, 4e-4, 4.0])
+WORLD_P0 = np.diag([1e-2, 1e-2, 10.0, 1.0, 1.0, 1e4])
+
+
+def camera_homography(camera):
+    """Homography of a camera config: its 'homography' file, else the one in its calibration bundle (or None)."""
+    if camera.get('homography'):
+        return load_homography(camera['homography'])
+    if camera.get('calibration') and os.path.isdir(camera['calibration']):
+        from calibration_bundle import CalibrationBundle
+        return CalibrationBundle.load(camera['calibration']).homography
+    return None
+
+
+def tag_world_poses(plane, results):
+    """Tag IDs and (N, 3) [x, y, heading degrees] on the track plane (a TrackPlane) for a list of detections."""
+    ids = [r.tag_id for r in results]
+    if not results:
+        return ids, np.empty((0, 3))
+    # Center, top-left and top-right corner of every tag through the homography at once
+    points = np.array([[r.center, r.corners[0], r.corners[1]] for r in results]).reshape(-1, 2)
+    world = plane.to_world(points).reshape(-1, 3, 2)
+    edge = world[:, 2] - world[:, 1]
+    heading = np.degrees(np.arctan2(edge[:, 1], edge[:, 0])) % 360
+    return ids, np.column_stack((world[:, 0], heading))
+
+
+def camera_worker(config, out_queue, stop_event):
+    """
+    One camera in its own process: capture, detect, correct the tag corners with this
+    camera's calibration and map them to the track plane. Only the small per-frame
+    results cross the process boundary.
+    """
+    # Imported here so that spawned processes only load what they need
+    from pupil_apriltags import Detector
+    from frame_sources import open_source
+    from undistortion import Undistorter
+    from calibration_bundle import CalibrationBundle
+
+    source = open_source(config['source'], realtime=config.get('realtime', False))
+    undistorter = None
+    bundle = None
+    if config.get('calibration'):
+        if os.path.isdir(config['calibration']):
+            # Calibration bundle: memory-mapped maps, no map computation at startup
+            bundle = CalibrationBundle.load(config['calibration'])
+            undistorter = bundle.undistorter()
+        else:
+            undistorter = Undistorter.from_calibration_file(config['calibration'])
+    if config.get('homography'):
+        plane = TrackPlane(load_homography(config['homography']))
+    else:
+        plane = TrackPlane.from_bundle(bundle, undistorter)
+
+    detector = Detector(
+        families='tag36h11',
+        nthreads=config.get('nthreads', 2),
+        quad_decimate=1.0,
+        quad_sigma=0.5,
+        refine_edges=1,
+        decode_sharpening=0.0,
+        debug=0
+    )
+
+    seq = 0
+    while not stop_event.is_set():
+        success, img = source.read()
+        if not success:
+            break
+        timestamp = time.time()
+        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        results = detector.detect(gray)
+        if undistorter is not None:
+            undistorter.undistort_detections(results)
+        ids, poses = tag_world_poses(plane, results)
+        seq += 1
+        try:
+            out_queue.put_nowait((config['name'], seq, timestamp, ids, poses))
+        except queue.Full:
+            pass  # fusion is behind: the gap in seq shows up as dropped frames
+    source.release()
+
+
+class WorldFusion:
+    """
+    Merges the per-camera detections into one world-frame state per car.
+    Messages are buffered for `latency_window` seconds and then applied in capture
+    timestamp order, so a tag seen by two cameras at once gets both updates in the
+    right order no matter which process delivered first. The filter is a constant
+    velocity model propagated by the real time between those capture timestamps, so
+    cameras with different or uneven frame rates are fused consistently.
+    """
+
+    def __init__(self, latency_window=0.03):
+        model = ConstantVelocityModel(WORLD_ACCEL_NOISE, WORLD_YAW_ACCEL_NOISE)
+        self.kalman = BatchExtendedKalmanFilter(model=model, R=WORLD_R, P0=WORLD_P0)
+        self.latency_window = latency_window
+        self.pending = []
+        self.last_timestamp = 0.0
+        self.late = 0
+
+    def add(self, timestamp, ids, poses):
+        if timestamp < self.last_timestamp:
+            # Arrived after newer data was already fused
+            self.late += 1
+            return
+        self.pending.append((timestamp, ids, poses))
+
+    def step(self, now=None):
+        """Fuse every buffered message older than the latency window; returns (timestamp, ids, states) or None."""
+        now = time.time() if now is None else now
+        ready = [m for m in self.pending if m[0] <= now - self.latency_window]
+        if not ready:
+            return None
+        self.pending = [m for m in self.pending if m[0] > now - self.latency_window]
+        ready.sort(key=lambda m: m[0])
+
+        updated = {}
+        for timestamp, ids, poses in ready:
+            if len(ids):
+                for tag_id, state in zip(ids, self.kalman.predict_and_update(ids, poses, timestamp)):
+                    updated[tag_id] = state
+        self.last_timestamp = ready[-1][0]
+        if not updated:
+            return self.last_timestamp, [], np.empty((0, 3))
+        return self.last_timestamp, list(updated.keys()), np.array(list(updated.values()))
+
+
+class MultiCameraTracker:
+    """
+    One process per camera, fusion and publishing in the main process.
+    cameras: list of dicts with 'name', 'source', optionally 'calibration' (calibration
+    bundle folder or .npz from CameraCalibration.save_calibration) and 'homography'
+    (image -> track plane, defaults to the one in the bundle). Every camera needs a
+    homography: poses of different cameras can only be fused on the track plane.
+    """
+
+    def __init__(self, cameras, endpoints=None, latency_window=0.03):
+        missing = [c['name'] for c in cameras if camera_homography(c) is None]
+        if missing:
+            raise ValueError(f"No track homography for camera {', '.join(missing)}: give it a 'homography' "
+                             f"file or a calibration bundle with one (see track_plane.py)")
+        self.cameras = cameras
+        self.fusion = WorldFusion(latency_window)
+        self.publisher = Publisher(endpoints if endpoints is not None else default_endpoints(), metric=True)
+        self.queue = mp.Queue(maxsize=8 * len(cameras))
+        self.stop_event = mp.Event()
+        self.processes = []
+        self.frames = {c['name']: 0 for c in cameras}
+        self.dropped = {c['name']: 0 for c in cameras}
+        self.last_seq = {c['name']: 0 for c in cameras}
+
+    def start(self):
+        for config in self.cameras:
+            process = mp.Process(target=camera_worker, args=(config, self.queue, self.stop_event),
+                                 name=config['name'], daemon=True)
+            process.start()
+            self.processes.append(process)
+
+    def stop(self):
+        self.stop_event.set()
+        for process in self.processes:
+            process.join(timeout=2.0)
+            if process.is_alive():
+                process.terminate()
+        self.publisher.close()
+
+    def poll(self, timeout=0.01):
+        """Drain the camera queue, fuse what is ready and publish it."""
+        try:
+            while True:
+                name, seq, timestamp, ids, poses = self.queue.get(timeout=timeout)
+                self.frames[name] += 1
+                self.dropped[name] += max(0, seq - self.last_seq[name] - 1)
+                self.last_seq[name] = seq
+                self.fusion.add(timestamp, ids, poses)
+                timeout = 0
+        except queue.Empty:
+            pass
+
+        fused = self.fusion.step()
+        if fused is not None:
+            timestamp, ids, states = fused
+            if len(ids):
+                # The filter works in degrees, consumers of metric frames get radians
+                states = np.column_stack((states[:, :2], np.radians(states[:, 2]) % (2 * np.pi)))
+            self.publisher.publish(ids, states, timestamp)
+        return fused
+
+    def format_stats(self, elapsed):
+        cams = "  ".join(f"{name}: {self.frames[name] / elapsed:.1f} FPS dropped {self.dropped[name]}"
+                         for name in self.frames)
+        return f"{cams}  late {self.fusion.late}  tracked {len(self.fusion.kalman.slots)}"
+
+    def run(self, report_interval=2.0):
+        self.start()
+        start = last_report = time.perf_counter()
+        try:
+            while any(p.is_alive() for p in self.processes) or not self.queue.empty():
+                self.poll()
+                now = time.perf_counter()
+                if now - last_report > report_interval:
+                    print(self.format_stats(now - start))
+                    print(self.publisher.format_stats())
+                    last_report = now
+        except KeyboardInterrupt:
+            pass
+        print(self.format_stats(time.perf_counter() - start))
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Multi-camera AprilTag tracking fused on the track plane.")
+    parser.add_argument('config', help='JSON list of cameras: [{"name", "source", "calibration", "homography"}, ...]')
+    parser.add_argument('--endpoint', action='append', type=parse_endpoint,
+                        help='Telemetry endpoint name=host:port[@rate][/csv], repeat for several (default: Unity and ESP32)')
+    parser.add_argument('--latency-window', type=float, default=0.03,
+                        help='Seconds to wait for slower cameras before fusing a frame')
+    args = parser.parse_args()
+
+    with open(args.config) as f:
+        cameras = json.load(f)
+    MultiCameraTracker(cameras, args.endpoint, args.latency_window).run()
+
+
+if __name__ == "__main__":
+    main()
+
+
+# Example cameras.json
+# [
+#   {"name": "north", "source": "camera:0", "calibration": "north.npz", "homography": "north_H.npy"},
+#   {"name": "south", "source": "camera:1", "calibration": "south.npz", "homography": "south_H.npy"}
+# ]
+# python multi_camera.py cameras.json
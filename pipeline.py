@@ -0,0 +1,191 @@
+import threading
+import time
+import traceback
+from collections import deque
+import numpy as np
+
+
+class LatestQueue:
+    """
+    Bounded queue that drops the oldest item when full, so a slow consumer
+    always gets the newest frame instead of working through a backlog.
+    """
+
+    def __init__(self, maxsize=1):
+        self.items = deque()
+        self.maxsize = maxsize
+        self.dropped = 0
+        self.cond = threading.Condition()
+
+    def put(self, item):
+        with self.cond:
+            if len(self.items) >= self.maxsize:
+                self.items.popleft()
+                self.dropped += 1
+            self.items.append(item)
+            self.cond.notify()
+
+    def get(self, timeout=None):
+        """Return the oldest queued item, or None if nothing arrived within timeout."""
+        with self.cond:
+            if not self.items:
+                self.cond.wait(timeout)
+            if not self.items:
+                return None
+            return self.items.popleft()
+
+    def __len__(self):
+        return len(self.items)
+
+
+class StageStats:
+    """Ring buffer of the last `window` latencies of one stage, in seconds."""
+
+    def __init__(self, window=500):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+
+    def add(self, seconds):
+        self.samples.append(seconds)
+        self.count += 1
+
+    def summary(self):
+        if not self.samples:
+            return {'count': self.count}
+        ms = np.array(self.samples) * 1000
+        p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+        return {'count': self.count, 'p50_ms': p50, 'p95_ms': p95, 'p99_ms': p99, 'max_ms': ms.max()}
+
+
+class FramePacket:
+    """One camera frame travelling through the pipeline, plus whatever each stage adds to it."""
+
+    def __init__(self, seq, img):
+        self.seq = seq
+        self.capture_time = time.perf_counter()
+        self.timestamp = time.time()
+        self.img = img
+        self.data = {}
+
+
+class TrackingPipeline:
+    """
+    Staged capture -> detect -> (filter) -> publish pipeline.
+
+    capture_fn() returns a frame or None when the source is exhausted.
+    Every stage is a (name, fn) pair where fn(packet) mutates the packet and
+    returns it, or returns None to drop the frame. Each stage runs on its own
+    thread and stages are connected by drop-oldest queues, so the slowest
+    stage always picks up the newest frame. Finished packets end up in
+    `output` (also drop-oldest) for an optional display on the main thread.
+    profile_point, when given, is called once per iteration by every pipeline thread
+    (Metrics.profile_point, so on-demand cProfile runs cover capture and the stages).
+    An exception in any stage stops the whole pipeline (is_running() turns False
+    and `error` tells which stage failed) instead of leaving it running without it.
+    """
+
+    def __init__(self, capture_fn, stages, queue_size=1, profile_point=None):
+        self.capture_fn = capture_fn
+        self.profile_point = profile_point or (lambda: None)
+        self.stages = stages
+        self.queues = [LatestQueue(queue_size) for _ in stages]
+        self.output = LatestQueue(1)
+        self.stats = {'capture': StageStats()}
+        for name, _ in stages:
+            self.stats[name] = StageStats()
+        self.stats['end_to_end'] = StageStats()
+        self.running = threading.Event()
+        self.threads = []
+        self.frames_in = 0
+        self.frames_out = 0
+        self.start_time = None
+        self.error = None  # (stage name, exception) that stopped the pipeline
+
+    def start(self):
+        self.running.set()
+        self.start_time = time.perf_counter()
+        self.threads = [threading.Thread(target=self._capture_loop, name='capture', daemon=True)]
+        for i, (name, fn) in enumerate(self.stages):
+            out_queue = self.queues[i + 1] if i + 1 < len(self.stages) else self.output
+            self.threads.append(threading.Thread(target=self._stage_loop, name=name, daemon=True,
+                                                 args=(name, fn, self.queues[i], out_queue,
+                                                       i + 1 == len(self.stages))))
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self):
+        self.running.clear()
+        for thread in self.threads:
+            thread.join(timeout=1.0)
+
+    def is_running(self):
+        return self.running.is_set()
+
+    def _capture_loop(self):
+        seq = 0
+        while self.running.is_set():
+            self.profile_point()
+            start = time.perf_counter()
+            try:
+                img = self.capture_fn()
+            except Exception as e:
+                traceback.print_exc()
+                self.error = ('capture', e)
+                self.running.clear()
+                break
+            if img is None:
+                self.running.clear()
+                break
+            self.stats['capture'].add(time.perf_counter() - start)
+            self.queues[0].put(FramePacket(seq, img))
+            self.frames_in += 1
+            seq += 1
+
+    def _stage_loop(self, name, fn, in_queue, out_queue, last):
+        stats = self.stats[name]
+        while self.running.is_set():
+            self.profile_point()
+            packet = in_queue.get(timeout=0.1)
+            if packet is None:
+                continue
+            start = time.perf_counter()
+            try:
+                packet = fn(packet)
+            except Exception as e:
+                traceback.print_exc()
+                self.error = (name, e)
+                self.running.clear()
+                break
+            end = time.perf_counter()
+            stats.add(end - start)
+            if packet is None:
+                continue
+            if last:
+                self.stats['end_to_end'].add(end - packet.capture_time)
+                self.frames_out += 1
+            out_queue.put(packet)
+
+    def report(self):
+        """Per-stage latency percentiles, queue drops and throughput."""
+        elapsed = time.perf_counter() - self.start_time if self.start_time else 0.0
+        report = {name: stats.summary() for name, stats in self.stats.items()}
+        for (name, _), queue in zip(self.stages, self.queues):
+            report[name]['dropped'] = queue.dropped
+        report['fps_in'] = self.frames_in / elapsed if elapsed else 0.0
+        report['fps_out'] = self.frames_out / elapsed if elapsed else 0.0
+        return report
+
+    def format_report(self):
+        report = self.report()
+        lines = [f"capture {report['fps_in']:.1f} FPS, published {report['fps_out']:.1f} FPS"]
+        if self.error is not None:
+            lines.append(f"  stopped: {self.error[0]} stage failed ({type(self.error[1]).__name__}: {self.error[1]})")
+        for name in self.stats:
+            s = report[name]
+            if 'p50_ms' not in s:
+                continue
+            line = f"  {name:<11} p50 {s['p50_ms']:6.2f} ms  p95 {s['p95_ms']:6.2f} ms  max {s['max_ms']:6.2f} ms"
+            if 'dropped' in s:
+                line += f"  dropped {s['dropped']}"
+            lines.append(line)
+        return "\n".join(lines)
@@ -0,0 +1,137 @@
+import socket
+import time
+import numpy as np
+from telemetry import FRAME_METRIC, encode_frame, encode_csv
+
+
+class Endpoint:
+    """
+    One telemetry destination.
+    max_rate: maximum frames per second sent to it (None = every frame)
+    decimation: send only every n-th frame
+    binary: binary frame message, or legacy per-tag CSV datagrams
+    """
+
+    def __init__(self, name, address, max_rate=None, decimation=1, binary=True):
+        self.name = name
+        self.address = address
+        self.max_rate = max_rate
+        self.decimation = max(1, int(decimation))
+        self.binary = binary
+
+        self.sent = 0  # datagrams handed to the kernel
+        self.dropped = 0  # datagrams lost because the socket would block or the send failed
+        self.skipped = 0  # frames not sent because of the rate limit / decimation
+        self.frames = 0
+        self.next_send = None  # earliest time of the next frame under max_rate
+
+    def due(self, now):
+        """Rate limit / decimation check for the current frame."""
+        self.frames += 1
+        if (self.frames - 1) % self.decimation:
+            return False
+        if self.max_rate:
+            if self.next_send is not None and now < self.next_send:
+                return False
+            # Fixed schedule: the next slot is one period after this slot, not after this
+            # frame, so waiting for a whole frame period does not lower the rate (70 FPS
+            # camera, 30 Hz endpoint: 30 Hz, not 23). After a stall it restarts from now
+            period = 1.0 / self.max_rate
+            if self.next_send is None or now - self.next_send > period:
+                self.next_send = now + period
+            else:
+                self.next_send += period
+        return True
+
+    def __repr__(self):
+        return f"Endpoint({self.name!r}, {self.address}, max_rate={self.max_rate}, decimation={self.decimation}, binary={self.binary})"
+
+
+def default_endpoints(binary=True):
+    # Unity at full rate, ESP32 limited to 30 Hz
+    return [
+        Endpoint('unity', ("127.0.0.1", 5053), binary=binary),
+        Endpoint('esp32', ("192.168.1.1", 5054), max_rate=30, binary=binary),
+    ]
+
+
+def parse_endpoint(text):
+    """
+    Parse "name=host:port[@rate][/csv]", e.g. "esp32=192.168.1.1:5054@30" or "logger=127.0.0.1:6000/csv".
+    """
+    name, _, rest = text.partition('=')
+    binary = True
+    if rest.endswith('/csv'):
+        rest, binary = rest[:-4], False
+    rest, _, rate = rest.partition('@')
+    host, _, port = rest.rpartition(':')
+    if not name or not host or not port:
+        raise ValueError(f"Invalid endpoint '{text}', expected name=host:port[@rate][/csv]")
+    return Endpoint(name, (host, int(port)), max_rate=float(rate) if rate else None, binary=binary)
+
+
+class Publisher:
+    """
+    Fans every frame out to a list of endpoints over a single non-blocking UDP socket.
+    Each frame is encoded once per format, and a slow or unreachable endpoint only
+    increases its own dropped counter instead of blocking the vision loop.
+
+    Python has no sendmmsg, so batching is done by the frame message itself: in binary
+    mode each endpoint costs one sendto per frame regardless of the number of tags.
+
+    metric: poses are track-plane metres and radians (see track_plane.py), marked with
+    FRAME_METRIC in the frame header so consumers need no conversion of their own.
+    """
+
+    def __init__(self, endpoints=None, bind=None, metric=False):
+        self.endpoints = endpoints if endpoints is not None else default_endpoints()
+        self.metric = metric
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setblocking(False)
+        if bind is not None:
+            # Fixed local port, so replies from Unity / ESP32 come back to this socket
+            self.sock.bind(bind)
+        self.seq = 0
+
+    def publish(self, ids, poses, timestamp=None, flags=None, mirror=None):
+        """
+        mirror: (width, height) of the image when poses are pixels to be sent from the
+        right and bottom edges (the original convention): exact in binary frames, after
+        truncation in legacy CSV so it matches the original scripts to the pixel.
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        self.seq += 1
+        now = time.monotonic()
+
+        encoded = {}
+        for endpoint in self.endpoints:
+            if not endpoint.due(now):
+                endpoint.skipped += 1
+                continue
+
+            if endpoint.binary not in encoded:
+                if endpoint.binary:
+                    mirrored = poses if mirror is None else np.column_stack((mirror[0] - poses[:, 0],
+                                                                             mirror[1] - poses[:, 1], poses[:, 2]))
+                    encoded[True] = [encode_frame(self.seq, timestamp, ids, mirrored, flags,
+                                                  FRAME_METRIC if self.metric else 0)]
+                else:
+                    encoded[False] = encode_csv(ids, poses, self.metric, mirror)
+
+            for data in encoded[endpoint.binary]:
+                try:
+                    self.sock.sendto(data, endpoint.address)
+                    endpoint.sent += 1
+                except OSError:
+                    # BlockingIOError (buffer full), unreachable host, ...
+                    endpoint.dropped += 1
+
+    def stats(self):
+        return {e.name: {'sent': e.sent, 'dropped': e.dropped, 'skipped': e.skipped} for e in self.endpoints}
+
+    def format_stats(self):
+        return "  ".join(f"{e.name}: sent {e.sent} dropped {e.dropped} skipped {e.skipped}" for e in self.endpoints)
+
+    def close(self):
+        self.sock.close()
@@ -0,0 +1,95 @@
+import numpy as np
+
+
+class RoiDetector:
+    """
+    Tracking mode for the AprilTag detector: instead of the full frame, detect only
+    inside padded regions of interest around the predicted tag positions.
+
+    A full-frame detection still runs every `full_frame_interval` frames (to pick up
+    new cars), when there is nothing to track, and whenever a predicted tag is not
+    found inside its ROI.
+    """
+
+    def __init__(self, detector, full_frame_interval=10, padding=1.0, margin=8):
+        self.detector = detector
+        self.full_frame_interval = full_frame_interval
+        self.padding = padding  # ROI half-size in tag sizes, on top of half the tag
+        self.margin = margin  # extra pixels around every ROI
+
+        self.sizes = {}  # last seen tag size (pixels) per tag ID
+        self.frames_since_full = 0
+        self.full_frames = 0
+        self.roi_frames = 0
+
+    def rois(self, predictions, shape):
+        """Padded, clipped and merged (x0, y0, x1, y1) boxes around the predicted centers."""
+        height, width = shape[:2]
+        boxes = []
+        for tag_id, (x, y) in predictions.items():
+            half = self.sizes[tag_id] * (0.5 + self.padding) + self.margin
+            x0, y0 = max(0, int(x - half)), max(0, int(y - half))
+            x1, y1 = min(width, int(x + half) + 1), min(height, int(y + half) + 1)
+            if x1 > x0 and y1 > y0:
+                boxes.append([x0, y0, x1, y1])
+
+        # Merge overlapping boxes so nearby cars are detected in one crop
+        merged = True
+        while merged and len(boxes) > 1:
+            merged = False
+            for i in range(len(boxes)):
+                for j in range(i + 1, len(boxes)):
+                    a, b = boxes[i], boxes[j]
+                    if a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]:
+                        boxes[i] = [min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])]
+                        del boxes[j]
+                        merged = True
+                        break
+                if merged:
+                    break
+        return boxes
+
+    def detect_in_rois(self, gray, boxes):
+        results = {}
+        for x0, y0, x1, y1 in boxes:
+            crop = np.ascontiguousarray(gray[y0:y1, x0:x1])
+            for r in self.detector.detect(crop):
+                # Back to full-frame coordinates
+                r.center = r.center + (x0, y0)
+                r.corners = r.corners + (x0, y0)
+                results[r.tag_id] = r
+        return list(results.values())
+
+    def detect(self, gray, predictions=None):
+        """
+        predictions: {tag_id: (x, y)} predicted centers in `gray` pixel coordinates.
+        Returns AprilTag detections in full-frame coordinates.
+        """
+        predictions = {t: p for t, p in (predictions or {}).items() if t in self.sizes}
+
+        results = None
+        if predictions and self.frames_since_full + 1 < self.full_frame_interval:
+            results = self.detect_in_rois(gray, self.rois(predictions, gray.shape))
+            found = set(r.tag_id for r in results)
+            if all(tag_id in found for tag_id in predictions):
+                self.frames_since_full += 1
+                self.roi_frames += 1
+            else:
+                # A tag went missing: look for it in the whole frame
+                results = None
+
+        if results is None:
+            results = self.detector.detect(gray)
+            self.frames_since_full = 0
+            self.full_frames += 1
+            # Tags that a full-frame pass did not find are no longer tracked
+            found = set(r.tag_id for r in results)
+            for tag_id in list(self.sizes):
+                if tag_id not in found:
+                    del self.sizes[tag_id]
+
+        for r in results:
+            corners = np.asarray(r.corners)
+            self.sizes[r.tag_id] = np.linalg.norm(corners[0] - corners[2]) / np.sqrt(2)
+
+        return results
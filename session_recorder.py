@@ -0,0 +1,291 @@
+import json
+import os
+import queue
+import threading
+import time
+import traceback
+import cv2
+import numpy as np
+
+# A session is a folder:
+#   meta.json                    frame shape, chunk size, compression, chunk list
+#   frames_00000.npy             raw frames of chunk 0, (n, h, w, c) uint8, memory-mappable
+#   frames_00000.bin / _offsets.npy   or PNG-compressed frames and their byte offsets
+#   index_00000.npy              seq and capture timestamp of every frame of the chunk
+#   tracks_00000.npy             detections and filtered states of the chunk, one row per tag
+TRACK_DTYPE = np.dtype([('seq', '<u8'), ('timestamp', '<f8'), ('kind', 'u1'), ('id', '<u2'),
+                        ('x', '<f4'), ('y', '<f4'), ('angle', '<f4'), ('flags', 'u1')])
+INDEX_DTYPE = np.dtype([('seq', '<u8'), ('timestamp', '<f8')])
+
+# Row kinds in the track log
+DETECTION = 0  # raw detector output
+STATE = 1  # filtered state that was published
+
+
+def tag_poses(results):
+    """(ids, (N, 3) [x, y, angle degrees]) of AprilTag detections, angle from the top edge."""
+    if not results:
+        return [], np.empty((0, 3))
+    corners = np.array([r.corners for r in results])
+    edge = corners[:, 1] - corners[:, 0]
+    angle = np.degrees(np.arctan2(edge[:, 1], edge[:, 0])) % 360
+    centers = np.array([r.center for r in results])
+    return [r.tag_id for r in results], np.column_stack((centers, angle))
+
+
+class SessionRecorder:
+    """
+    Records a tracking session without slowing the tracker down.
+
+    record() only puts references on a bounded queue; copying frames into the
+    memory-mapped chunk files (or PNG encoding them with compress=True) and writing
+    the columnar track log happen on a background thread. If the disk cannot keep
+    up, frames are dropped and counted instead of blocking the tracker.
+
+    meta.json is rewritten (atomically) after every finished chunk, so a session cut
+    short by a crash still reads back up to its last chunk. A write error (disk full)
+    stops the recording, is printed and shows in format_stats(); tracking goes on.
+    """
+
+    def __init__(self, path, chunk_frames=300, compress=False, queue_size=64):
+        self.path = path
+        self.chunk_frames = chunk_frames
+        self.compress = compress
+        os.makedirs(path, exist_ok=True)
+
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.seq = 0
+        self.recorded = 0
+        self.dropped = 0
+        self.error = None  # exception that stopped the writer thread
+
+        # Writer thread state
+        self.shape = None
+        self.chunks = []  # {'name', 'frames'} of the finished chunks
+        self.chunk = None
+        self.n = 0
+        self.thread = threading.Thread(target=self._run, name='recorder', daemon=True)
+        self.thread.start()
+
+    def record(self, frame, timestamp, detections=None, states=None):
+        """
+        frame: BGR image, timestamp: capture time,
+        detections / states: optional (ids, poses (N, 3), flags or None) tuples.
+        """
+        self.seq += 1
+        if self.error is not None:
+            return
+        if not frame.flags.writeable:
+            # Read-only views (shared memory ring) are reused by their owner
+            frame = frame.copy()
+        try:
+            self.queue.put_nowait((self.seq, timestamp, frame, detections, states))
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+
+    # Writer thread
+    def _run(self):
+        try:
+            while True:
+                item = self.queue.get()
+                if item is None:
+                    break
+                self._write(*item)
+                self.recorded += 1
+            if self.chunk is not None:
+                self._finish_chunk()
+            self._write_meta()
+        except Exception as e:
+            self.error = e
+            print(f"Session {self.path}: recording stopped after {self.recorded} frames")
+            traceback.print_exc()
+            # Keep emptying the queue until close(), record() stops queuing frames
+            while self.queue.get() is not None:
+                pass
+
+    def _chunk_file(self, kind, ext='npy'):
+        return os.path.join(self.path, f"{kind}_{len(self.chunks):05d}.{ext}")
+
+    def _open_chunk(self):
+        chunk = {'index': np.zeros(self.chunk_frames, INDEX_DTYPE), 'tracks': []}
+        if self.compress:
+            chunk['file'] = open(self._chunk_file('frames', 'bin'), 'wb')
+            chunk['offsets'] = [0]
+        else:
+            chunk['frames'] = np.lib.format.open_memmap(self._chunk_file('frames'), mode='w+', dtype=np.uint8,
+                                                        shape=(self.chunk_frames,) + self.shape)
+        self.chunk = chunk
+        self.n = 0
+
+    def _write(self, seq, timestamp, frame, detections, states):
+        if self.shape is None:
+            self.shape = frame.shape if frame.ndim == 3 else frame.shape + (1,)
+            self._write_meta()
+        if self.chunk is None:
+            self._open_chunk()
+        chunk = self.chunk
+
+        if self.compress:
+            ok, data = cv2.imencode('.png', frame, [cv2.IMWRITE_PNG_COMPRESSION, 1])
+            chunk['file'].write(data.tobytes())
+            chunk['offsets'].append(chunk['offsets'][-1] + len(data))
+        else:
+            chunk['frames'][self.n] = frame.reshape(self.shape)
+        chunk['index'][self.n] = (seq, timestamp)
+
+        for kind, tracks in ((DETECTION, detections), (STATE, states)):
+            if tracks is None or len(tracks[0]) == 0:
+                continue
+            ids, poses, flags = tracks
+            rows = np.zeros(len(ids), TRACK_DTYPE)
+            rows['seq'], rows['timestamp'], rows['kind'], rows['id'] = seq, timestamp, kind, ids
+            poses = np.asarray(poses).reshape(-1, 3)
+            rows['x'], rows['y'], rows['angle'] = poses[:, 0], poses[:, 1], poses[:, 2]
+            if flags is not None:
+                rows['flags'] = flags
+            chunk['tracks'].append(rows)
+
+        self.n += 1
+        if self.n == self.chunk_frames:
+            self._finish_chunk()
+
+    def _finish_chunk(self):
+        chunk, n = self.chunk, self.n
+        name = f"{len(self.chunks):05d}"
+        if self.compress:
+            chunk['file'].close()
+            np.save(self._chunk_file('frames_offsets'), np.array(chunk['offsets'], dtype=np.int64))
+        else:
+            frames = chunk.pop('frames')
+            frames.flush()
+            if n < self.chunk_frames:
+                # Last chunk of the session: shrink the file to the frames written
+                np.save(self._chunk_file('frames_tmp'), frames[:n])
+                del frames
+                os.replace(self._chunk_file('frames_tmp'), self._chunk_file('frames'))
+            else:
+                del frames
+        np.save(self._chunk_file('index'), chunk['index'][:n])
+        tracks = np.concatenate(chunk['tracks']) if chunk['tracks'] else np.zeros(0, TRACK_DTYPE)
+        np.save(self._chunk_file('tracks'), tracks)
+        self.chunks.append({'name': name, 'frames': n})
+        self.chunk = None
+        self._write_meta()
+
+    def _write_meta(self):
+        meta = {
+            'version': 1,
+            'shape': list(self.shape) if self.shape else None,
+            'chunk_frames': self.chunk_frames,
+            'compress': 'png' if self.compress else None,
+            'chunks': self.chunks,
+            'frames': sum(c['frames'] for c in self.chunks),
+            'dropped': self.dropped,
+        }
+        # Readers never see a half-written meta.json
+        file = os.path.join(self.path, 'meta.json')
+        with open(file + '.tmp', 'w') as f:
+            json.dump(meta, f, indent=2)
+        os.replace(file + '.tmp', file)
+
+    def format_stats(self):
+        stats = f"recorded {self.recorded} dropped {self.dropped} queued {self.queue.qsize()}"
+        if self.error is not None:
+            stats += f"  stopped by {type(self.error).__name__}: {self.error}"
+        return stats
+
+
+class SessionReader:
+    """
+    Random access to a recorded session. Frame chunks are memory-mapped (or their
+    PNG bytes are), so only the frames that are actually used are read from disk.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'meta.json')) as f:
+            self.meta = json.load(f)
+        self.compress = self.meta['compress']
+        self.chunks = [c['name'] for c in self.meta['chunks']]
+        self.starts = np.cumsum([0] + [c['frames'] for c in self.meta['chunks']])
+        self._frames = {}
+
+    def __len__(self):
+        return int(self.starts[-1])
+
+    def _file(self, kind, chunk, ext='npy'):
+        return os.path.join(self.path, f"{kind}_{self.chunks[chunk]}.{ext}")
+
+    def _chunk_frames(self, chunk):
+        if chunk not in self._frames:
+            if self.compress:
+                data = np.memmap(self._file('frames', chunk, 'bin'), dtype=np.uint8, mode='r')
+                self._frames[chunk] = (data, np.load(self._file('frames_offsets', chunk)))
+            else:
+                self._frames[chunk] = np.load(self._file('frames', chunk), mmap_mode='r')
+        return self._frames[chunk]
+
+    def frame(self, i):
+        chunk = int(np.searchsorted(self.starts, i, side='right') - 1)
+        j = i - self.starts[chunk]
+        frames = self._chunk_frames(chunk)
+        if self.compress:
+            data, offsets = frames
+            img = cv2.imdecode(np.asarray(data[offsets[j]:offsets[j + 1]]), cv2.IMREAD_UNCHANGED)
+        else:
+            img = frames[j]
+        return img[:, :, 0] if img.ndim == 3 and img.shape[2] == 1 else img
+
+    def index(self):
+        """seq and timestamp of every frame (small, loaded in full)."""
+        if not self.chunks:
+            return np.zeros(0, INDEX_DTYPE)
+        return np.concatenate([np.load(self._file('index', c)) for c in range(len(self.chunks))])
+
+    def track_chunks(self):
+        """Memory-mapped track log, one array per chunk."""
+        for c in range(len(self.chunks)):
+            yield np.load(self._file('tracks', c), mmap_mode='r')
+
+    def tracks(self, kind=None):
+        """Whole track log as one structured array, optionally only DETECTION or STATE rows."""
+        parts = [t if kind is None else t[t['kind'] == kind] for t in self.track_chunks()]
+        return np.concatenate(parts) if parts else np.zeros(0, TRACK_DTYPE)
+
+
+class RecordingSource:
+    """Replays a recorded session like a camera, optionally at the recorded pace."""
+
+    def __init__(self, path, realtime=False, loop=False):
+        self.reader = SessionReader(path)
+        self.timestamps = self.reader.index()['timestamp']
+        self.realtime = realtime
+        self.loop = loop
+        self.i = 0
+        self.start = None
+
+    def read(self):
+        if self.i >= len(self.reader):
+            if not self.loop or not len(self.reader):
+                return False, None
+            self.i, self.start = 0, None
+        if self.realtime:
+            now = time.perf_counter()
+            if self.start is None:
+                self.start = now - (self.timestamps[self.i] - self.timestamps[0])
+            delay = self.start + (self.timestamps[self.i] - self.timestamps[0]) - now
+            if delay > 0:
+                time.sleep(delay)
+        img = self.reader.frame(self.i)
+        self.i += 1
+        return True, img
+
+    def set(self, prop, value):
+        return False
+
+    def release(self):
+        self.reader._frames.clear()
@@ -0,0 +1,58 @@
+import struct
+import numpy as np
+
+# Binary frame message (little-endian), one datagram per camera frame:
+#   header: magic 'MC' | version u8 | flags u8 | frame seq u32 | capture timestamp f64 | tag count u16
+#   tags:   id u16 | x f32 | y f32 | angle f32 | flags u8   (repeated `count` times)
+MAGIC = b'MC'
+VERSION = 1
+HEADER = struct.Struct('<2sBBIdH')
+TAG_DTYPE = np.dtype([('id', '<u2'), ('x', '<f4'), ('y', '<f4'), ('angle', '<f4'), ('flags', 'u1')])
+
+# Frame flags: x, y in metres on the track plane and angle in radians (otherwise pixels and degrees)
+FRAME_METRIC = 0x01
+
+# Per-tag flags
+TAG_PREDICTED = 0x01
+
+
+def encode_frame(seq, timestamp, ids, poses, flags=None, frame_flags=0):
+    """Pack all tags of one frame into a single datagram. poses is an (N, 3) array of [x, y, angle]."""
+    poses = np.asarray(poses, dtype=np.float32).reshape(-1, 3)
+    tags = np.zeros(len(poses), dtype=TAG_DTYPE)
+    tags['id'] = ids
+    tags['x'] = poses[:, 0]
+    tags['y'] = poses[:, 1]
+    tags['angle'] = poses[:, 2]
+    if flags is not None:
+        tags['flags'] = flags
+    return HEADER.pack(MAGIC, VERSION, frame_flags, seq & 0xFFFFFFFF, timestamp, len(tags)) + tags.tobytes()
+
+
+def is_binary_frame(data):
+    return len(data) >= HEADER.size and data[:2] == MAGIC
+
+
+def decode_frame(data):
+    """Inverse of encode_frame: returns (seq, timestamp, tags) with tags a TAG_DTYPE array."""
+    magic, version, _, seq, timestamp, count = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError("Not a telemetry frame")
+    if version != VERSION:
+        raise ValueError(f"Unsupported telemetry version {version}")
+    tags = np.frombuffer(data, dtype=TAG_DTYPE, count=count, offset=HEADER.size)
+    return seq, timestamp, tags
+
+
+def encode_csv(ids, poses, metric=False, mirror=None):
+    """
+    Legacy format: one "id,x,y,angle" datagram per tag, integer values (millimetre /
+    milliradian decimals when metric). mirror: (width, height) to send pixel x and y
+    from the right and bottom edges, truncated first like the original scripts did.
+    """
+    if metric:
+        return [f"{tag_id},{x:.3f},{y:.3f},{angle:.3f}".encode() for tag_id, (x, y, angle) in zip(ids, poses)]
+    if mirror is not None:
+        width, height = mirror
+        return [f"{tag_id},{width - int(x)},{height - int(y)},{int(angle)}".encode() for tag_id, (x, y, angle) in zip(ids, poses)]
+    return [f"{tag_id},{int(x)},{int(y)},{int(angle)}".encode() for tag_id, (x, y, angle) in zip(ids, poses)]
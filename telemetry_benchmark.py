@@ -0,0 +1,94 @@
+import argparse
+import socket
+import threading
+import time
+import numpy as np
+from publisher import Endpoint, Publisher
+from telemetry import decode_frame, is_binary_frame
+
+# IPv4 + UDP header bytes added to every datagram on the wire
+DATAGRAM_OVERHEAD = 28
+
+
+class UdpSink:
+    """Local UDP receiver that drains and counts everything sent to it."""
+
+    def __init__(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+        self.sock.bind(("127.0.0.1", 0))
+        self.sock.settimeout(0.2)
+        self.address = self.sock.getsockname()
+        self.datagrams = 0
+        self.bytes = 0
+        self.tags = 0
+        self.running = True
+        self.thread = threading.Thread(target=self._loop, daemon=True)
+        self.thread.start()
+
+    def _loop(self):
+        while self.running:
+            try:
+                data = self.sock.recv(65535)
+            except socket.timeout:
+                continue
+            self.datagrams += 1
+            self.bytes += len(data)
+            self.tags += len(decode_frame(data)[2]) if is_binary_frame(data) else 1
+
+    def close(self):
+        self.running = False
+        self.thread.join()
+        self.sock.close()
+
+
+def run(binary, n_tags, n_frames):
+    sink = UdpSink()
+    publisher = Publisher([Endpoint('sink', sink.address, binary=binary)])
+    endpoint = publisher.endpoints[0]
+
+    rng = np.random.default_rng(0)
+    ids = list(range(n_tags))
+    poses = rng.uniform([0, 0, 0], [640, 480, 360], size=(n_frames, n_tags, 3))
+
+    start = time.perf_counter()
+    for frame in poses:
+        publisher.publish(ids, frame)
+    elapsed = time.perf_counter() - start
+
+    time.sleep(0.3)  # let the sink drain
+    publisher.close()
+    sink.close()
+    return {
+        'us_per_frame': elapsed / n_frames * 1e6,
+        'syscalls_per_frame': (endpoint.sent + endpoint.dropped) / n_frames,
+        'bytes_per_frame': sink.bytes / n_frames,
+        'wire_bytes_per_frame': (sink.bytes + DATAGRAM_OVERHEAD * sink.datagrams) / n_frames,
+        'received_tags': sink.tags,
+        'sent_tags': n_tags * n_frames,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare per-tag CSV datagrams with one binary datagram per frame, sent by the Publisher.")
+    parser.add_argument('--tags', type=int, nargs='+', default=[1, 4, 10, 50, 100], help='Tags per frame')
+    parser.add_argument('--frames', type=int, default=2000, help='Frames per run')
+    args = parser.parse_args()
+
+    print(f"{'tags':>5} {'format':>7} {'us/frame':>10} {'sendto/frame':>13} {'payload B/frame':>16} "
+          f"{'wire B/frame':>13} {'received':>12}")
+    for n_tags in args.tags:
+        for binary in (False, True):
+            r = run(binary, n_tags, args.frames)
+            name = 'binary' if binary else 'csv'
+            print(f"{n_tags:>5} {name:>7} {r['us_per_frame']:>10.1f} {r['syscalls_per_frame']:>13.1f} "
+                  f"{r['bytes_per_frame']:>16.1f} {r['wire_bytes_per_frame']:>13.1f} "
+                  f"{r['received_tags']:>6}/{r['sent_tags']}")
+
+
+if __name__ == "__main__":
+    main()
+
+
+# Example
+# python telemetry_benchmark.py --tags 4 50 --frames 5000
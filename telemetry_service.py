@@ -0,0 +1,218 @@
+import argparse
+import asyncio
+import json
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from AprilTag_with_EKF import AprilTagTracker
+from frame_sources import open_source
+from publisher import Publisher, default_endpoints, parse_endpoint
+
+# Control messages are JSON datagrams sent to the service port, e.g.
+#   {"cmd": "ping"}
+#   {"cmd": "stats"}
+#   {"cmd": "reset"}                          reset every EKF track
+#   {"cmd": "reset", "tags": [3, 7]}          reset only these cars
+#   {"cmd": "detector", "quad_decimate": 1.0} rebuild the detector with new settings
+#   {"cmd": "select", "tags": [3, 7]}         publish only these cars ("tags": null = all)
+#   {"ack": 1234}                             frame acknowledgement (ESP32), measures round trip
+# Every command is answered with a JSON datagram {"ok": true|false, "cmd": ..., ...}.
+# Acknowledgements are also accepted on the telemetry socket, where the ESP32 replies
+# to the frames it receives; commands are only accepted on the control socket.
+
+
+class ControlProtocol(asyncio.DatagramProtocol):
+    def __init__(self, service, commands=True):
+        self.service = service
+        self.commands = commands
+
+    def datagram_received(self, data, addr):
+        self.service.handle_datagram(data, addr, self.commands)
+
+    def error_received(self, exc):
+        # ICMP port unreachable from an endpoint that is not listening
+        self.service.tracker.metrics.count('socket_errors')
+
+
+class TelemetryService:
+    """
+    asyncio service around the AprilTag + EKF tracker core.
+
+    Capture, detection and filtering are blocking OpenCV/NumPy work and run one frame
+    at a time in a single executor thread; each frame is published straight from that
+    thread through the non-blocking publisher socket, so nothing on the event loop
+    can delay it. The event loop reads a control socket bound to `host`:`port` for
+    commands, and the publisher socket for the acknowledgements sent back to it.
+
+    Commands that change the tracker are queued and applied between two frames,
+    never while the vision thread is using the detector or the filter.
+    """
+
+    def __init__(self, tracker, host='127.0.0.1', port=5060):
+        self.tracker = tracker
+        self.address = (host, port)
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='vision')
+        self.transport = None  # control socket
+        self.ack_transport = None  # publisher socket, acknowledgements only
+        self.pending = []  # (command, reply address) to apply between frames
+        self.selected = None  # tag IDs to publish, None = all
+        self.sent_times = OrderedDict()  # frame seq -> send time, for acknowledgements
+        self.running = False
+
+    # Vision thread
+    def step(self):
+        tracker = self.tracker
+        img = tracker.read_frame()
+        if img is None:
+            return False
+        timestamp = time.time()
+
+        img, results = tracker.detect(img)
+        tag_ids, states, flags = tracker.filter(results, timestamp)
+        if self.selected is not None:
+            keep = np.array([t in self.selected for t in tag_ids], dtype=bool)
+            tag_ids = [t for t, k in zip(tag_ids, keep) if k]
+            states, flags = states[keep], flags[keep]
+        tracker.publish(img.shape, tag_ids, states, timestamp, flags)
+
+        self.sent_times[tracker.publisher.seq] = time.perf_counter()
+        if len(self.sent_times) > 256:
+            self.sent_times.popitem(last=False)
+        if tracker.visualizer is not None:
+            tracker.visualizer.submit(img, results)
+        tracker.metrics.tick()
+        return True
+
+    # Event loop
+    def handle_datagram(self, data, addr, commands=True):
+        try:
+            message = json.loads(data)
+            if not isinstance(message, dict):
+                raise ValueError("expected a JSON object")
+        except ValueError as e:
+            self.reply({'ok': False, 'error': f"bad message: {e}"}, addr)
+            return
+
+        if 'ack' in message:
+            ack = message['ack']
+            if not isinstance(ack, int) or isinstance(ack, bool):
+                self.reply({'ok': False, 'error': f"bad ack: expected a frame sequence number, got {ack!r}"}, addr)
+                return
+            sent = self.sent_times.get(ack)
+            if sent is not None:
+                self.tracker.metrics.add('ack_rtt', time.perf_counter() - sent)
+            self.tracker.metrics.count('acks')
+            return
+        if not commands:
+            self.reply({'ok': False, 'error': f"commands go to port {self.address[1]}"}, addr)
+            return
+
+        cmd = message.get('cmd')
+        if cmd == 'ping':
+            self.reply({'ok': True, 'cmd': cmd, 'time': time.time()}, addr)
+        elif cmd == 'stats':
+            self.reply({'ok': True, 'cmd': cmd, 'metrics': self.tracker.metrics.snapshot(),
+                        'publisher': self.tracker.publisher.stats(),
+                        'tracks': self.tracker.tracks.format_stats()}, addr)
+        elif cmd in ('reset', 'detector', 'select'):
+            self.pending.append((message, addr))
+        else:
+            self.reply({'ok': False, 'cmd': cmd, 'error': 'unknown command'}, addr)
+
+    def apply_pending(self):
+        """Apply the queued commands; only called while the vision thread is idle."""
+        pending, self.pending = self.pending, []
+        for message, addr in pending:
+            cmd = message['cmd']
+            try:
+                if cmd == 'reset':
+                    self.tracker.reset_tracks(message.get('tags'))
+                    reply = {}
+                elif cmd == 'detector':
+                    self.tracker.configure_detector(**{k: v for k, v in message.items() if k != 'cmd'})
+                    reply = {'detector': {k: v for k, v in self.tracker.detector_config.items()}}
+                else:
+                    tags = message.get('tags')
+                    self.selected = None if tags is None else set(tags)
+                    reply = {'selected': None if tags is None else sorted(self.selected)}
+                self.reply({'ok': True, 'cmd': cmd, **reply}, addr)
+            except Exception as e:
+                # A bad request gets an error reply, it must never stop the service
+                self.reply({'ok': False, 'cmd': cmd, 'error': f"{type(e).__name__}: {e}"}, addr)
+
+    def reply(self, message, addr):
+        if self.transport is not None:
+            self.transport.sendto(json.dumps(message, default=float).encode(), addr)
+
+    async def serve(self):
+        loop = asyncio.get_running_loop()
+        self.transport, _ = await loop.create_datagram_endpoint(
+            lambda: ControlProtocol(self), local_addr=self.address)
+        self.ack_transport, _ = await loop.create_datagram_endpoint(
+            lambda: ControlProtocol(self, commands=False), sock=self.tracker.publisher.sock)
+        print(f"Control channel on udp://{self.address[0]}:{self.address[1]}")
+
+        self.running = True
+        try:
+            while self.running and not self.tracker.quit_requested():
+                if not await loop.run_in_executor(self.executor, self.step):
+                    break
+                if self.pending:
+                    self.apply_pending()
+        finally:
+            self.transport.close()
+            self.ack_transport.close()
+            self.executor.shutdown(wait=True)
+
+    def stop(self):
+        self.running = False
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AprilTag + EKF tracker as an asyncio telemetry service with a control channel.")
+    parser.add_argument('--host', default='127.0.0.1',
+                        help='Address of the control socket (0.0.0.0 accepts commands from any host)')
+    parser.add_argument('--port', type=int, default=5060, help='UDP port for control messages')
+    parser.add_argument('--endpoint', action='append', type=parse_endpoint,
+                        help='Telemetry endpoint name=host:port[@rate][/csv], repeat for several (default: Unity and ESP32)')
+    parser.add_argument('--source', help='Replay instead of the webcam: a video file, an image folder, synthetic[:n_tags] or camera[:index]')
+    parser.add_argument('--realtime', action='store_true', help='Replay --source at its native frame rate')
+    parser.add_argument('--motion-model', choices=['static', 'cv', 'bicycle'], default='static', help='EKF motion model')
+    parser.add_argument('--calibration', metavar='DIR',
+                        help='Calibration bundle of the camera (default: ./calibration if present, else built-in)')
+    parser.add_argument('--metric', action='store_true',
+                        help='Publish track-plane metres and radians through the homography of the calibration bundle')
+    parser.add_argument('--headless', action='store_true', help='No display and no drawing at all')
+    parser.add_argument('--display-fps', type=float, default=15, help='Maximum refresh rate of the display window')
+    parser.add_argument('--metrics-log', type=float, default=0, help='Print a JSON metrics line every N seconds (0 = off)')
+    args = parser.parse_args()
+    source = open_source(args.source, realtime=args.realtime) if args.source else None
+
+    tracker = AprilTagTracker(source=source, endpoints=[], motion_model=args.motion_model,
+                              calibration=args.calibration, metric=args.metric)
+    tracker.publisher.close()
+    tracker.publisher = Publisher(args.endpoint if args.endpoint is not None else default_endpoints(),
+                                  bind=('0.0.0.0', 0), metric=args.metric)
+    tracker.start_metrics(0, args.metrics_log)
+    tracker.start_display(args.headless, args.display_fps)
+
+    service = TelemetryService(tracker, args.host, args.port)
+    try:
+        asyncio.run(service.serve())
+    except KeyboardInterrupt:
+        pass
+    print(tracker.publisher.format_stats())
+    print(tracker.tracks.format_stats())
+    tracker.cleanup()
+
+
+if __name__ == "__main__":
+    main()
+
+
+# Example
+# python telemetry_service.py --source synthetic:4 --realtime --headless
+# then from another shell, e.g. in Python:
+#   s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+#   s.sendto(b'{"cmd": "detector", "quad_decimate": 1.0}', ("127.0.0.1", 5060)); print(s.recv(4096))
@@ -0,0 +1,78 @@
+import pytest
+import adaptive_detector
+from adaptive_detector import AdaptiveDetectorTuner, check_detector_settings
+from metrics import Metrics
+
+
+@pytest.mark.parametrize('decimate', [1, 1.0, 1.5, 2, 3.0, 4])
+def test_decimate_on_the_ladder(decimate):
+    assert check_detector_settings({'quad_decimate': decimate}) == {'quad_decimate': float(decimate)}
+
+
+@pytest.mark.parametrize('decimate', [0.6, 1.2, 2.5, 8, 'x', True])
+def test_decimate_off_the_ladder(decimate):
+    # The detector treats <= 1 as 1 and truncates anything but 1.5 to an integer
+    with pytest.raises(ValueError):
+        check_detector_settings({'quad_decimate': decimate})
+
+
+def test_unknown_setting():
+    with pytest.raises(ValueError):
+        check_detector_settings({'quad_decimat': 2})
+
+
+class FakeTracker:
+    """Just what the tuner uses: detector_config, configure_detector, metrics and no ROI detector."""
+
+    def __init__(self, **config):
+        self.detector_config = {'nthreads': 1, 'quad_decimate': 1.0, **config}
+        self.metrics = Metrics()
+        self.roi_detector = None
+
+    def configure_detector(self, **changes):
+        self.detector_config.update(check_detector_settings(changes))
+
+
+def run_window(tuner, detect_seconds):
+    for _ in range(tuner.window):
+        tuner.tracker.metrics.add('detect', detect_seconds)
+        tuner.update()
+
+
+@pytest.fixture
+def tuner(monkeypatch):
+    monkeypatch.setattr(adaptive_detector, 'cpu_headroom', lambda: 0)  # no spare cores
+    return AdaptiveDetectorTuner(FakeTracker(), target_fps=30, window=10, decimate_range=(1.0, 3.0))
+
+
+def test_ladder_helpers(tuner):
+    assert tuner.decimate_ladder == [1.0, 1.5, 2.0, 3.0]
+    assert tuner.coarser(1.0) == 1.5
+    assert tuner.coarser(3.0) is None
+    assert tuner.finer(2.0) == 1.5
+    assert tuner.finer(1.0) is None
+
+
+def test_tuner_walks_the_ladder(tuner, capsys):
+    config = tuner.tracker.detector_config
+    # Over budget (26.7 ms) and every step pays off: one rung per window up to the top of the range
+    for seconds, expected in ((0.2, 1.5), (0.1, 2.0), (0.05, 3.0), (0.03, 3.0)):
+        run_window(tuner, seconds)
+        assert config['quad_decimate'] == expected
+
+    # Well under budget: back down one rung at a time
+    for expected in (2.0, 1.5, 1.0, 1.0):
+        run_window(tuner, 0.001)
+        assert config['quad_decimate'] == expected
+    assert tuner.tracker.metrics.counters['detector_changes'] == 6
+    assert "quad_decimate 1.0 -> 1.5" in capsys.readouterr().out
+
+
+def test_step_without_gain_is_reverted(tuner):
+    run_window(tuner, 0.1)
+    assert tuner.tracker.detector_config['quad_decimate'] == 1.5
+    run_window(tuner, 0.1)  # not faster: undo and leave quad_decimate alone
+    assert tuner.tracker.detector_config['quad_decimate'] == 1.0
+    assert 'quad_decimate' in tuner.no_gain
+    run_window(tuner, 0.1)
+    assert tuner.tracker.detector_config['quad_decimate'] == 1.0
@@ -0,0 +1,29 @@
+import cv2
+import numpy as np
+from color_segmentation import MultiColorSegmenter
+
+
+def hsv_range(hmin, hmax, smin=100, smax=255, vmin=100, vmax=255):
+    return {'hmin': hmin, 'hmax': hmax, 'smin': smin, 'smax': smax, 'vmin': vmin, 'vmax': vmax}
+
+
+def test_label_bits_match_per_colour_inrange():
+    ranges = [hsv_range(0, 10), hsv_range(5, 30), hsv_range(100, 130, smin=0, vmin=0)]
+    rng = np.random.default_rng(0)
+    img = rng.integers(0, 256, size=(60, 80, 3), dtype=np.uint8)
+    labels = MultiColorSegmenter(ranges).segment(img)
+
+    assert labels.dtype == np.uint8
+    hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
+    for k, vals in enumerate(ranges):
+        expected = cv2.inRange(hsv, np.array([vals['hmin'], vals['smin'], vals['vmin']]),
+                               np.array([vals['hmax'], vals['smax'], vals['vmax']])) > 0
+        np.testing.assert_array_equal((labels & (1 << k)) > 0, expected)
+    assert ((labels & 3) == 3).any()  # overlapping ranges set both bits
+
+
+def test_more_than_eight_colours():
+    ranges = [hsv_range(10 * k, 10 * k + 9) for k in range(10)]
+    labels = MultiColorSegmenter(ranges).segment(np.full((2, 2, 3), (0, 0, 255), np.uint8))  # red, hue 0
+    assert labels.dtype == np.int32
+    assert (labels == 1).all()
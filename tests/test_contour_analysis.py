@@ -0,0 +1,73 @@
+import cv2
+import numpy as np
+import pytest
+from contour_analysis import ContourAnalyzer
+from frame_sources import IRREGULAR_POLYGONS, _regular_polygon
+
+SHAPES = {f'regular {n}': (n, _regular_polygon(n, 1.0)) for n in (3, 4, 5, 6)}
+SHAPES.update({
+    'isosceles triangle': (3, np.array(IRREGULAR_POLYGONS[3])),
+    'right triangle': (3, np.array([(-0.8, -0.8), (0.9, -0.8), (-0.8, 0.9)])),
+    'irregular quadrilateral': (4, np.array(IRREGULAR_POLYGONS[4])),
+    'house pentagon': (5, np.array(IRREGULAR_POLYGONS[5])),
+    'stretched hexagon': (6, np.array(IRREGULAR_POLYGONS[6])),
+})
+ROTATIONS = (0, 17, 45, 100, 200, 301)
+
+
+def draw(labels, polygon, value, rotation=0, center=(160, 120), radius=60):
+    """Fill a unit polygon, rotated by `rotation` degrees and scaled to `radius`, with `value`."""
+    a = np.radians(rotation)
+    R = np.array([[np.cos(a), -np.sin(a)], [np.sin(a), np.cos(a)]])
+    points = polygon @ R.T * radius + center
+    cv2.fillPoly(labels, [np.round(points * 16).astype(np.int32)], value, cv2.LINE_AA, 4)
+    return labels
+
+
+def analyze(polygon, rotation):
+    return ContourAnalyzer(1).analyze(draw(np.zeros((240, 320), np.uint8), polygon, 1, rotation))
+
+
+@pytest.mark.parametrize('name', SHAPES)
+def test_sides_at_any_rotation(name):
+    sides, polygon = SHAPES[name]
+    for rotation in ROTATIONS:
+        blobs = analyze(polygon, rotation)
+        assert blobs['sides'].tolist() == [sides], f"{name} rotated by {rotation}"
+
+
+@pytest.mark.parametrize('name, symmetry', [
+    ('regular 3', 120), ('regular 4', 90), ('regular 5', 72), ('regular 6', 60),
+    ('isosceles triangle', 360), ('irregular quadrilateral', 360), ('house pentagon', 360),
+    ('right triangle', 180), ('stretched hexagon', 180),  # no longer tail along the principal axis
+])
+def test_heading_follows_rotation(name, symmetry):
+    _, polygon = SHAPES[name]
+    start = analyze(polygon, 0)['heading'][0]
+    for rotation in ROTATIONS:
+        blobs = analyze(polygon, rotation)
+        assert blobs['symmetry'].tolist() == [symmetry]
+        error = (blobs['heading'][0] - start - rotation + symmetry / 2) % symmetry - symmetry / 2
+        assert abs(error) < 2, f"{name} rotated by {rotation}"
+
+
+def test_small_blobs_dropped():
+    labels = draw(np.zeros((240, 320), np.uint8), SHAPES['regular 4'][1], 1, radius=10)
+    assert len(ContourAnalyzer(1).analyze(labels)['cls']) == 0
+
+
+def test_blob_inside_a_blob_of_another_colour():
+    # A class 1 triangle inside a class 0 square: one connected region, two blobs
+    labels = draw(np.zeros((240, 320), np.uint8), SHAPES['regular 4'][1], 1, rotation=45, radius=90)
+    draw(labels, SHAPES['regular 3'][1], 2, radius=40)
+    blobs = ContourAnalyzer(2).analyze(labels)
+    assert blobs['cls'].tolist() == [0, 1]
+    assert blobs['sides'].tolist() == [4, 3]  # the square's outline ignores the hole
+    np.testing.assert_allclose(blobs['center'][1], [160, 120], atol=5)
+
+
+def test_touching_blobs_of_different_colours():
+    labels = draw(np.zeros((240, 320), np.uint8), SHAPES['regular 4'][1], 1, rotation=45, center=(100, 120))
+    draw(labels, SHAPES['regular 6'][1], 2, center=(190, 120))  # covers the square's right edge
+    blobs = ContourAnalyzer(2).analyze(labels)
+    assert sorted(zip(blobs['cls'].tolist(), blobs['sides'].tolist())) == [(0, 4), (1, 6)]
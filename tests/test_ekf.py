@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+from EKF import BatchExtendedKalmanFilter, ExtendedKalmanFilter
+
+# Correlated x, y noise. The heading stays uncorrelated: its residual is taken mod 360
+# like in the original filter, and a -3 degree error read as 357 would swamp x, y
+FULL_Q = np.array([[0.55, 0.1, 0.0], [0.1, 0.05, 0.0], [0.0, 0.0, 0.552]])
+
+
+def frames(n_frames=60, n_tags=12, seed=0):
+    """Random frames of (tag IDs, measurements): tags come and go, headings cross 0/360."""
+    rng = np.random.default_rng(seed)
+    truth = rng.uniform([0, 0, 0], [640, 480, 360], size=(n_tags, 3))
+    for _ in range(n_frames):
+        truth += rng.normal(0, [2, 2, 4], size=truth.shape)
+        truth[:, 2] %= 360
+        seen = np.flatnonzero(rng.random(n_tags) < 0.7)
+        rng.shuffle(seen)
+        yield seen.tolist(), truth[seen] + rng.normal(0, 0.5, size=(len(seen), 3))
+
+
+@pytest.mark.parametrize('fast', [True, False])
+@pytest.mark.parametrize('Q', [None, FULL_Q], ids=['diagonal', 'full'])
+def test_batch_matches_per_tag_filter(fast, Q):
+    single = ExtendedKalmanFilter(fast=fast)
+    batch = BatchExtendedKalmanFilter(capacity=4, Q=Q)  # grows past its capacity
+    if Q is not None:
+        single.Q = Q
+        single.refresh_model()
+    assert batch.diagonal == (Q is None)
+
+    for tag_ids, measurements in frames():
+        expected = np.array([single.predict_and_update(t, z) for t, z in zip(tag_ids, measurements)])
+        np.testing.assert_allclose(batch.predict_and_update(tag_ids, measurements), expected.reshape(-1, 3),
+                                   rtol=1e-9, atol=1e-9)
+
+    for tag_id, slot in batch.slots.items():
+        np.testing.assert_allclose(batch.x[slot], single.states[tag_id], rtol=1e-9, atol=1e-9)
+        np.testing.assert_allclose(batch.P[slot], single.P[tag_id], rtol=1e-9, atol=1e-12)
+
+
+def test_removed_tag_starts_over():
+    batch = BatchExtendedKalmanFilter()
+    batch.predict_and_update([1, 2], [[10.0, 10.0, 10.0], [20.0, 20.0, 20.0]])
+    batch.predict_and_update([1, 2], [[12.0, 12.0, 12.0], [22.0, 22.0, 22.0]])
+    batch.remove(1)
+    # A removed tag is initialised from its next measurement, the other one keeps its filter
+    out = batch.predict_and_update([1, 2], [[50.0, 50.0, 50.0], [24.0, 24.0, 24.0]])
+    np.testing.assert_allclose(out[0], [50.0, 50.0, 50.0])
+    assert not np.allclose(out[1], [24.0, 24.0, 24.0])
+
+
+def test_duplicate_tag_in_one_frame_last_row_wins():
+    batch = BatchExtendedKalmanFilter()
+    batch.predict_and_update([5], [[0.0, 0.0, 0.0]])
+    batch.predict_and_update([5, 5], [[100.0, 100.0, 100.0], [1.0, 1.0, 1.0]])
+    single = ExtendedKalmanFilter()
+    single.predict_and_update(5, [0.0, 0.0, 0.0])
+    np.testing.assert_allclose(batch.get_state(5), single.predict_and_update(5, [1.0, 1.0, 1.0]))
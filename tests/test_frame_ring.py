@@ -0,0 +1,84 @@
+import os
+import numpy as np
+import pytest
+from frame_ring import CLOSED, FrameRingReader, FrameRingWriter
+
+
+@pytest.fixture
+def ring_name():
+    return f"test_ring_{os.getpid()}"
+
+
+def frame(i, shape=(6, 8, 3)):
+    return np.full(shape, i, np.uint8)
+
+
+@pytest.mark.parametrize('copy', [False, True])
+def test_round_trip(ring_name, copy):
+    writer = FrameRingWriter(ring_name, (6, 8, 3), slots=4)
+    reader = FrameRingReader(ring_name, copy=copy)
+    try:
+        assert reader.shape == (6, 8, 3)
+        writer.write(frame(1), timestamp=10.0)
+        success, img = reader.read(timeout=0.1)
+        assert success
+        np.testing.assert_array_equal(img, frame(1))
+        assert (reader.seq, reader.timestamp) == (1, 10.0)
+        assert reader.intact()
+        assert img.flags.writeable == copy
+
+        # Nothing new: times out
+        assert reader.read(timeout=0.01) == (False, None)
+    finally:
+        reader.release()
+        writer.close()
+
+
+def test_reader_gets_newest_frame_and_counts_skipped(ring_name):
+    writer = FrameRingWriter(ring_name, (6, 8), slots=4)
+    reader = FrameRingReader(ring_name)
+    try:
+        writer.write(frame(1, (6, 8)))
+        reader.read(timeout=0.1)
+        for i in range(2, 6):
+            writer.write(frame(i, (6, 8)))
+        success, img = reader.read(timeout=0.1)
+        assert success
+        assert img.shape == (6, 8)  # single channel frames come back 2-D
+        np.testing.assert_array_equal(img, frame(5, (6, 8)))
+        assert reader.skipped == 3
+    finally:
+        reader.release()
+        writer.close()
+
+
+def test_view_is_not_intact_after_slot_reuse(ring_name):
+    writer = FrameRingWriter(ring_name, (6, 8, 3), slots=2)
+    views = FrameRingReader(ring_name)
+    copies = FrameRingReader(ring_name, copy=True)
+    try:
+        writer.write(frame(1))
+        _, view = views.read(timeout=0.1)
+        _, copy = copies.read(timeout=0.1)
+        writer.write(frame(2))
+        writer.write(frame(3))  # reuses the slot of frame 1
+        assert not views.intact()
+        np.testing.assert_array_equal(view, frame(3))
+        np.testing.assert_array_equal(copy, frame(1))
+    finally:
+        views.release()
+        copies.release()
+        writer.close()
+
+
+def test_read_fails_once_writer_closed(ring_name):
+    writer = FrameRingWriter(ring_name, (6, 8, 3), slots=2)
+    reader = FrameRingReader(ring_name)
+    try:
+        writer.write(frame(1))
+        reader.read(timeout=0.1)
+        writer.header[CLOSED] = 1  # what close() sets before unlinking the block
+        assert reader.read(timeout=1.0) == (False, None)
+    finally:
+        reader.release()
+        writer.close()
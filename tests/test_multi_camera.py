@@ -0,0 +1,48 @@
+from types import SimpleNamespace
+import numpy as np
+import pytest
+from multi_camera import MultiCameraTracker, WorldFusion, camera_homography, tag_world_poses
+from track_plane import TrackPlane
+
+# 1 mm per pixel, origin at pixel (320, 240), track y pointing up
+H = np.array([[0.001, 0.0, -0.32],
+              [0.0, -0.001, 0.24],
+              [0.0, 0.0, 1.0]])
+
+
+def test_camera_without_homography_is_refused(tmp_path):
+    np.save(tmp_path / 'left.npy', H)
+    cameras = [{'name': 'left', 'source': 0, 'homography': str(tmp_path / 'left.npy')},
+               {'name': 'right', 'source': 1}]
+    np.testing.assert_array_equal(camera_homography(cameras[0]), H)
+    assert camera_homography(cameras[1]) is None
+    with pytest.raises(ValueError, match='right'):
+        MultiCameraTracker(cameras, endpoints=[])
+
+
+def test_tag_world_poses():
+    # Tag at the image center, its top edge pointing right (image x)
+    tag = SimpleNamespace(tag_id=7, center=(320.0, 240.0), corners=[(300.0, 220.0), (340.0, 220.0)])
+    ids, poses = tag_world_poses(TrackPlane(H), [tag])
+    assert ids == [7]
+    np.testing.assert_allclose(poses, [[0.0, 0.0, 0.0]], atol=1e-12)
+    assert tag_world_poses(TrackPlane(H), [])[1].shape == (0, 3)
+
+
+def test_fusion_in_capture_order():
+    fusion = WorldFusion(latency_window=0.03)
+    # The second camera's frame is delivered first
+    fusion.add(10.02, [1], np.array([[0.02, 0.0, 0.0]]))
+    fusion.add(10.00, [1], np.array([[0.00, 0.0, 0.0]]))
+    fusion.add(10.10, [2], np.array([[1.0, 1.0, 90.0]]))  # still inside the latency window
+
+    timestamp, ids, states = fusion.step(now=10.06)
+    assert (timestamp, ids) == (10.02, [1])
+    assert states[0, 0] > 0.0  # moved towards the newer measurement
+    assert fusion.kalman.x[fusion.kalman.slots[1], 3] > 0.0  # and picked up a forward velocity
+    assert len(fusion.pending) == 1
+
+    fusion.add(10.01, [1], np.array([[0.01, 0.0, 0.0]]))  # older than what was fused
+    assert fusion.late == 1
+    assert fusion.step(now=10.06) is None
+    assert fusion.step(now=10.2)[1] == [2]
@@ -0,0 +1,69 @@
+import time
+import numpy as np
+from pipeline import LatestQueue, TrackingPipeline
+
+
+def run(pipeline, timeout=2.0):
+    """Start the pipeline and wait until it stops by itself."""
+    pipeline.start()
+    deadline = time.perf_counter() + timeout
+    while pipeline.is_running() and time.perf_counter() < deadline:
+        time.sleep(0.01)
+    stopped = not pipeline.is_running()
+    pipeline.stop()
+    return stopped
+
+
+def source(n_frames):
+    frames = iter(range(n_frames))
+    return lambda: next(frames, None)
+
+
+def test_latest_queue_drops_oldest():
+    queue = LatestQueue(2)
+    for i in range(5):
+        queue.put(i)
+    assert queue.dropped == 3
+    assert [queue.get(), queue.get()] == [3, 4]
+    assert queue.get(timeout=0.01) is None
+
+
+def test_end_of_stream_stops_the_pipeline():
+    seen = []
+    stages = [('detect', lambda packet: packet), ('publish', lambda packet: seen.append(packet.img) or packet)]
+    pipeline = TrackingPipeline(source(20), stages, queue_size=100)
+    assert run(pipeline)
+    assert pipeline.error is None
+    assert pipeline.frames_in == 20
+    assert seen == list(range(len(seen)))  # in order, none dropped (end of stream may cut the tail)
+    assert pipeline.report()['detect']['dropped'] == 0
+
+
+def test_capture_error_stops_the_pipeline(capsys):
+    def capture():
+        raise OSError("camera unplugged")
+
+    pipeline = TrackingPipeline(capture, [('detect', lambda packet: packet)])
+    assert run(pipeline)  # would hang if the capture thread died alone
+    stage, error = pipeline.error
+    assert stage == 'capture'
+    assert isinstance(error, OSError)
+    assert "capture stage failed (OSError: camera unplugged)" in pipeline.format_report()
+    assert "camera unplugged" in capsys.readouterr().err
+
+
+def test_stage_error_stops_the_pipeline():
+    def detect(packet):
+        if packet.seq == 3:
+            raise ValueError("bad frame")
+        return packet
+
+    def capture():
+        time.sleep(0.001)
+        return np.zeros((2, 2))
+
+    pipeline = TrackingPipeline(capture, [('detect', detect)], queue_size=100)
+    assert run(pipeline)
+    assert pipeline.error[0] == 'detect'
+    assert pipeline.frames_out == 3
+    assert "detect stage failed" in pipeline.format_report()
@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+from session_recorder import DETECTION, STATE, RecordingSource, SessionReader, SessionRecorder
+
+
+def record_session(path, compress, n_frames=7, chunk_frames=3):
+    rng = np.random.default_rng(0)
+    frames = rng.integers(0, 256, size=(n_frames, 24, 32, 3), dtype=np.uint8)
+    recorder = SessionRecorder(str(path), chunk_frames=chunk_frames, compress=compress)
+    for i, frame in enumerate(frames):
+        detections = ([1, 2], np.array([[i, 2.0 * i, 10.0], [5.0, 6.0, 350.0]]), None)
+        states = ([1], np.array([[i + 0.5, 2.0 * i, 11.0]]), [1])
+        recorder.record(frame, 100.0 + i / 30, detections, states if i % 2 else None)
+    recorder.close()
+    assert recorder.error is None
+    assert recorder.dropped == 0
+    return frames
+
+
+@pytest.mark.parametrize('compress', [False, True])
+def test_frames_round_trip(tmp_path, compress):
+    # 7 frames in chunks of 3: two full chunks and a short last one
+    frames = record_session(tmp_path, compress)
+    reader = SessionReader(str(tmp_path))
+    assert len(reader) == len(frames)
+    for i, frame in enumerate(frames):
+        np.testing.assert_array_equal(reader.frame(i), frame)
+
+    index = reader.index()
+    assert index['seq'].tolist() == list(range(1, len(frames) + 1))
+    np.testing.assert_allclose(index['timestamp'], 100.0 + np.arange(len(frames)) / 30)
+
+
+def test_tracks_round_trip(tmp_path):
+    frames = record_session(tmp_path, compress=False)
+    reader = SessionReader(str(tmp_path))
+
+    detections = reader.tracks(DETECTION)
+    assert len(detections) == 2 * len(frames)
+    assert detections['id'].tolist() == [1, 2] * len(frames)
+    np.testing.assert_allclose(detections['x'][::2], np.arange(len(frames)))
+    np.testing.assert_allclose(detections['angle'][1::2], 350.0)
+
+    states = reader.tracks(STATE)
+    assert states['seq'].tolist() == [2, 4, 6]
+    np.testing.assert_allclose(states['x'], [1.5, 3.5, 5.5])
+    assert states['flags'].tolist() == [1, 1, 1]
+    assert len(reader.tracks()) == len(detections) + len(states)
+
+
+def test_recording_source_replays_frames(tmp_path):
+    frames = record_session(tmp_path, compress=True)
+    source = RecordingSource(str(tmp_path))
+    replayed = []
+    while True:
+        success, img = source.read()
+        if not success:
+            break
+        replayed.append(img)
+    source.release()
+    np.testing.assert_array_equal(np.array(replayed), frames)
@@ -0,0 +1,70 @@
+import socket
+import struct
+import numpy as np
+import pytest
+from publisher import Endpoint, Publisher
+from telemetry import FRAME_METRIC, TAG_PREDICTED, decode_frame, encode_csv, encode_frame, is_binary_frame
+
+
+def test_frame_round_trip():
+    ids = [3, 7, 65535]
+    poses = np.array([[12.5, 480.25, 359.5], [0.0, -1.5, 0.0], [1e4, 2e4, 180.0]])
+    flags = [0, TAG_PREDICTED, 0]
+    data = encode_frame(2 ** 32 + 5, 1234.5, ids, poses, flags, FRAME_METRIC)
+
+    assert is_binary_frame(data)
+    assert data[3] & FRAME_METRIC
+    seq, timestamp, tags = decode_frame(data)
+    assert seq == 5  # wraps at 32 bits
+    assert timestamp == 1234.5
+    assert tags['id'].tolist() == ids
+    np.testing.assert_allclose(np.column_stack((tags['x'], tags['y'], tags['angle'])), poses, rtol=1e-6)
+    assert tags['flags'].tolist() == flags
+
+
+def test_empty_frame_round_trip():
+    seq, _, tags = decode_frame(encode_frame(1, 0.0, [], np.empty((0, 3))))
+    assert seq == 1
+    assert len(tags) == 0
+
+
+def test_decode_rejects_csv():
+    data = encode_csv([1], np.array([[1.0, 2.0, 3.0]]))[0]
+    assert not is_binary_frame(data)
+    with pytest.raises((ValueError, struct.error)):
+        decode_frame(data)
+
+
+def test_csv_mirror_truncates_first():
+    # Same as the original scripts: int() first, then measured from the right / bottom edge
+    poses = np.array([[100.7, 50.2, 33.9]])
+    assert encode_csv([1], poses, mirror=(640, 480)) == [b"1,540,430,33"]
+    assert encode_csv([1], poses) == [b"1,100,50,33"]
+    assert encode_csv([1], poses, metric=True) == [b"1,100.700,50.200,33.900"]
+
+
+@pytest.fixture
+def receiver():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("127.0.0.1", 0))
+    sock.settimeout(1.0)
+    yield sock
+    sock.close()
+
+
+def test_publisher_round_trip(receiver):
+    address = receiver.getsockname()
+    publisher = Publisher([Endpoint('binary', address), Endpoint('csv', address, binary=False)])
+    poses = np.array([[100.7, 50.2, 33.9], [10.0, 20.0, 30.0]])
+    publisher.publish([1, 2], poses, timestamp=99.0, mirror=(640, 480))
+    publisher.close()
+
+    seq, timestamp, tags = decode_frame(receiver.recv(65535))
+    assert (seq, timestamp) == (1, 99.0)
+    assert tags['id'].tolist() == [1, 2]
+    # Binary frames mirror exactly, CSV after truncation
+    np.testing.assert_allclose(tags['x'], [539.3, 630.0], rtol=1e-6)
+    np.testing.assert_allclose(tags['y'], [429.8, 460.0], rtol=1e-6)
+    assert [receiver.recv(65535), receiver.recv(65535)] == [b"1,540,430,33", b"2,630,460,30"]
+    assert publisher.stats() == {'binary': {'sent': 1, 'dropped': 0, 'skipped': 0},
+                                 'csv': {'sent': 2, 'dropped': 0, 'skipped': 0}}
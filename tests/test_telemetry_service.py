@@ -0,0 +1,64 @@
+import json
+import time
+from types import SimpleNamespace
+import pytest
+from metrics import Metrics
+from telemetry_service import TelemetryService
+
+
+class FakeTransport:
+    def __init__(self):
+        self.sent = []
+
+    def sendto(self, data, addr):
+        self.sent.append((json.loads(data), addr))
+
+
+@pytest.fixture
+def service():
+    service = TelemetryService(SimpleNamespace(metrics=Metrics()), port=5060)
+    service.transport = FakeTransport()
+    return service
+
+
+def send(service, message, commands=True):
+    service.handle_datagram(json.dumps(message).encode(), ('10.0.0.2', 4210), commands)
+    return [reply for reply, _ in service.transport.sent]
+
+
+def test_ack_measures_round_trip(service):
+    service.sent_times[41] = time.perf_counter()
+    for commands in (True, False):  # on the control and on the telemetry socket
+        assert send(service, {'ack': 41}, commands) == []
+    assert service.tracker.metrics.counters['acks'] == 2
+    assert service.tracker.metrics.stats['ack_rtt'].count == 2
+
+
+@pytest.mark.parametrize('ack', ['41', 41.0, None, True, [41]])
+def test_bad_ack_gets_an_error(service, ack):
+    replies = send(service, {'ack': ack}, commands=False)
+    assert len(replies) == 1
+    assert not replies[0]['ok']
+    assert replies[0]['error'].startswith('bad ack')
+    assert 'acks' not in service.tracker.metrics.counters
+
+
+def test_commands_only_on_the_control_socket(service):
+    assert send(service, {'cmd': 'select', 'tags': [3]}, commands=False) == [
+        {'ok': False, 'error': 'commands go to port 5060'}]
+    assert service.pending == []
+
+
+def test_commands(service):
+    replies = send(service, {'cmd': 'ping'})
+    assert replies[0]['ok'] and replies[0]['cmd'] == 'ping'
+
+    assert not send(service, {'cmd': 'fly'})[-1]['ok']
+    assert send(service, [1, 2])[-1]['error'].startswith('bad message')
+
+    # Changes to the tracker wait for apply_pending() between two frames
+    send(service, {'cmd': 'select', 'tags': [7, 3]})
+    assert len(service.pending) == 1 and service.selected is None
+    service.apply_pending()
+    assert service.selected == {3, 7}
+    assert service.transport.sent[-1][0] == {'ok': True, 'cmd': 'select', 'selected': [3, 7]}
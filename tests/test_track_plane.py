@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+from calibration_bundle import DEFAULT_CAMERA_MATRIX, DEFAULT_DIST_COEFFS, CalibrationBundle
+from track_plane import TrackPlane, image_to_world, world_lut
+
+# 1 mm per pixel, origin at pixel (320, 240), track y pointing up (mirrored image y)
+H = np.array([[0.001, 0.0, -0.32],
+              [0.0, -0.001, 0.24],
+              [0.0, 0.0, 1.0]])
+
+
+def builtin_undistorter():
+    return CalibrationBundle(DEFAULT_CAMERA_MATRIX, DEFAULT_DIST_COEFFS).undistorter()
+
+
+def test_poses_through_homography():
+    plane = TrackPlane(H)
+    points = np.array([[320.0, 240.0], [420.0, 140.0], [0.0, 480.0]])
+    headings = np.array([0.0, 90.0, 315.0])  # image atan2 convention, y down
+    poses = plane.poses(points, headings)
+
+    np.testing.assert_allclose(poses[:, :2], [[0.0, 0.0], [0.1, 0.1], [-0.32, -0.24]], atol=1e-12)
+    # Image y down, track y up: headings are mirrored
+    np.testing.assert_allclose(poses[:, 2], np.radians([0.0, 270.0, 45.0]), atol=1e-9)
+
+
+def test_poses_of_no_detections():
+    assert TrackPlane(H).poses(np.empty((0, 2)), np.empty(0)).shape == (0, 3)
+
+
+def test_perspective_heading_is_not_the_image_angle():
+    # Under perspective a heading has to be mapped, not copied
+    H_perspective = np.array([[1e-3, 2e-4, 0.0], [0.0, 1e-3, 0.0], [0.0, 1e-3, 1.0]])
+    plane = TrackPlane(H_perspective)
+    pose = plane.poses([[300.0, 200.0]], [45.0])[0]
+    start, ahead = image_to_world(H_perspective, [[300.0, 200.0], [300.0 + 16 / np.sqrt(2), 200.0 + 16 / np.sqrt(2)]])
+    delta = ahead - start
+    assert pose[2] == pytest.approx(np.arctan2(delta[1], delta[0]) % (2 * np.pi))
+    assert pose[2] != pytest.approx(np.pi / 4, abs=1e-3)
+
+
+def test_raw_points_through_lookup_table_match_undistorted_points():
+    undistorter = builtin_undistorter()
+    raw = np.array([[20.5, 30.25], [320.0, 240.0], [600.75, 455.5], [639.0, 0.0]])
+    headings = np.array([10.0, 100.0, 200.0, 300.0])
+
+    with_lut = TrackPlane(H, world_lut(H, (640, 480), undistorter), undistorter).poses(raw, headings, raw=True)
+    without_lut = TrackPlane(H, None, undistorter).poses(raw, headings, raw=True)
+    np.testing.assert_allclose(with_lut[:, :2], without_lut[:, :2], atol=1e-4)  # 0.1 mm
+    np.testing.assert_allclose(with_lut[:, 2], without_lut[:, 2], atol=1e-3)
+
+    # Same positions as undistorting the points first
+    undistorted = TrackPlane(H).to_world(undistorter.undistort_points(raw))
+    np.testing.assert_allclose(with_lut[:, :2], undistorted, atol=1e-4)
+
+
+def test_raw_points_outside_the_lookup_table():
+    undistorter = builtin_undistorter()
+    plane = TrackPlane(H, world_lut(H, (640, 480), undistorter), undistorter)
+    outside = np.array([[-5.0, 100.0], [700.0, 500.0]])
+    np.testing.assert_allclose(plane.to_world(outside, raw=True),
+                               image_to_world(H, undistorter.undistort_points(outside)))
@@ -0,0 +1,143 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+from pupil_apriltags import Detector
+from adaptive_detector import TUNABLE, tune_detector
+
+
+def parse_tiles(text):
+    """"CxR" (e.g. "3x2") -> (columns, rows)."""
+    cols, sep, rows = text.lower().partition('x')
+    if not sep or not cols.isdigit() or not rows.isdigit() or int(cols) < 1 or int(rows) < 1:
+        raise ValueError(f"Invalid tile grid '{text}', expected CxR, e.g. 2x2")
+    return int(cols), int(rows)
+
+
+def tile_grid(shape, tiles=(2, 2), overlap=128):
+    """
+    (x0, y0, x1, y1) boxes of a cols x rows grid over an image of `shape`. Neighbouring
+    tiles share `overlap` pixels, so a tag whose bounding box is smaller than that is
+    completely inside at least one tile.
+    """
+    height, width = shape[:2]
+    cols, rows = tiles
+    xs = np.linspace(0, width, cols + 1).round().astype(int)
+    ys = np.linspace(0, height, rows + 1).round().astype(int)
+    half = overlap // 2
+    return [(max(0, xs[c] - half), max(0, ys[r] - half), min(width, xs[c + 1] + half), min(height, ys[r + 1] + half))
+            for r in range(rows) for c in range(cols)]
+
+
+# Worker process state: the attached shared frame and this worker's detector
+_worker = {}
+
+
+def _frame(name, shape):
+    if _worker.get('name') != name:
+        if 'shm' in _worker:
+            del _worker['frame']
+            _worker['shm'].close()
+        # The parent owns the block (and its resource tracker entry, shared with the pool)
+        shm = shared_memory.SharedMemory(name=name)
+        _worker.update(name=name, shm=shm, frame=np.ndarray(shape, np.uint8, shm.buf))
+    return _worker['frame']
+
+
+def _detector(config):
+    old = _worker.get('config')
+    if old != config:
+        changes = {k: v for k, v in config.items() if old is None or old[k] != v}
+        if old is not None and all(k in TUNABLE for k in changes):
+            tune_detector(_worker['detector'], **changes)
+        else:
+            _worker['detector'] = Detector(**config)
+        _worker['config'] = config
+    return _worker['detector']
+
+
+def _detect_tile(name, shape, box, config):
+    x0, y0, x1, y1 = box
+    tile = np.ascontiguousarray(_frame(name, shape)[y0:y1, x0:x1])
+    results = _detector(config).detect(tile)
+    for r in results:
+        # Back to full-frame coordinates
+        r.center = r.center + (x0, y0)
+        r.corners = r.corners + (x0, y0)
+    return results
+
+
+class TiledDetector:
+    """
+    AprilTag detection of high-resolution frames on a process pool.
+
+    The gray frame is copied once into a shared memory block; every worker process
+    attaches to it and runs its own single-threaded Detector on one overlapping tile,
+    so nothing but the tile boxes and the detections is pickled. Tags found in two
+    tiles (inside an overlap zone) are merged by tag ID, keeping the detection with
+    the best decision margin.
+
+    `overlap` must be larger than the biggest tag (with its white border) in pixels,
+    otherwise a tag on a tile boundary can be missed. Throughput scales with the
+    number of cores up to one worker per tile.
+    """
+
+    def __init__(self, detector_config, tiles=(2, 2), overlap=128, workers=None):
+        self.tiles = tiles
+        self.overlap = overlap
+        self.workers = workers or min(tiles[0] * tiles[1], os.cpu_count() or 1)
+        # The pool provides the parallelism, one detector thread per worker
+        self.config = dict(detector_config, nthreads=1)
+        self.pool = ProcessPoolExecutor(max_workers=self.workers)
+
+        self.shm = None
+        self.frame = None
+        self.boxes = []
+        self.frames = 0
+        self.duplicates = 0  # detections dropped because another tile found the same tag
+
+    def configure(self, detector_config):
+        """New detector settings, picked up by every worker with its next tile."""
+        self.config = dict(detector_config, nthreads=1)
+
+    def _allocate(self, shape):
+        self._release()
+        self.shm = shared_memory.SharedMemory(create=True, size=int(np.prod(shape)))
+        self.frame = np.ndarray(shape, np.uint8, self.shm.buf)
+        self.boxes = tile_grid(shape, self.tiles, self.overlap)
+
+    def detect(self, gray):
+        if self.frame is None or self.frame.shape != gray.shape:
+            self._allocate(gray.shape)
+        self.frame[...] = gray
+        n = len(self.boxes)
+        tiles = self.pool.map(_detect_tile, [self.shm.name] * n, [gray.shape] * n, self.boxes, [self.config] * n)
+        self.frames += 1
+        return self.merge(tiles)
+
+    def merge(self, tiles):
+        best = {}
+        for results in tiles:
+            for r in results:
+                other = best.get(r.tag_id)
+                if other is not None:
+                    self.duplicates += 1
+                    if other.decision_margin >= r.decision_margin:
+                        continue
+                best[r.tag_id] = r
+        return list(best.values())
+
+    def _release(self):
+        if self.shm is not None:
+            self.frame = None
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+
+    def close(self):
+        self.pool.shutdown(wait=True)
+        self._release()
+
+    def format_stats(self):
+        return (f"tiles {self.tiles[0]}x{self.tiles[1]} overlap {self.overlap}px, {self.workers} workers, "
+                f"{self.frames} frames, {self.duplicates} duplicates merged")
@@ -0,0 +1,71 @@
+import numpy as np
+from telemetry import TAG_PREDICTED
+
+
+class TrackManager:
+    """
+    Lifecycle of the EKF tracks of a BatchExtendedKalmanFilter.
+
+    A tag that is not detected keeps its track and coasts on the filter prediction
+    for up to `max_coast_frames` frames; those poses are published with the
+    TAG_PREDICTED flag. After that the track is evicted and its filter slot freed,
+    so memory stays bounded by the number of cars on the track at once.
+    If the tag comes back while coasting, its motion history is still there.
+    """
+
+    def __init__(self, kalman, max_coast_frames=5):
+        self.kalman = kalman
+        self.max_coast_frames = max_coast_frames
+        self.misses = {}  # tag ID -> consecutive frames without a detection
+        self.births = 0
+        self.deaths = 0
+
+    @property
+    def tracks(self):
+        return list(self.misses)
+
+    def coasting(self):
+        return [tag_id for tag_id, misses in self.misses.items() if misses > 0]
+
+    def update(self, tag_ids, measurements, timestamp=None):
+        """
+        Filter one frame of detections and coast the tracks that were missed.
+        Returns (tag_ids, states (M, 3), flags (M,)) of every live track:
+        the detected tags first, in input order, then the coasting ones.
+        """
+        states = self.kalman.predict_and_update(tag_ids, measurements, timestamp)
+
+        seen = set(tag_ids)
+        for tag_id in seen:
+            if tag_id not in self.misses:
+                self.births += 1
+            self.misses[tag_id] = 0
+
+        coasting = []
+        for tag_id in list(self.misses):
+            if tag_id in seen:
+                continue
+            self.misses[tag_id] += 1
+            if self.misses[tag_id] > self.max_coast_frames:
+                self.evict(tag_id)
+            else:
+                coasting.append(tag_id)
+
+        flags = np.zeros(len(tag_ids) + len(coasting), dtype=np.uint8)
+        if not coasting:
+            return list(tag_ids), states, flags
+
+        # Coasting tracks are only predicted, their filter state is left untouched
+        # so the gap is covered by one prediction when the tag is seen again
+        predicted = self.kalman.predict_states(coasting, timestamp)
+        flags[len(tag_ids):] = TAG_PREDICTED
+        return list(tag_ids) + coasting, np.vstack((states.reshape(-1, 3), predicted)), flags
+
+    def evict(self, tag_id):
+        del self.misses[tag_id]
+        self.kalman.remove(tag_id)
+        self.deaths += 1
+
+    def format_stats(self):
+        return (f"tracks {len(self.misses)} (coasting {len(self.coasting())})  "
+                f"births {self.births}  deaths {self.deaths}")
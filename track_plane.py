@@ -0,0 +1,198 @@
+import argparse
+import json
+import os
+import cv2
+import numpy as np
+
+
+def load_homography(path):
+    """Image -> track plane homography stored as .npy or in an .npz under 'homography'."""
+    data = np.load(path)
+    if isinstance(data, np.lib.npyio.NpzFile):
+        data = data['homography']
+    return np.asarray(data, dtype=np.float64).reshape(3, 3)
+
+
+def image_to_world(H, points):
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 1, 2)
+    if len(points) == 0:
+        return points.reshape(-1, 2)
+    return cv2.perspectiveTransform(points, H).reshape(-1, 2)
+
+
+def plane_error(H, image_points, world_points):
+    """RMS distance on the track plane (metres) between mapped image points and their known positions."""
+    mapped = image_to_world(H, image_points)
+    return float(np.sqrt(np.mean(np.sum((mapped - np.asarray(world_points).reshape(-1, 2)) ** 2, axis=1))))
+
+
+def world_lut(H, resolution, undistorter=None):
+    """
+    Track-plane (x, y) of every pixel of a (width, height) frame, (height, width, 2) float32.
+    With an undistorter the table is indexed by raw frame pixels: the lens correction and
+    the homography are folded into one lookup.
+    """
+    width, height = resolution
+    xs, ys = np.meshgrid(np.arange(width, dtype=np.float64), np.arange(height, dtype=np.float64))
+    pixels = np.stack((xs, ys), axis=-1).reshape(-1, 2)
+    if undistorter is not None:
+        pixels = undistorter.undistort_points(pixels)
+    return image_to_world(H, pixels).reshape(height, width, 2).astype(np.float32)
+
+
+def chessboard_homography(gray, pattern, square_size, origin=(0.0, 0.0)):
+    """
+    Homography from a board printed with chess.py lying flat on the track, seen in an
+    undistorted frame. pattern: inner corners (columns, rows) like CameraCalibration,
+    square_size in metres. The first detected corner is `origin` on the track plane and
+    the board rows / columns are its axes. Returns (H, rms error in metres).
+    """
+    found, corners = cv2.findChessboardCorners(gray, pattern, None)
+    if not found:
+        raise ValueError(f"No {pattern[0]}x{pattern[1]} chessboard in the image")
+    criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 30, 0.001)
+    corners = cv2.cornerSubPix(gray, corners, (11, 11), (-1, -1), criteria).reshape(-1, 2)
+    world = np.mgrid[0:pattern[0], 0:pattern[1]].T.reshape(-1, 2) * square_size + np.asarray(origin)
+    H, _ = cv2.findHomography(corners, world)
+    return H, plane_error(H, corners, world)
+
+
+def tag_homography(results, positions):
+    """
+    Homography from reference AprilTags at known track positions: positions maps tag ID
+    -> (x, y) metres of the tag center. Needs four of them in view, more are fitted with
+    RANSAC. Returns (H, rms error in metres, IDs used).
+    """
+    used = [r for r in results if r.tag_id in positions]
+    if len(used) < 4:
+        raise ValueError(f"Need at least 4 reference tags in view, found {len(used)}")
+    image = np.array([r.center for r in used], dtype=np.float64)
+    world = np.array([positions[r.tag_id] for r in used], dtype=np.float64)
+    H, _ = cv2.findHomography(image, world, cv2.RANSAC if len(used) > 4 else 0, 0.01)
+    if H is None:
+        raise ValueError("Reference tags are degenerate (collinear?)")
+    return H, plane_error(H, image, world), [r.tag_id for r in used]
+
+
+class TrackPlane:
+    """
+    Converts the positions and headings of a whole frame of detections to the track
+    plane: metres and radians, in the frame the homography was calibrated in.
+
+    Undistorted pixels (frame or point undistortion) go through one
+    cv2.perspectiveTransform call. Raw pixels (--undistort none) are looked up in the
+    bundle's world_lut(), which already contains the lens correction: one cv2.remap
+    call samples it bilinearly at every point (1/32 pixel steps, a fraction of a
+    millimetre on the track) and, the table being memory-mapped, only the pages under
+    the cars are ever read. Without a table, or outside the frame, raw points are
+    undistorted first.
+
+    A heading is converted by mapping a second point `heading_step` pixels ahead of the
+    position, so it stays correct under perspective, lens distortion and with a
+    mirrored track frame.
+    """
+
+    def __init__(self, homography, lut=None, undistorter=None, heading_step=16.0):
+        self.homography = np.asarray(homography, dtype=np.float64)
+        self.lut = lut
+        self.undistorter = undistorter
+        self.heading_step = heading_step
+
+    @classmethod
+    def from_bundle(cls, bundle, undistorter=None):
+        if bundle.homography is None:
+            raise ValueError(f"{bundle.describe()}: no track homography, calibrate one with track_plane.py")
+        return cls(bundle.homography, bundle.world_lut, undistorter or bundle.undistorter())
+
+    def to_world(self, points, raw=False):
+        """(N, 2) pixels -> (N, 2) metres. raw: points are on the distorted camera frame."""
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        if not raw or len(points) == 0:
+            return image_to_world(self.homography, points)
+        if self.lut is None:
+            return image_to_world(self.homography, self.undistorter.undistort_points(points))
+
+        # The points are the remap table of a 1 x N "image" sampled from the lookup table
+        world = cv2.remap(self.lut, points.astype(np.float32).reshape(1, -1, 2), None,
+                          cv2.INTER_LINEAR).reshape(-1, 2).astype(np.float64)
+
+        height, width = self.lut.shape[:2]
+        x, y = points[:, 0], points[:, 1]
+        outside = (x < 0) | (y < 0) | (x > width - 1) | (y > height - 1)
+        if outside.any():
+            world[outside] = image_to_world(self.homography, self.undistorter.undistort_points(points[outside]))
+        return world
+
+    def poses(self, points, headings, raw=False):
+        """
+        Positions (N, 2) in pixels and headings in degrees (image atan2 convention)
+        -> (N, 3) [x, y, heading] in metres and radians (0 to 2 pi).
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        angles = np.radians(np.asarray(headings, dtype=np.float64))
+        ahead = points + self.heading_step * np.column_stack((np.cos(angles), np.sin(angles)))
+        world = self.to_world(np.concatenate((points, ahead)), raw)
+        n = len(points)
+        delta = world[n:] - world[:n]
+        heading = np.arctan2(delta[:, 1], delta[:, 0]) % (2 * np.pi)
+        return np.column_stack((world[:n], heading))
+
+
+def main():
+    # Imported here, only the command line needs them
+    from calibration_bundle import DEFAULT_BUNDLE, CalibrationBundle
+    from frame_sources import open_source, parse_size
+
+    parser = argparse.ArgumentParser(description="Calibrate the image -> track plane homography of a calibration bundle.")
+    parser.add_argument('method', choices=['chessboard', 'tags'], help='Reference: a chess.py board or AprilTags at known positions')
+    parser.add_argument('image', help='Image of the reference on the track, or a frame source (e.g. camera:1)')
+    parser.add_argument('--bundle', default=DEFAULT_BUNDLE, help='Calibration bundle to update')
+    parser.add_argument('--pattern', type=parse_size, default=(8, 5), metavar='CxR', help='Inner chessboard corners')
+    parser.add_argument('--square-size', type=float, default=0.037, help='Chessboard square in metres (chess.py takes mm)')
+    parser.add_argument('--origin', type=lambda s: tuple(float(v) for v in s.split(',')), default=(0.0, 0.0), metavar='X,Y',
+                        help='Track position of the first chessboard corner in metres')
+    parser.add_argument('--positions', help='JSON {"tag id": [x, y], ...} of the reference tag centers in metres')
+    parser.add_argument('--lut', action='store_true', help='Also store the dense pixel -> track plane lookup table')
+    args = parser.parse_args()
+    if args.method == 'tags' and not args.positions:
+        parser.error("tags needs --positions")
+
+    bundle = CalibrationBundle.load(args.bundle)
+    if os.path.isfile(args.image):
+        img = cv2.imread(args.image)
+    else:
+        source = open_source(args.image)
+        _, img = source.read()
+        source.release()
+    if img is None:
+        raise SystemExit(f"Cannot read {args.image}")
+
+    # The homography maps undistorted pixels, like every tracker publishes
+    undistorter = bundle.undistorter()
+    undistorter.check_size(img.shape[1::-1])
+    gray = undistorter.undistort_gray(img)
+
+    if args.method == 'chessboard':
+        H, error = chessboard_homography(gray, args.pattern, args.square_size, args.origin)
+        print(f"Chessboard {args.pattern[0]}x{args.pattern[1]}: RMS error {error * 1000:.2f} mm")
+    else:
+        from pupil_apriltags import Detector
+        with open(args.positions) as f:
+            positions = {int(k): v for k, v in json.load(f).items()}
+        H, error, used = tag_homography(Detector(families='tag36h11').detect(gray), positions)
+        print(f"Tags {used}: RMS error {error * 1000:.2f} mm")
+
+    bundle.homography = H
+    bundle.world_lut = world_lut(H, bundle.resolution, undistorter) if args.lut else None
+    bundle.save(args.bundle)
+    print(f"Wrote {bundle.describe()}")
+
+
+if __name__ == "__main__":
+    main()
+
+
+# Example
+# python chess.py -o chessboard_a4.svg --rows 8 --columns 5 --square_size 37   (print it, lay it on the track)
+# python track_plane.py chessboard board_on_track.png --bundle calibration --pattern 4x7 --square-size 0.037 --lut
+# python AprilTag_with_EKF.py --metric --undistort none      (metres and radians, lens correction from the table)
@@ -0,0 +1,111 @@
+import argparse
+import glob
+import os
+import time
+import cv2
+import numpy as np
+from pupil_apriltags import Detector
+from calibration_bundle import load_calibration
+
+
+def load_frames(path, max_frames):
+    # Recorded frames from an image folder (e.g. capturing_imgs.py output) or a video file
+    frames = []
+    if os.path.isdir(path):
+        files = []
+        for ext in ['*.jpg', '*.png', '*.jpeg', '*.tif']:
+            files.extend(glob.glob(os.path.join(path, ext)))
+        for fname in sorted(files)[:max_frames]:
+            img = cv2.imread(fname)
+            if img is not None:
+                frames.append(img)
+    else:
+        cap = cv2.VideoCapture(path)
+        while len(frames) < max_frames:
+            success, img = cap.read()
+            if not success:
+                break
+            frames.append(img)
+        cap.release()
+    return frames
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare full-frame and corner-point undistortion on recorded frames.")
+    parser.add_argument('input', help='Folder of images or a video file')
+    parser.add_argument('--frames', type=int, default=300, help='Maximum number of frames to use')
+    parser.add_argument('--calibration', metavar='DIR',
+                        help='Calibration bundle of the camera (default: ./calibration if present, else built-in)')
+    args = parser.parse_args()
+
+    frames = load_frames(args.input, args.frames)
+    if not frames:
+        print(f"No frames found in {args.input}")
+        return
+
+    # Same calibration and detector settings as the trackers
+    detector = Detector(families='tag36h11', nthreads=5, quad_decimate=1.0, quad_sigma=0.5,
+                        refine_edges=1, decode_sharpening=0.0, debug=0)
+    undistorter = load_calibration(args.calibration).undistorter()
+    size = undistorter.check_size(frames[0].shape[1::-1])
+    undistorter.maps(size)  # build the maps outside the timed loop
+
+    frame_time = 0.0
+    points_time = 0.0
+    frame_correction = 0.0
+    points_correction = 0.0
+    center_errors = []
+    corner_errors = []
+    tags_frame = 0
+    tags_points = 0
+
+    for img in frames:
+        # Full-frame path: remap the gray image, then detect
+        start = time.perf_counter()
+        gray = undistorter.undistort_gray(img)
+        mid = time.perf_counter()
+        results_frame = detector.detect(gray)
+        frame_time += time.perf_counter() - start
+        frame_correction += mid - start
+
+        # Sparse path: detect on the raw frame, then undistort the tag points
+        start = time.perf_counter()
+        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        results_points = detector.detect(gray)
+        mid = time.perf_counter()
+        undistorter.undistort_detections(results_points)
+        points_time += time.perf_counter() - start
+        points_correction += time.perf_counter() - mid
+
+        tags_frame += len(results_frame)
+        tags_points += len(results_points)
+
+        # Compare the tags both paths found
+        by_id = {r.tag_id: r for r in results_frame}
+        for r in results_points:
+            ref = by_id.get(r.tag_id)
+            if ref is None:
+                continue
+            center_errors.append(np.linalg.norm(r.center - ref.center))
+            corner_errors.extend(np.linalg.norm(r.corners - ref.corners, axis=1))
+
+    n = len(frames)
+    print(f"Frames: {n}  ({frames[0].shape[1]}x{frames[0].shape[0]})")
+    print(f"{'':<8} {'total [ms/frame]':>17} {'correction [ms/frame]':>22} {'tags':>6}")
+    print(f"{'frame':<8} {frame_time / n * 1000:>17.3f} {frame_correction / n * 1000:>22.3f} {tags_frame:>6}")
+    print(f"{'points':<8} {points_time / n * 1000:>17.3f} {points_correction / n * 1000:>22.3f} {tags_points:>6}")
+    if center_errors:
+        center_errors = np.array(center_errors)
+        corner_errors = np.array(corner_errors)
+        print(f"Center difference [px]: mean {center_errors.mean():.3f}  p95 {np.percentile(center_errors, 95):.3f}  max {center_errors.max():.3f}")
+        print(f"Corner difference [px]: mean {corner_errors.mean():.3f}  p95 {np.percentile(corner_errors, 95):.3f}  max {corner_errors.max():.3f}")
+    else:
+        print("No tag was found by both paths, accuracy not compared.")
+
+
+if __name__ == "__main__":
+    main()
+
+
+# Example
+# python undistort_benchmark.py D:\Chess_images --frames 200
@@ -0,0 +1,139 @@
+import hashlib
+import os
+import cv2
+import numpy as np
+
+# Maps shared by every Undistorter in the process, keyed by (calibration, resolution)
+_map_cache = {}
+
+
+def maps_path(calibration_file, size):
+    """File the remap tables for `size` are persisted to, next to the calibration .npz."""
+    stem, _ = os.path.splitext(calibration_file)
+    return f"{stem}_maps_{size[0]}x{size[1]}.npz"
+
+
+class Undistorter:
+    """
+    Replaces per-frame cv2.undistort with a fixed-point cv2.remap.
+    The undistortion maps are built once per (calibration, resolution) pair with
+    initUndistortRectifyMap, cached in memory and optionally persisted next to
+    the calibration file written by CameraCalibration.save_calibration, or come
+    precomputed from a calibration bundle (calibration_bundle.py).
+
+    new_camera_matrix: camera matrix of the undistorted image (default: the camera
+    matrix itself, like cv2.undistort). resolution: (width, height) the calibration
+    is valid for, None for any.
+    """
+
+    def __init__(self, camera_matrix, dist_coeffs, calibration_file=None, new_camera_matrix=None, resolution=None):
+        self.camera_matrix = np.asarray(camera_matrix, dtype=np.float64)
+        self.dist_coeffs = np.asarray(dist_coeffs, dtype=np.float64)
+        self.new_camera_matrix = self.camera_matrix if new_camera_matrix is None else np.asarray(new_camera_matrix, dtype=np.float64)
+        self.calibration_file = calibration_file
+        self.resolution = tuple(resolution) if resolution is not None else None
+        self.key = (self.camera_matrix.tobytes(), self.dist_coeffs.tobytes(), self.new_camera_matrix.tobytes())
+        # Stored with persisted maps, so maps of an older calibration are never reused
+        self.fingerprint = hashlib.sha1(b''.join(self.key)).hexdigest()
+
+    @classmethod
+    def from_calibration_file(cls, calibration_file='camera_calibration.npz'):
+        calibration = np.load(calibration_file)
+        return cls(calibration['camera_matrix'], calibration['dist_coefficients'], calibration_file)
+
+    def check_size(self, size):
+        """Raise if frames of size (width, height) do not match the calibrated resolution."""
+        size = (int(size[0]), int(size[1]))
+        if self.resolution is not None and size != self.resolution:
+            raise ValueError(f"Frames are {size[0]}x{size[1]} but the camera was calibrated at "
+                             f"{self.resolution[0]}x{self.resolution[1]}, use a calibration of this resolution")
+        return size
+
+    def set_maps(self, size, maps):
+        """Use precomputed remap tables (e.g. memory-mapped from a bundle) for `size`."""
+        _map_cache[self.key + (self.check_size(size),)] = maps
+
+    def maps(self, size):
+        """Return the (map1, map2) remap tables for an image of size (width, height)."""
+        size = (int(size[0]), int(size[1]))
+        key = self.key + (size,)
+        maps = _map_cache.get(key)
+        if maps is not None:
+            return maps
+        self.check_size(size)
+
+        path = maps_path(self.calibration_file, size) if self.calibration_file else None
+        maps = self._load_maps(path) if path and os.path.exists(path) else None
+        if maps is None:
+            # Same output as cv2.undistort when the new camera matrix is the camera matrix
+            maps = cv2.initUndistortRectifyMap(self.camera_matrix, self.dist_coeffs, None,
+                                               self.new_camera_matrix, size, cv2.CV_16SC2)
+            if path:
+                self.save_maps(size, maps)
+
+        _map_cache[key] = maps
+        return maps
+
+    def _load_maps(self, path):
+        """Persisted maps, or None when they were built for another calibration (rebuilt then)."""
+        with np.load(path) as stored:
+            if 'calibration' not in stored or str(stored['calibration']) != self.fingerprint:
+                print(f"{path} was built for another calibration, rebuilding it")
+                return None
+            return stored['map1'], stored['map2']
+
+    def save_maps(self, size, maps=None):
+        """Persist the remap tables for `size` next to the calibration file."""
+        if self.calibration_file is None:
+            raise ValueError("No calibration file to store the maps next to.")
+        map1, map2 = maps if maps is not None else self.maps(size)
+        np.savez(maps_path(self.calibration_file, size), map1=map1, map2=map2, calibration=self.fingerprint)
+
+    def undistort(self, img):
+        """Undistort a full (colour or gray) frame."""
+        map1, map2 = self.maps(img.shape[1::-1])
+        return cv2.remap(img, map1, map2, cv2.INTER_LINEAR)
+
+    def undistort_gray(self, img):
+        """Convert to gray first and undistort only the single channel the detector uses."""
+        if img.ndim == 3:
+            img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        return self.undistort(img)
+
+    def undistort_points(self, points):
+        """Undistort an (N, 2) array of pixel coordinates, returned in pixels of the undistorted image."""
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 1, 2)
+        if len(points) == 0:
+            return points.reshape(-1, 2)
+        return cv2.undistortPoints(points, self.camera_matrix, self.dist_coeffs,
+                                   P=self.new_camera_matrix).reshape(-1, 2)
+
+    def distort_points(self, points):
+        """Inverse of undistort_points: map undistorted pixel coordinates back onto the raw frame."""
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        if len(points) == 0:
+            return points
+        # Back to normalized camera coordinates, then project through the lens model
+        fx, fy = self.new_camera_matrix[0, 0], self.new_camera_matrix[1, 1]
+        cx, cy = self.new_camera_matrix[0, 2], self.new_camera_matrix[1, 2]
+        rays = np.column_stack(((points[:, 0] - cx) / fx, (points[:, 1] - cy) / fy, np.ones(len(points))))
+        projected, _ = cv2.projectPoints(rays, np.zeros(3), np.zeros(3), self.camera_matrix, self.dist_coeffs)
+        return projected.reshape(-1, 2)
+
+    def undistort_detections(self, results):
+        """
+        Sparse correction: move the center and corners of every AprilTag Detection
+        (found on the raw frame) into undistorted coordinates, in place.
+        All points of the frame go through one cv2.undistortPoints call.
+        """
+        if not results:
+            return results
+        points = np.empty((len(results), 5, 2))
+        for i, r in enumerate(results):
+            points[i, 0] = r.center
+            points[i, 1:] = r.corners
+        points = self.undistort_points(points.reshape(-1, 2)).reshape(-1, 5, 2)
+        for r, p in zip(results, points):
+            r.center = p[0]
+            r.corners = p[1:]
+        return results
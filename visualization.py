@@ -0,0 +1,68 @@
+import threading
+import time
+import cv2
+
+
+class Visualizer:
+    """
+    Shows the tracker output on its own thread at a reduced rate.
+
+    The tracking loop only hands over a reference to the latest frame and its
+    detections with submit(); drawing, cv2.imshow and cv2.waitKey all happen on
+    the display thread, at most `max_fps` times per second, so the GUI can never
+    throttle tracking. Frames submitted in between are simply skipped.
+
+    draw_fn(img, *detections) must return the image to show.
+    With `metrics`, drawing plus imshow is recorded as the 'display' stage.
+    """
+
+    def __init__(self, draw_fn, window_name, max_fps=15, metrics=None):
+        self.draw_fn = draw_fn
+        self.metrics = metrics
+        self.window_name = window_name
+        self.period = 1.0 / max_fps if max_fps else 0.0
+        self.latest = None
+        self.lock = threading.Lock()
+        self.running = threading.Event()
+        self.quit_requested = False  # set when 'q' is pressed in the window
+        self.shown = 0
+        self.thread = None
+
+    def start(self):
+        self.running.set()
+        self.thread = threading.Thread(target=self._loop, name='display', daemon=True)
+        self.thread.start()
+        return self
+
+    def submit(self, img, *detections):
+        # Snapshot of the latest frame: no copy, the tracker does not touch it afterwards
+        with self.lock:
+            self.latest = (img, detections)
+
+    def _loop(self):
+        while self.running.is_set():
+            start = time.perf_counter()
+            with self.lock:
+                latest, self.latest = self.latest, None
+
+            if latest is not None:
+                img, detections = latest
+                cv2.imshow(self.window_name, self.draw_fn(img, *detections))
+                self.shown += 1
+                if self.metrics is not None:
+                    self.metrics.add('display', time.perf_counter() - start)
+
+            if cv2.waitKey(1) & 0xFF == ord('q'):
+                self.quit_requested = True
+
+            remaining = self.period - (time.perf_counter() - start)
+            if remaining > 0:
+                time.sleep(remaining)
+
+        if self.shown:
+            cv2.destroyWindow(self.window_name)
+
+    def stop(self):
+        self.running.clear()
+        if self.thread is not None:
+            self.thread.join(timeout=1.0)